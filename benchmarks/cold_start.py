@@ -0,0 +1,123 @@
+"""
+Soğuk başlangıç ölçümü: save modülünün import süresi ve worker açılışından ilk yanıta kadar geçen süre.
+
+Her tekrar yeni bir Python süreci başlatır. Import süresi "import save" için
+ölçülür; açılış ise uvicorn --factory save:create_app sürecinin başlatılmasından
+ilk başarılı HTTP yanıtına kadar geçen süredir. Sunucunun /metrics üzerinden
+bildirdiği startup_import_seconds ve startup_warmup_seconds da raporlanır.
+Medyan değerlerden biri bütçeyi aşarsa 1 ile çıkar.
+
+Kullanım:
+    python benchmarks/cold_start.py
+    python benchmarks/cold_start.py --repeats 10 --max-import-ms 250 --max-boot-ms 2000
+"""
+import argparse
+import os
+import re
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORT_PROBE = ("import time; started = time.perf_counter(); import save; "
+                "print(time.perf_counter() - started)")
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def fetch(url: str) -> str:
+    with urllib.request.urlopen(url, timeout=5) as response:
+        return response.read().decode()
+
+
+def parse_gauge(text: str, name: str) -> float:
+    match = re.search(rf'^{name} (\S+)$', text, re.M)
+    return float(match.group(1)) if match else 0.0
+
+
+def measure_import(env: dict) -> float:
+    output = subprocess.run([sys.executable, '-c', IMPORT_PROBE], cwd=REPO_DIR, env=env,
+                            capture_output=True, text=True, check=True).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def measure_boot(env: dict, workdir: str, timeout: float):
+    """Sunucuyu başlatır; (ilk yanıta kadar geçen süre, ilk isteğin süresi, sunucu metrikleri) döner"""
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', '--factory', 'save:create_app', '--app-dir', REPO_DIR,
+         '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning', '--no-access-log'],
+        cwd=workdir, env=env)
+    try:
+        while True:
+            if time.perf_counter() - started > timeout:
+                raise RuntimeError(f"server did not answer within {timeout}s")
+            request_started = time.perf_counter()
+            try:
+                fetch(base_url + '/select-language')
+            except OSError:
+                time.sleep(0.01)
+                continue
+            answered = time.perf_counter()
+            return answered - started, answered - request_started, fetch(base_url + '/metrics')
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--max-import-ms', type=float, default=250.0, help='İzin verilen medyan import süresi')
+    parser.add_argument('--max-boot-ms', type=float, default=2000.0, help='İzin verilen medyan açılış+ilk yanıt süresi')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    args = parser.parse_args()
+
+    env = dict(os.environ, OPENAI_API_KEY=os.environ.get('OPENAI_API_KEY', 'benchmark'), REALTIME_PREWARM='false')
+    imports, boots, first_requests, server_imports, warmups = [], [], [], [], []
+    with tempfile.TemporaryDirectory(prefix="cold-start-") as workdir:
+        env.update(TRANSCRIPT_DIR=os.path.join(workdir, 'transcripts'), LOG_FILE=os.path.join(workdir, 'relay.log'))
+        for _ in range(args.repeats):
+            imports.append(measure_import(env))
+            boot, first_request, metrics_text = measure_boot(env, workdir, args.timeout)
+            boots.append(boot)
+            first_requests.append(first_request)
+            server_imports.append(parse_gauge(metrics_text, 'startup_import_seconds'))
+            warmups.append(parse_gauge(metrics_text, 'startup_warmup_seconds'))
+
+    results = [
+        ("import save", imports, args.max_import_ms),
+        ("boot to first response", boots, args.max_boot_ms),
+        ("first request", first_requests, None),
+        ("server import (metric)", server_imports, None),
+        ("warmup hook (metric)", warmups, None),
+    ]
+    over_budget = []
+    for name, values, budget in results:
+        median_ms = statistics.median(values) * 1000
+        status = ''
+        if budget is not None:
+            status = 'ok' if median_ms <= budget else 'OVER BUDGET'
+            if status != 'ok':
+                over_budget.append(name)
+            status = f'  budget {budget:.0f} ms  {status}'
+        print(f"{name:<24} median={median_ms:8.1f} ms  min={min(values) * 1000:8.1f} ms  "
+              f"max={max(values) * 1000:8.1f} ms{status}")
+    if over_budget:
+        print(f"\nBütçeyi aşan ölçümler: {', '.join(over_budget)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,326 @@
+"""
+Frame/olay başına çalışan kod yolları için mikro benchmark'lar ve gerileme kapısı.
+
+Her benchmark saniyedeki işlem sayısını (ops/s) ölçer. Sonuçlar
+benchmarks/baselines.json'daki değerlerle karşılaştırılır; bir benchmark
+--threshold oranından fazla yavaşlamışsa betik 1 ile çıkar. Farklı
+makinelerde ve gürültülü ortamlarda karşılaştırılabilir olması için her
+benchmark, save.py'den bağımsız sabit bir iş yüküyle (calibration)
+dönüşümlü ölçülür ve bu iş yüküne göre göreli verimi karşılaştırılır.
+Göreli verim, her turda arka arkaya yapılan iki ölçümün oranının turlar
+üzerindeki medyanıdır; tek bir gürültülü tur sonucu değiştirmez.
+
+Kullanım:
+    python benchmarks/hot_paths.py                    # ölç ve baseline ile karşılaştır
+    python benchmarks/hot_paths.py --save-baseline    # mevcut sonuçları baseline olarak kaydet
+    python benchmarks/hot_paths.py -k twilio -k mark  # yalnızca adı eşleşenler
+"""
+import argparse
+import base64
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+import save
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baselines.json')
+BENCHMARKS = {}
+
+COMPACT = (',', ':')  # Twilio ve OpenAI mesajları kompakt JSON olarak gelir
+STREAM_SID = 'MZ' + '0' * 32
+FRAME_PAYLOAD = base64.b64encode(os.urandom(160)).decode('ascii')  # 20 ms μ-law
+DELTA_PAYLOAD = base64.b64encode(os.urandom(4800)).decode('ascii')  # 600 ms μ-law
+TWILIO_MEDIA = json.dumps({
+    "event": "media", "sequenceNumber": "42", "streamSid": STREAM_SID,
+    "media": {"track": "inbound", "chunk": "41", "timestamp": "820", "payload": FRAME_PAYLOAD},
+}, separators=COMPACT)
+TWILIO_MARK = json.dumps({"event": "mark", "sequenceNumber": "43", "streamSid": STREAM_SID, "mark": {"name": "m1"}},
+                         separators=COMPACT)
+OPENAI_DELTA = json.dumps({
+    "type": "response.audio.delta", "event_id": "event_1", "response_id": "resp_1", "item_id": "item_1",
+    "output_index": 0, "content_index": 0, "delta": DELTA_PAYLOAD,
+}, separators=COMPACT)
+USAGE = {
+    "total_tokens": 420, "input_tokens": 300, "output_tokens": 120,
+    "input_token_details": {"text_tokens": 200, "audio_tokens": 100, "cached_tokens": 64,
+                            "cached_tokens_details": {"text_tokens": 64, "audio_tokens": 0}},
+    "output_token_details": {"text_tokens": 20, "audio_tokens": 100},
+}
+
+
+class NullWebSocket:
+    """Gönderilen mesajları atan websocket; relay fonksiyonları gerçek kodla ölçülür"""
+    async def send(self, message):
+        pass
+
+    async def send_text(self, message):
+        pass
+
+    async def send_json(self, message):
+        pass
+
+
+def drive(coroutine):
+    """Askıya alınmayan bir coroutine'i event loop olmadan çalıştırır"""
+    try:
+        coroutine.send(None)
+    except StopIteration as stop:
+        return stop.value
+    raise RuntimeError("benchmark coroutine'i askıya alındı")
+
+
+def benchmark(name: str):
+    def register(factory):
+        BENCHMARKS[name] = factory
+        return factory
+    return register
+
+
+@benchmark('calibration')
+def bench_calibration():
+    # save.py'den bağımsız, sabit karışık iş yükü: stdlib json + base64 + dict gezinme
+    document = json.dumps({"event": "media", "media": {"payload": FRAME_PAYLOAD}, "values": list(range(32))})
+    data = {str(i): i for i in range(64)}
+
+    def run():
+        parsed = json.loads(document)
+        base64.b64decode(parsed['media']['payload'])
+        total = 0
+        for key, value in data.items():
+            if key:
+                total += value
+        return total
+    return run
+
+
+@benchmark('twilio_media_parse_dispatch')
+def bench_twilio_media():
+    # receive_from_twilio: EventDispatcher tablosu + save.relay_inbound_audio
+    upstream = NullWebSocket()
+    dispatcher = save.EventDispatcher('event')
+
+    async def on_media(timestamp, payload):
+        int(timestamp)
+        await save.relay_inbound_audio(upstream, payload)
+
+    async def on_other(data):
+        return None
+
+    async def on_media_event(data):
+        return await on_media(data['media']['timestamp'], data['media']['payload'])
+
+    if save.TWILIO_MEDIA_FAST_PATH:
+        dispatcher.on_fast('media', ('timestamp', 'payload'), on_media)
+    dispatcher.on('media', on_media_event)
+    dispatcher.on(('start', 'stop', 'mark'), on_other)
+
+    def run():
+        return drive(dispatcher.dispatch(TWILIO_MEDIA))
+    return run
+
+
+@benchmark('twilio_media_batched')
+def bench_twilio_media_batched():
+    batcher = save.AudioBatcher(100)
+
+    def run():
+        return batcher.add(FRAME_PAYLOAD)
+    return run
+
+
+@benchmark('openai_delta_parse_dispatch')
+def bench_openai_delta():
+    # send_to_twilio: EventDispatcher hızlı yolu + save.relay_outbound_audio
+    media_prefix, _ = save.build_twilio_templates(STREAM_SID)
+    twilio = NullWebSocket()
+    dispatcher = save.EventDispatcher('type')
+
+    async def on_delta(item_id, delta):
+        await save.relay_outbound_audio(twilio, STREAM_SID, media_prefix, delta)
+
+    async def on_other(event):
+        return None
+
+    dispatcher.on_fast('response.audio.delta', ('item_id', 'delta'), on_delta)
+    dispatcher.on(save.RECORDED_EVENT_TYPES, on_other)
+    dispatcher.on(save.LOG_EVENT_TYPES, on_other)
+
+    def run():
+        return drive(dispatcher.dispatch(OPENAI_DELTA))
+    return run
+
+
+@benchmark('openai_event_full_parse_dispatch')
+def bench_openai_event():
+    # Hızlı yolu olmayan olaylar tam ayrıştırılıp tablo üzerinden yönlendirilir
+    dispatcher = save.EventDispatcher('type')
+    message = json.dumps({"type": "response.audio.done", "event_id": "event_2", "response_id": "resp_1",
+                          "item_id": "item_1", "output_index": 0, "content_index": 0}, separators=COMPACT)
+
+    async def on_other(event):
+        return None
+
+    dispatcher.on(save.RECORDED_EVENT_TYPES, on_other)
+    dispatcher.on('response.audio.done', on_other)
+
+    def run():
+        return drive(dispatcher.dispatch(message))
+    return run
+
+
+@benchmark('audio_delta_base64_roundtrip')
+def bench_base64_roundtrip():
+    # FAST_RELAY kapalıyken kullanılan eski yol
+    def run():
+        return base64.b64encode(base64.b64decode(DELTA_PAYLOAD)).decode('utf-8')
+    return run
+
+
+@benchmark('audio_delta_duration')
+def bench_audio_duration():
+    def run():
+        return save.ulaw_ms_from_base64(DELTA_PAYLOAD)
+    return run
+
+
+@benchmark('mark_send_and_ack')
+def bench_marks():
+    # send_mark metni + PlaybackTracker kuyruğunda mark ekleme ve geri bildirimi
+    playback = save.PlaybackTracker(save.MARK_INTERVAL_MS)
+    _, mark_prefix = save.build_twilio_templates(STREAM_SID)
+    suffix = save.TWILIO_MARK_SUFFIX
+    loads = save.json_loads
+
+    def run():
+        playback.start_item()
+        mark_name = playback.add_audio(DELTA_PAYLOAD) or playback.next_mark()
+        mark_text = mark_prefix + mark_name + suffix
+        data = loads(TWILIO_MARK)
+        playback.on_mark(mark_name)
+        return mark_text, data
+    return run
+
+
+@benchmark('session_add_usage')
+def bench_add_usage():
+    session = save.Session(STREAM_SID)
+
+    def run():
+        session.is_active = True
+        return session.add_usage(USAGE)
+    return run
+
+
+@benchmark('session_update_cached')
+def bench_session_update_cached():
+    # initialize_session'ın gönderdiği hazır payload
+    save.session_payloads.get('tr', save.DEFAULT_VOICE, save.TURN_DETECTION_PROFILE)
+
+    def run():
+        return save.session_payloads.get('tr', save.DEFAULT_VOICE, save.TURN_DETECTION_PROFILE)
+    return run
+
+
+@benchmark('session_update_build')
+def bench_session_update_build():
+    def run():
+        return save.json_dumps(save.build_session_update('tr', save.DEFAULT_VOICE, save.TURN_DETECTION_PROFILE))
+    return run
+
+
+def find_iterations(run, min_time: float) -> int:
+    """Bir turun en az min_time sürmesi için gereken tekrar sayısını bulur"""
+    iterations = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(iterations):
+            run()
+        if time.perf_counter() - start >= min_time:
+            return iterations
+        iterations *= 2
+
+
+def time_round(run, iterations: int) -> float:
+    start = time.perf_counter()
+    for _ in range(iterations):
+        run()
+    return iterations / (time.perf_counter() - start)
+
+
+def measure(factory, calibration, min_time: float, repeats: int):
+    """
+    Benchmark'ı calibration iş yüküyle dönüşümlü ölçer
+    Returns:
+        tuple: (medyan ops/s, turların calibration'a göre göreli veriminin medyanı)
+    """
+    run = factory()
+    iterations = find_iterations(run, min_time)
+    calibration_iterations = find_iterations(calibration, min_time)
+    rates, relatives = [], []
+    for _ in range(repeats):
+        calibration_rate = time_round(calibration, calibration_iterations)
+        rate = time_round(run, iterations)
+        rates.append(rate)
+        relatives.append(rate / calibration_rate)
+    return statistics.median(rates), statistics.median(relatives)
+
+
+def load_baselines() -> dict:
+    if not os.path.exists(BASELINE_FILE):
+        return {}
+    with open(BASELINE_FILE) as f:
+        return json.load(f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-k', action='append', default=[], help='Yalnızca adında bu metin geçenleri çalıştır')
+    parser.add_argument('--min-time', type=float, default=0.1, help='Tek ölçümün en kısa süresi (sn)')
+    parser.add_argument('--repeats', type=int, default=7)
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Baseline\'a göre izin verilen en fazla yavaşlama oranı')
+    parser.add_argument('--save-baseline', action='store_true')
+    args = parser.parse_args()
+
+    names = [name for name in BENCHMARKS
+             if name != 'calibration' and (not args.k or any(k in name for k in args.k))]
+    calibration = bench_calibration()
+    results = {name: measure(BENCHMARKS[name], calibration, args.min_time, args.repeats) for name in names}
+
+    baselines = load_baselines()
+    if args.save_baseline:
+        for name, (ops, relative) in results.items():
+            baselines[name] = {"ops_per_second": round(ops), "relative": round(relative, 4)}
+            print(f"{name:<32} {ops:>14,.0f} ops/s  relative {relative:.4f} (saved)")
+        with open(BASELINE_FILE, 'w') as f:
+            json.dump(baselines, f, indent=2, sort_keys=True)
+            f.write('\n')
+        return 0
+
+    # Karşılaştırma mutlak ops/s ile değil calibration'a göre göreli verimle yapılır;
+    # böylece makine farkı ve anlık gürültü her iki ölçümü birlikte etkiler
+    print(f"{'benchmark':<32} {'ops/s':>14} {'relative':>10} {'baseline':>10} {'ratio':>7}")
+    regressions = []
+    for name, (ops, relative) in results.items():
+        baseline = baselines.get(name)
+        if not baseline:
+            print(f"{name:<32} {ops:>14,.0f} {relative:>10.4f} {'-':>10} {'-':>7}  no baseline")
+            continue
+        ratio = relative / baseline['relative']
+        status = 'REGRESSION' if ratio < 1 - args.threshold else 'ok'
+        if status != 'ok':
+            regressions.append(name)
+        print(f"{name:<32} {ops:>14,.0f} {relative:>10.4f} {baseline['relative']:>10.4f} {ratio:>7.2f}  {status}")
+    if regressions:
+        print(f"\n{len(regressions)} benchmark {args.threshold:.0%} eşiğinden fazla yavaşladı: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
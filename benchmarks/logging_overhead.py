@@ -0,0 +1,85 @@
+"""
+Ayrıntılı loglama açıkken relay gecikmesinin gerilemediğini ölçer.
+
+Her simüle edilen arama, gerçek relay yolundaki gibi OpenAI ses delta'larını
+ayrıştırıp Twilio mesajına çevirir ve her olay için büyük bir payload loglar.
+Üç mod karşılaştırılır: loglama yok, eski print tabanlı loglama ve EventLogger.
+
+Kullanım:
+    python benchmarks/logging_overhead.py --calls 100 --duration 5 > /dev/null
+"""
+import argparse
+import asyncio
+import base64
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+import save
+
+DELTA = json.dumps({
+    "type": "response.audio.delta", "item_id": "item_1", "output_index": 0, "content_index": 0,
+    "delta": base64.b64encode(os.urandom(4800)).decode('ascii'),
+})
+RATE_LIMITS = {"type": "rate_limits.updated", "rate_limits": [
+    {"name": "tokens", "limit": 200000, "remaining": 199000, "reset_seconds": 0.3}] * 40}
+
+
+def log_print(message, payload):
+    print(f"Received event: {payload['type']}", payload)
+
+
+def log_structured(message, payload):
+    save.log(message, sample_key=payload['type'], event_type=payload['type'], payload=payload)
+
+
+def log_none(message, payload):
+    pass
+
+
+async def relay(mode, duration: float, latencies: list):
+    prefix, _ = save.build_twilio_templates("MZ" + "0" * 32)
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        message = save.json_loads(DELTA)
+        prefix + message['delta'] + save.TWILIO_MEDIA_SUFFIX
+        mode("Received event", message)
+        mode("Received event", RATE_LIMITS)
+        latencies.append(time.perf_counter() - start)
+        await asyncio.sleep(0.02)
+
+
+async def run_mode(name, mode, calls: int, duration: float, output):
+    latencies = []
+    with contextlib.redirect_stdout(output):
+        await asyncio.gather(*(relay(mode, duration, latencies) for _ in range(calls)))
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1e6
+    p99 = latencies[int(len(latencies) * 0.99)] * 1e6
+    print(f"{name:>10}: frames={len(latencies)} p50={p50:.1f}us p99={p99:.1f}us", file=sys.stderr)
+
+
+async def main(args):
+    sink = open(os.devnull, 'w') if args.devnull else io.TextIOWrapper(open(sys.stdout.fileno(), 'wb', closefd=False))
+    save.event_logger.min_level = save.LOG_LEVELS['debug']
+    save.event_logger.sample_every = {}
+    await run_mode("no-log", log_none, args.calls, args.duration, sink)
+    await run_mode("print", log_print, args.calls, args.duration, sink)
+    await run_mode("structured", log_structured, args.calls, args.duration, sink)
+    save.event_logger.close()
+    print(f"structured logger dropped={save.event_logger.dropped}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--devnull', action='store_true', help="Log çıktısını /dev/null'a yaz")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,99 @@
+"""
+Arama kaydı açıkken relay gecikmesinin gerilemediğini ölçer.
+
+Her simüle edilen arama, 20 ms'de bir gelen Twilio media çerçevesini ve OpenAI
+ses delta'sını gerçek relay yolundaki gibi ayrıştırıp mesaja çevirir. Kayıt açık
+modda aynı çerçeveler CallRecording tamponuna eklenir ve RecordingWriter
+thread'i bunları diske yazar. Kayıt kapalı ve açık modların relay süreleri ile
+event loop gecikmesi karşılaştırılır.
+
+Kullanım:
+    python benchmarks/recording_overhead.py --calls 200 --duration 5 --format wav
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+import save
+
+FRAME = json.dumps({
+    "event": "media", "streamSid": "MZ" + "0" * 32,
+    "media": {"track": "inbound", "chunk": "1", "timestamp": "0",
+              "payload": base64.b64encode(os.urandom(160)).decode('ascii')},
+})
+DELTA = json.dumps({
+    "type": "response.audio.delta", "item_id": "item_1", "output_index": 0, "content_index": 0,
+    "delta": base64.b64encode(os.urandom(160)).decode('ascii'),
+})
+
+
+async def relay(recording, duration: float, latencies: list):
+    prefix, _ = save.build_twilio_templates("MZ" + "0" * 32)
+    timestamp = 0
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        media = save.json_loads(FRAME)['media']
+        save.OPENAI_AUDIO_APPEND_PREFIX + media['payload'] + save.OPENAI_AUDIO_APPEND_SUFFIX
+        if recording is not None:
+            recording.inbound(timestamp, media['payload'])
+        delta = save.json_loads(DELTA)['delta']
+        prefix + delta + save.TWILIO_MEDIA_SUFFIX
+        if recording is not None:
+            recording.outbound(timestamp, delta)
+        latencies.append(time.perf_counter() - start)
+        timestamp += 20
+        await asyncio.sleep(0.02)
+    if recording is not None:
+        recording.close()
+
+
+async def measure_loop_lag(duration: float, lags: list):
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - start - 0.01)
+
+
+async def run_mode(name, writer, calls: int, duration: float):
+    latencies, lags = [], []
+    recordings = [writer.open(f"call-{i:05d}") if writer else None for i in range(calls)]
+    await asyncio.gather(measure_loop_lag(duration, lags),
+                         *(relay(recording, duration, latencies) for recording in recordings))
+    latencies.sort()
+    lags.sort()
+    p50 = latencies[len(latencies) // 2] * 1e6
+    p99 = latencies[int(len(latencies) * 0.99)] * 1e6
+    lag_p99 = lags[int(len(lags) * 0.99)] * 1000
+    print(f"{name:>10}: frames={len(latencies)} relay p50={p50:.1f}us p99={p99:.1f}us "
+          f"loop lag p99={lag_p99:.2f}ms")
+
+
+async def main(args):
+    directory = tempfile.mkdtemp(prefix="recordings-")
+    writer = save.RecordingWriter(directory, args.format, args.buffer_chunks, save.RECORDING_FLUSH_INTERVAL)
+    await run_mode("off", None, args.calls, args.duration)
+    await run_mode("recording", writer, args.calls, args.duration)
+    writer.close()
+    written = sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+    print(f"files={len(os.listdir(directory))} bytes={written:,} dropped chunks={save.RECORDING_DROPPED.value:.0f}")
+    shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=5)
+    parser.add_argument('--format', choices=('wav', 'raw'), default=save.RECORDING_FORMAT)
+    parser.add_argument('--buffer-chunks', type=int, default=save.RECORDING_BUFFER_CHUNKS)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,105 @@
+"""
+TranscriptStore verim ölçümü: yüzlerce eşzamanlı aramanın olay üretimini simüle eder.
+
+Önce yazıcı thread'inin kayıt kaybetmediği doğrulanır: parti boyutunun birkaç katı kayıt
+kuyruğa konur ve hepsinin diske yazıldığı kontrol edilir; eksik kayıt varsa 1 ile çıkar.
+
+Kullanım:
+    python benchmarks/transcript_store.py --calls 500 --events-per-second 20 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+import save
+
+
+async def simulate_call(store, call_sid: str, events_per_second: float, duration: float, producer_times: list):
+    interval = 1.0 / events_per_second
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        store.record(call_sid, "response.audio_transcript.done", role="assistant",
+                     text="Evet, buradayım. Sorunuzu yanıtlamaya hazırım.", media_ms=1234)
+        producer_times.append(time.perf_counter() - start)
+        await asyncio.sleep(interval)
+
+
+async def measure_loop_lag(duration: float, lags: list):
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - start - 0.01)
+
+
+def check_no_lost_records() -> bool:
+    """Parti boyutunun katlarını aşan kayıtların tamamının diske yazıldığını doğrular"""
+    directory = tempfile.mkdtemp(prefix="transcripts-")
+    count = 2 * save.TRANSCRIPT_BATCH_SIZE + save.TRANSCRIPT_BATCH_SIZE // 2
+    store = save.TranscriptStore(directory, save.TRANSCRIPT_SEGMENT_BYTES, count + 1, save.TRANSCRIPT_FLUSH_INTERVAL)
+    try:
+        # Kuyruk yazıcı başlamadan doldurulur; böylece partiler tam TRANSCRIPT_BATCH_SIZE olur
+        for i in range(count):
+            store.queue.put({'ts': time.time(), 'call_sid': 'CA-check', 'type': 'check', 'i': i})
+        store._start()
+        store.close()
+        indices = {record['i'] for record in store.lookup('CA-check')}
+    finally:
+        shutil.rmtree(directory)
+    missing = sorted(set(range(count)) - indices)
+    if missing or store.dropped:
+        print(f"lost records: {len(missing)} of {count} missing (first: {missing[:5]}), dropped={store.dropped}")
+        return False
+    print(f"no lost records: {count} enqueued, {len(indices)} on disk")
+    return True
+
+
+async def run(args):
+    directory = tempfile.mkdtemp(prefix="transcripts-")
+    store = save.TranscriptStore(directory, args.segment_bytes, args.queue_size, save.TRANSCRIPT_FLUSH_INTERVAL)
+    producer_times, lags = [], []
+    started = time.perf_counter()
+    await asyncio.gather(
+        measure_loop_lag(args.duration, lags),
+        *(simulate_call(store, f"CA{i:032d}", args.events_per_second, args.duration, producer_times)
+          for i in range(args.calls))
+    )
+    produced = len(producer_times)
+    store.close()
+    elapsed = time.perf_counter() - started
+
+    lookup_start = time.perf_counter()
+    records = store.lookup(f"CA{0:032d}")
+    lookup_elapsed = time.perf_counter() - lookup_start
+
+    producer_times.sort()
+    lags.sort()
+    print(f"calls={args.calls} events/s/call={args.events_per_second} duration={args.duration}s")
+    print(f"records produced={produced} written={store.written} dropped={store.dropped}")
+    print(f"write throughput: {store.written / elapsed:,.0f} records/s")
+    print(f"record() p50={producer_times[len(producer_times) // 2] * 1e6:.1f}us "
+          f"p99={producer_times[int(len(producer_times) * 0.99)] * 1e6:.1f}us")
+    print(f"event loop lag p50={lags[len(lags) // 2] * 1000:.2f}ms p99={lags[int(len(lags) * 0.99)] * 1000:.2f}ms")
+    print(f"lookup of one call: {len(records)} records in {lookup_elapsed * 1000:.1f}ms")
+    shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--events-per-second', type=float, default=20)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--queue-size', type=int, default=save.TRANSCRIPT_QUEUE_SIZE)
+    parser.add_argument('--segment-bytes', type=int, default=save.TRANSCRIPT_SEGMENT_BYTES)
+    args = parser.parse_args()
+    if not check_no_lost_records():
+        sys.exit(1)
+    asyncio.run(run(args))
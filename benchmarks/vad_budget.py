@@ -0,0 +1,116 @@
+"""
+Yerel VAD'ın frame başına CPU maliyetini ölçer ve bütçeyi aşarsa 1 ile çıkar.
+
+Bir frame 20 ms'lik sestir; varsayılan bütçe olan 20 µs, arama başına bir
+çekirdeğin %0.1'ine karşılık gelir. Farklı parti boyutları (LOCAL_VAD_BATCH_FRAMES)
+ve karşılaştırma için saf Python μ-law çözme + enerji hesabı ölçülür.
+
+Kullanım:
+    python benchmarks/vad_budget.py
+    python benchmarks/vad_budget.py --batches 1,3,5,10 --budget-us 20 --seconds 60
+"""
+import argparse
+import base64
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+import save
+
+FRAME_MS = 20
+
+
+def linear_to_ulaw(sample: int) -> int:
+    sign = 0x80 if sample < 0 else 0
+    sample = min(abs(sample), 32635) + 0x84
+    exponent = max(0, sample.bit_length() - 8)
+    return ~(sign | (exponent << 4) | ((sample >> (exponent + 3)) & 0x0F)) & 0xFF
+
+
+def synthesize_payloads(seconds: float):
+    """Konuşma (tonlu, genliği değişen) ve arka plan gürültüsü dönüşümlü 20 ms'lik payload'lar"""
+    rng = random.Random(7)
+    payloads = []
+    for index in range(int(seconds * 1000 / FRAME_MS)):
+        speaking = (index // 100) % 2 == 0  # 2 sn konuşma, 2 sn sessizlik
+        amplitude = 6000 * (0.5 + 0.5 * math.sin(index / 7)) if speaking else 0
+        frame = bytes(linear_to_ulaw(int(amplitude * math.sin(2 * math.pi * 220 * (index * 160 + n) / 8000)
+                                         + rng.gauss(0, 40)))
+                      for n in range(160))
+        payloads.append(base64.b64encode(frame).decode('ascii'))
+    return payloads
+
+
+def python_reference(payloads):
+    """numpy olmadan aynı istatistikleri hesaplayan saf Python sürümü (karşılaştırma için)"""
+    table = save.build_ulaw_decode_table().tolist()
+    for payload in payloads:
+        samples = [table[code] for code in base64.b64decode(payload)]
+        energy = sum(sample * sample for sample in samples) / len(samples)
+        10 * math.log10(energy + 1.0)
+        sum(1 for a, b in zip(samples, samples[1:]) if (a < 0) != (b < 0))
+
+
+def run_vad(payloads, batch_frames: int):
+    vad = save.LocalVAD(batch_frames, save.LOCAL_VAD_MARGIN_DB, save.LOCAL_VAD_MIN_DBFS, save.LOCAL_VAD_MAX_ZCR,
+                        save.LOCAL_VAD_START_MS, save.LOCAL_VAD_HANGOVER_MS)
+    events = 0
+    for payload in payloads:
+        events += len(vad.add(payload))
+    return events
+
+
+def best_of(repeats: int, func, *args):
+    best = float('inf')
+    result = None
+    for _ in range(repeats):
+        start = time.process_time()
+        result = func(*args)
+        best = min(best, time.process_time() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--seconds', type=float, default=60.0, help='Ölçülen ses süresi')
+    parser.add_argument('--batches', default='1,3,5,10', help='Denenecek parti boyutları (frame)')
+    parser.add_argument('--budget-us', type=float, default=20.0, help='Frame başına izin verilen CPU (µs)')
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    try:
+        save.get_numpy()
+    except ImportError:
+        print("numpy kurulu değil; yerel VAD kullanılamaz")
+        return 1
+
+    payloads = synthesize_payloads(args.seconds)
+    frames = len(payloads)
+    print(f"{frames} frame ({args.seconds:.0f} sn ses), bütçe {args.budget_us:.1f} µs/frame")
+
+    reference, _ = best_of(1, python_reference, payloads)
+    print(f"{'pure python decode+stats':<28} {reference / frames * 1e6:>8.2f} µs/frame")
+
+    over_budget = []
+    for batch in (int(value) for value in args.batches.split(',')):
+        elapsed, events = best_of(args.repeats, run_vad, payloads, batch)
+        per_frame = elapsed / frames * 1e6
+        status = 'ok' if per_frame <= args.budget_us else 'OVER BUDGET'
+        if batch == save.LOCAL_VAD_BATCH_FRAMES and status != 'ok':
+            over_budget.append(batch)
+        marker = ' (default)' if batch == save.LOCAL_VAD_BATCH_FRAMES else ''
+        print(f"{'LocalVAD batch=' + str(batch) + marker:<28} {per_frame:>8.2f} µs/frame  "
+              f"{per_frame / (FRAME_MS * 1000):.3%} of a core per call  events={events}  {status}")
+    if over_budget:
+        print(f"\nVarsayılan parti boyutu ({save.LOCAL_VAD_BATCH_FRAMES}) bütçeyi aşıyor")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,293 @@
+"""
+OpenAI Realtime API'yi taklit eden yerel websocket sunucusu.
+
+save.py'yi gerçek bir API anahtarı olmadan yük altında çalıştırmak için
+REALTIME_URL bu sunucuya yönlendirilir. Sunucu server_vad gibi davranır:
+her --turn-ms kadar arayan sesinde bir kullanıcı turu biter
+(speech_stopped + committed) ve --reply-ms uzunluğunda
+response.audio.delta akışı başlatılır. --barge-in-ms verilirse yanıt
+sürerken speech_started gönderilip yanıt iptal edilir; aktif yanıt varken
+gelen response.create için gerçek API'deki hata mesajı döner.
+--drop-after-ms verilirse her bağlantı o kadar arayan sesi aldıktan sonra
+kapanış el sıkışması olmadan kesilir; save.py'nin yeniden bağlanma yolunu sınar.
+
+Konuşma öğeleri de taklit edilir: her kullanıcı turu ve yanıt bir öğe olarak
+eklenir (conversation.item.created), response.done'daki input_tokens
+konuşmadaki öğelerin toplamıdır ve conversation.item.delete desteklenir.
+--latency-per-1k-tokens-ms verilirse ilk delta bağlamın her 1000 token'ı için
+o kadar gecikir; böylece bağlam sıkıştırmanın yanıt gecikmesine etkisi ölçülür.
+
+Gecikme ölçümü için her 160 baytlık (20 ms) μ-law frame'in ilk 8 baytı
+gönderenin time.monotonic_ns() damgasını taşır. Gelen append'lerdeki
+damgalardan Twilio -> OpenAI yönündeki gecikme hesaplanır; giden her
+delta'nın başına da damga ve tur numarası yazılır. /stats yolu birikmiş
+ölçümleri JSON olarak döner ve sıfırlar.
+
+Kullanım:
+    python loadtest/fake_realtime.py --port 8765 --turn-ms 3000 --reply-ms 2000
+"""
+import argparse
+import asyncio
+import base64
+import json
+import struct
+import time
+from collections import OrderedDict
+
+import websockets
+
+STAMP = struct.Struct('>QI')  # monotonic_ns, tur numarası
+FRAME_BYTES = 160  # 20 ms, 8 kHz μ-law
+ULAW_BYTES_PER_MS = 8
+SILENCE = b'\xff'
+AUDIO_INPUT_TOKENS_PER_SECOND = 10
+AUDIO_OUTPUT_TOKENS_PER_SECOND = 20
+
+
+class FakeRealtimeServer:
+    def __init__(self, turn_ms: int, reply_ms: int, chunk_ms: int, generation_speed: float,
+                 barge_in_ms: int, first_delta_ms: int, drop_after_ms: int = 0,
+                 latency_per_1k_tokens_ms: float = 0.0):
+        self.turn_ms = turn_ms
+        self.reply_ms = reply_ms
+        self.chunk_ms = chunk_ms
+        self.generation_speed = generation_speed
+        self.barge_in_ms = barge_in_ms
+        self.first_delta_ms = first_delta_ms
+        self.drop_after_ms = drop_after_ms
+        self.latency_per_1k_tokens_ms = latency_per_1k_tokens_ms
+        self.inbound_ms = []
+        self.counters = {"sessions": 0, "responses": 0, "barge_ins": 0, "duplicate_responses": 0, "truncates": 0,
+                         "drops": 0, "replayed_items": 0, "deleted_items": 0, "max_context_tokens": 0}
+        self.open_connections = 0  # Sıfırlanmaz: kapatılmayan Realtime bağlantılarını (sızıntı) gösterir
+
+    async def handler(self, ws, path=None):
+        path = path or getattr(getattr(ws, 'request', None), 'path', '')
+        if path.startswith('/stats'):
+            await self.send_stats(ws)
+            return
+        self.counters["sessions"] += 1
+        self.open_connections += 1
+        try:
+            await RealtimeConnection(self, ws).run()
+        finally:
+            self.open_connections -= 1
+
+    async def send_stats(self, ws):
+        stats = {"inbound_ms": self.inbound_ms, "open_connections": self.open_connections, **self.counters}
+        self.inbound_ms = []
+        self.counters = dict.fromkeys(self.counters, 0)
+        await ws.send(json.dumps(stats))
+
+
+class RealtimeConnection:
+    def __init__(self, server: FakeRealtimeServer, ws):
+        self.server = server
+        self.ws = ws
+        self.received_ms = 0.0
+        self.turn = 0
+        self.response_task = None
+        self.response_started_ms = 0.0
+        self.barged_in = False
+        self.item_seq = 0
+        self.items = OrderedDict()  # item_id -> token
+        self.instruction_tokens = 0
+        self.committed_ms = 0.0
+
+    async def run(self):
+        try:
+            async for message in self.ws:
+                event = json.loads(message)
+                event_type = event.get('type')
+                if event_type == 'input_audio_buffer.append':
+                    await self.on_audio(base64.b64decode(event['audio']))
+                elif event_type == 'session.update':
+                    self.instruction_tokens = len(event.get('session', {}).get('instructions', '')) // 4
+                    await self.send({"type": "session.updated", "session": event.get('session', {})})
+                elif event_type == 'input_audio_buffer.commit':
+                    item_id = self.next_item_id()
+                    await self.send({"type": "input_audio_buffer.committed", "item_id": item_id})
+                    await self.add_user_item(item_id)
+                elif event_type == 'response.create':
+                    if self.response_active():
+                        self.server.counters["duplicate_responses"] += 1
+                        await self.send({"type": "error", "error": {
+                            "type": "invalid_request_error",
+                            "message": "Conversation already has an active response"}})
+                    else:
+                        self.start_response()
+                elif event_type == 'conversation.item.create':
+                    self.server.counters["replayed_items"] += 1
+                    item = dict(event.get('item', {}), id=self.next_item_id())
+                    text = ''.join(part.get('text', '') for part in item.get('content', []))
+                    await self.add_item(item, len(text) // 4, at_root=event.get('previous_item_id') == 'root')
+                elif event_type == 'conversation.item.delete':
+                    if self.items.pop(event.get('item_id'), None) is not None:
+                        self.server.counters["deleted_items"] += 1
+                        await self.send({"type": "conversation.item.deleted", "item_id": event.get('item_id')})
+                elif event_type == 'conversation.item.truncate':
+                    self.server.counters["truncates"] += 1
+                    await self.send({"type": "conversation.item.truncated", "item_id": event.get('item_id'),
+                                     "content_index": 0, "audio_end_ms": event.get('audio_end_ms')})
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            if self.response_task is not None:
+                self.response_task.cancel()
+
+    async def send(self, event: dict):
+        # Gerçek API gibi kompakt JSON
+        await self.ws.send(json.dumps(event, separators=(',', ':')))
+
+    def next_item_id(self) -> str:
+        self.item_seq += 1
+        return f"item_{self.item_seq}"
+
+    def context_tokens(self) -> int:
+        return self.instruction_tokens + int(sum(self.items.values()))
+
+    async def add_item(self, item: dict, tokens: float, at_root: bool = False):
+        previous_item_id = None if at_root or not self.items else next(reversed(self.items))
+        self.items[item['id']] = tokens
+        if at_root:
+            self.items.move_to_end(item['id'], last=False)
+        await self.send({"type": "conversation.item.created", "previous_item_id": previous_item_id, "item": item})
+
+    async def add_user_item(self, item_id: str):
+        """Son commit'ten bu yana gelen arayan sesini kullanıcı öğesi olarak ekler ve transkriptini gönderir"""
+        tokens = (self.received_ms - self.committed_ms) / 1000 * AUDIO_INPUT_TOKENS_PER_SECOND
+        self.committed_ms = self.received_ms
+        await self.add_item({"id": item_id, "type": "message", "role": "user",
+                             "content": [{"type": "input_audio", "transcript": None}]}, tokens)
+        await self.send({"type": "conversation.item.input_audio_transcription.completed", "item_id": item_id,
+                         "content_index": 0, "transcript": f"user turn {self.turn}"})
+
+    def response_active(self) -> bool:
+        return self.response_task is not None and not self.response_task.done()
+
+    async def on_audio(self, audio: bytes):
+        now = time.monotonic_ns()
+        for offset in range(0, len(audio) - STAMP.size + 1, FRAME_BYTES):
+            sent_at = STAMP.unpack_from(audio, offset)[0]
+            if 0 < sent_at <= now:
+                self.server.inbound_ms.append((now - sent_at) / 1e6)
+        self.received_ms += len(audio) / ULAW_BYTES_PER_MS
+
+        if self.server.drop_after_ms and self.received_ms >= self.server.drop_after_ms:
+            # Bağlantı kopması: close frame gönderilmeden TCP bağlantısı kesilir
+            self.server.counters["drops"] += 1
+            self.ws.transport.abort()
+            return
+
+        if (self.server.barge_in_ms and self.response_active() and not self.barged_in
+                and self.received_ms - self.response_started_ms >= self.server.barge_in_ms):
+            # Arayan asistanın sözünü kesiyor
+            self.barged_in = True
+            self.server.counters["barge_ins"] += 1
+            self.response_task.cancel()
+            await self.send({"type": "input_audio_buffer.speech_started",
+                             "audio_start_ms": int(self.received_ms), "item_id": self.next_item_id()})
+
+        if self.received_ms >= (self.turn + 1) * self.server.turn_ms:
+            # server_vad: kullanıcı turu bitti, yanıt otomatik başlar
+            self.turn += 1
+            item_id = self.next_item_id()
+            await self.send({"type": "input_audio_buffer.speech_stopped",
+                             "audio_end_ms": int(self.received_ms), "item_id": item_id})
+            await self.send({"type": "input_audio_buffer.committed", "item_id": item_id})
+            await self.add_user_item(item_id)
+            if not self.response_active():
+                self.start_response()
+
+    def start_response(self):
+        self.response_started_ms = self.received_ms
+        self.barged_in = False
+        self.response_task = asyncio.ensure_future(self.stream_response(self.turn))
+
+    async def stream_response(self, turn: int):
+        server = self.server
+        server.counters["responses"] += 1
+        response_id = f"resp_{server.counters['responses']}"
+        item_id = self.next_item_id()
+        input_tokens = self.context_tokens()
+        server.counters["max_context_tokens"] = max(server.counters["max_context_tokens"], input_tokens)
+        await self.send({"type": "response.created", "response": {"id": response_id, "status": "in_progress"}})
+        await self.add_item({"id": item_id, "type": "message", "role": "assistant",
+                             "content": [{"type": "audio", "transcript": None}]}, 0)
+        status = "completed"
+        sent_ms = 0
+        try:
+            # Gerçek modelde ilk token gecikmesi bağlam uzunluğuyla artar
+            await asyncio.sleep((server.first_delta_ms + input_tokens / 1000 * server.latency_per_1k_tokens_ms) / 1000)
+            chunk_bytes = server.chunk_ms * ULAW_BYTES_PER_MS
+            interval = server.chunk_ms / 1000 / server.generation_speed
+            loop = asyncio.get_running_loop()
+            next_send = loop.time()
+            while sent_ms < server.reply_ms:
+                audio = bytearray(SILENCE * chunk_bytes)
+                STAMP.pack_into(audio, 0, time.monotonic_ns(), turn)
+                await self.send({"type": "response.audio.delta", "response_id": response_id, "item_id": item_id,
+                                 "output_index": 0, "content_index": 0,
+                                 "delta": base64.b64encode(audio).decode('ascii')})
+                sent_ms += server.chunk_ms
+                next_send += interval
+                await asyncio.sleep(max(0.0, next_send - loop.time()))
+            await self.send({"type": "response.audio.done", "response_id": response_id, "item_id": item_id})
+        except asyncio.CancelledError:
+            status = "cancelled"
+        audio_tokens = int(sent_ms / 1000 * AUDIO_OUTPUT_TOKENS_PER_SECOND)
+        if item_id in self.items:
+            self.items[item_id] = audio_tokens + 10
+        try:
+            await self.send({"type": "response.audio_transcript.done", "response_id": response_id, "item_id": item_id,
+                             "output_index": 0, "content_index": 0, "transcript": f"assistant reply {turn}"})
+            await self.send({"type": "response.done", "response": {
+                "id": response_id, "status": status, "output": [{"id": item_id, "type": "message"}],
+                "usage": {"total_tokens": input_tokens + audio_tokens + 10, "input_tokens": input_tokens,
+                          "output_tokens": audio_tokens + 10,
+                          "input_token_details": {"text_tokens": self.instruction_tokens,
+                                                  "audio_tokens": input_tokens - self.instruction_tokens,
+                                                  "cached_tokens": 0},
+                          "output_token_details": {"text_tokens": 10, "audio_tokens": audio_tokens}}}})
+        except websockets.ConnectionClosed:
+            pass
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--turn-ms', type=int, default=3000, help='Her kullanıcı turunun arayan sesi uzunluğu')
+    parser.add_argument('--reply-ms', type=int, default=2000, help='Her yanıtın ses uzunluğu')
+    parser.add_argument('--chunk-ms', type=int, default=100, help='Her response.audio.delta mesajındaki ses')
+    parser.add_argument('--generation-speed', type=float, default=4.0,
+                        help='Yanıt sesinin gerçek zamana göre üretim hızı')
+    parser.add_argument('--first-delta-ms', type=int, default=150, help='Tur bitişinden ilk delta\'ya kadar bekleme')
+    parser.add_argument('--barge-in-ms', type=int, default=0,
+                        help='Yanıt başladıktan bu kadar arayan sesi sonra söz kesme (0: kapalı)')
+    parser.add_argument('--drop-after-ms', type=int, default=0,
+                        help='Her bağlantıyı bu kadar arayan sesinden sonra kes (0: kapalı)')
+    parser.add_argument('--latency-per-1k-tokens-ms', type=float, default=0.0,
+                        help='Bağlamın her 1000 token\'ı için ilk delta\'ya eklenen gecikme')
+
+
+async def serve(host: str, port: int, server: FakeRealtimeServer):
+    async with websockets.serve(server.handler, host, port, max_size=None):
+        print(f"fake realtime listening on ws://{host}:{port}", flush=True)
+        await asyncio.Future()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    add_arguments(parser)
+    args = parser.parse_args()
+    server = FakeRealtimeServer(args.turn_ms, args.reply_ms, args.chunk_ms, args.generation_speed,
+                                args.barge_in_ms, args.first_delta_ms, args.drop_after_ms,
+                                args.latency_per_1k_tokens_ms)
+    try:
+        asyncio.run(serve(args.host, args.port, server))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
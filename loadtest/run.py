@@ -0,0 +1,273 @@
+"""
+save.py için uçtan uca yük testi.
+
+Sahte Realtime sunucusunu (fake_realtime.py) ve REALTIME_URL'i ona
+yönlendirilmiş bir uvicorn --factory save:create_app sürecini başlatır, ardından her ramp
+adımında o kadar eşzamanlı simüle Twilio araması (twilio_client.py) açar.
+Her adım için raporlananlar:
+- inbound/outbound relay gecikmesi ve tur sonu -> ilk yanıt sesi (p50/p95/p99, ms)
+- sunucu sürecinin arama başına CPU'su (% tek çekirdek) ve arama başına RSS artışı (MB)
+- /metrics'teki event_loop_lag_seconds histogramından adım boyunca event loop gecikmesi
+
+Kullanım:
+    python loadtest/run.py --ramp 10,50,100,200 --step-seconds 20
+    python loadtest/run.py --ramp 50 --speed 2 --barge-in-ms 1000 --server-env PACER_ENABLED=true
+"""
+import argparse
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor
+
+import websockets.sync.client
+
+import fake_realtime
+import twilio_client
+
+try:
+    import psutil
+except ImportError:  # psutil opsiyonel, yoksa /proc okunur (yalnızca Linux)
+    psutil = None
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAG_METRIC = 'event_loop_lag_seconds'
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for(check, timeout: float, what: str):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if check():
+                return
+        except OSError:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f"{what} {timeout} sn içinde hazır olmadı")
+
+
+class ProcessSampler:
+    """Sunucu sürecinin CPU süresini ve RSS'ini okur"""
+
+    def __init__(self, pid: int):
+        self.pid = pid
+        self.process = psutil.Process(pid) if psutil else None
+        self.clock_ticks = os.sysconf('SC_CLK_TCK') if not psutil else None
+
+    def cpu_seconds(self) -> float:
+        if self.process:
+            times = self.process.cpu_times()
+            return times.user + times.system
+        with open(f'/proc/{self.pid}/stat') as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        return (int(fields[11]) + int(fields[12])) / self.clock_ticks
+
+    def rss_bytes(self) -> int:
+        if self.process:
+            return self.process.memory_info().rss
+        with open(f'/proc/{self.pid}/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+        return 0
+
+
+def fetch_metrics(base_url: str) -> str:
+    with urllib.request.urlopen(base_url + '/metrics', timeout=5) as response:
+        return response.read().decode()
+
+
+def parse_histogram(text: str, name: str):
+    """Prometheus text çıktısından (üst sınır, kümülatif sayı) listesini döner"""
+    buckets = []
+    for match in re.finditer(rf'^{name}_bucket\{{le="([^"]+)"\}} (\S+)$', text, re.M):
+        bound = float('inf') if match.group(1) == '+Inf' else float(match.group(1))
+        buckets.append((bound, float(match.group(2))))
+    return buckets
+
+
+def parse_gauge(text: str, name: str) -> float:
+    match = re.search(rf'^{name} (\S+)$', text, re.M)
+    return float(match.group(1)) if match else 0.0
+
+
+def histogram_quantile(before, after, q: float) -> float:
+    """İki histogram anlık görüntüsü arasındaki farktan q yüzdeliğinin üst sınırını hesaplar"""
+    deltas = [(bound, count - previous) for (bound, count), (_, previous) in zip(after, before)]
+    total = deltas[-1][1] if deltas else 0
+    if not total:
+        return 0.0
+    for bound, cumulative in deltas:
+        if cumulative >= q * total:
+            return bound
+    return float('inf')
+
+
+def percentiles(values, points=(0.5, 0.95, 0.99)):
+    if not values:
+        return [float('nan')] * len(points)
+    values = sorted(values)
+    return [values[min(len(values) - 1, int(p * len(values)))] for p in points]
+
+
+def fetch_fake_stats(fake_port: int) -> dict:
+    with websockets.sync.client.connect(f'ws://127.0.0.1:{fake_port}/stats', max_size=None) as ws:
+        return json.loads(ws.recv())
+
+
+def start_processes(args, fake_port: int, server_port: int, workdir: str):
+    fake = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fake_realtime.py'),
+         '--port', str(fake_port), '--turn-ms', str(args.turn_ms), '--reply-ms', str(args.reply_ms),
+         '--chunk-ms', str(args.chunk_ms), '--generation-speed', str(args.generation_speed),
+         '--first-delta-ms', str(args.first_delta_ms), '--barge-in-ms', str(args.barge_in_ms),
+         '--drop-after-ms', str(args.drop_after_ms),
+         '--latency-per-1k-tokens-ms', str(args.latency_per_1k_tokens_ms)],
+        stdout=subprocess.DEVNULL)
+    env = dict(os.environ,
+               REALTIME_URL=f'ws://127.0.0.1:{fake_port}/v1/realtime',
+               OPENAI_API_KEY='loadtest',
+               REALTIME_PREWARM='false',
+               LOG_FILE=os.path.join(workdir, 'relay.log'),
+               TRANSCRIPT_DIR=os.path.join(workdir, 'transcripts'))
+    for item in args.server_env:
+        key, _, value = item.partition('=')
+        env[key] = value
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', '--factory', 'save:create_app', '--app-dir', REPO_DIR, '--host', '127.0.0.1',
+         '--port', str(server_port), '--log-level', 'warning', '--no-access-log'],
+        cwd=workdir, env=env)
+    return fake, server
+
+
+def run_step(args, executor, calls: int, base_url: str, fake_port: int, sampler: ProcessSampler):
+    url = base_url.replace('http', 'ws', 1) + f'/media-stream?language={args.language}&voice={args.voice}'
+    workers = min(args.workers, calls)
+    shares = [calls // workers + (1 if i < calls % workers else 0) for i in range(workers)]
+
+    fetch_fake_stats(fake_port)  # önceki adımın ölçümlerini sıfırla
+    metrics_before = fetch_metrics(base_url)
+    rss_before = sampler.rss_bytes()
+    cpu_before = sampler.cpu_seconds()
+    started = time.monotonic()
+    futures = [executor.submit(twilio_client.run_calls_blocking, url, share, args.step_seconds, args.speed,
+                               args.turn_ms, args.audio, args.ramp_seconds) for share in shares]
+
+    # Adım sürerken RSS tepe değeri ve anlık event loop gecikmesi örneklenir
+    peak_rss, max_lag = rss_before, 0.0
+    while not all(future.done() for future in futures):
+        time.sleep(args.sample_interval)
+        peak_rss = max(peak_rss, sampler.rss_bytes())
+        try:
+            max_lag = max(max_lag, parse_gauge(fetch_metrics(base_url), 'event_loop_lag_last_seconds'))
+        except OSError:
+            pass
+    elapsed = time.monotonic() - started
+    cpu_used = sampler.cpu_seconds() - cpu_before
+    metrics_after = fetch_metrics(base_url)
+
+    stats = twilio_client.new_stats()
+    for future in futures:
+        for key, value in future.result().items():
+            stats[key] += value
+    fake_stats = fetch_fake_stats(fake_port)
+    lag_before = parse_histogram(metrics_before, LAG_METRIC)
+    lag_after = parse_histogram(metrics_after, LAG_METRIC)
+    return {
+        "calls": calls,
+        "ok": stats["calls_ok"],
+        "failed": stats["calls_failed"],
+        "inbound_ms": percentiles(fake_stats["inbound_ms"]),
+        "outbound_ms": percentiles(stats["outbound_ms"]),
+        "first_audio_ms": percentiles(stats["first_audio_ms"]),
+        "cpu_pct_per_call": 100 * cpu_used / elapsed / calls,
+        "cpu_pct_total": 100 * cpu_used / elapsed,
+        "rss_mb_per_call": (peak_rss - rss_before) / calls / 2**20,
+        "rss_mb": peak_rss / 2**20,
+        "loop_lag_ms": [1000 * histogram_quantile(lag_before, lag_after, q) for q in (0.5, 0.99)] + [1000 * max_lag],
+        "frames_late": stats["frames_late"],
+        "responses": fake_stats["responses"],
+        "barge_ins": fake_stats["barge_ins"],
+        "upstream_drops": fake_stats["drops"],
+        "max_context_tokens": fake_stats["max_context_tokens"],
+        "deleted_items": fake_stats["deleted_items"],
+        "clears": stats["clears"],
+        "marks": stats["marks"],
+        "errors": stats["errors"][:5],
+    }
+
+
+def format_triplet(values) -> str:
+    return '/'.join(f'{v:.1f}' for v in values)
+
+
+def print_report(results):
+    header = (f"{'calls':>6} {'ok':>5} {'fail':>5} {'inbound p50/95/99':>20} {'outbound p50/95/99':>20} "
+              f"{'1st audio p50/95/99':>22} {'cpu%/call':>10} {'MB/call':>8} {'loop lag p50/99/max':>22}")
+    print(header)
+    print('-' * len(header))
+    for r in results:
+        print(f"{r['calls']:>6} {r['ok']:>5} {r['failed']:>5} {format_triplet(r['inbound_ms']):>20} "
+              f"{format_triplet(r['outbound_ms']):>20} {format_triplet(r['first_audio_ms']):>22} "
+              f"{r['cpu_pct_per_call']:>10.2f} {r['rss_mb_per_call']:>8.2f} {format_triplet(r['loop_lag_ms']):>22}")
+    for r in results:
+        for error in r['errors']:
+            print(f"[{r['calls']} calls] error: {error}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--ramp', default='10,50,100', help='Virgülle ayrılmış eşzamanlı arama sayıları')
+    parser.add_argument('--step-seconds', type=float, default=20.0, help='Her adımda arama başına gönderilen ses')
+    parser.add_argument('--ramp-seconds', type=float, default=2.0, help='Bir adımın aramalarının açılma süresi')
+    parser.add_argument('--speed', type=float, default=1.0, help='Ses gönderim hızı (1.0 gerçek zaman)')
+    parser.add_argument('--audio', help='Ham μ-law ya da 8 kHz μ-law WAV dosyası (yoksa sentetik ses)')
+    parser.add_argument('--language', default='en')
+    parser.add_argument('--voice', default='alloy')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='Simüle Twilio istemcilerini çalıştıran süreç sayısı')
+    parser.add_argument('--sample-interval', type=float, default=1.0)
+    parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE',
+                        help='save.py sürecine geçirilecek ek ortam değişkeni (tekrarlanabilir)')
+    parser.add_argument('--json', help='Sonuçları bu dosyaya da yaz')
+    fake_realtime.add_arguments(parser)
+    args = parser.parse_args()
+
+    fake_port, server_port = free_port(), free_port()
+    base_url = f'http://127.0.0.1:{server_port}'
+    with tempfile.TemporaryDirectory(prefix='loadtest-') as workdir:
+        fake, server = start_processes(args, fake_port, server_port, workdir)
+        try:
+            wait_for(lambda: fetch_fake_stats(fake_port) is not None, 10, 'Sahte Realtime sunucusu')
+            wait_for(lambda: fetch_metrics(base_url), 20, 'save.py')
+            sampler = ProcessSampler(server.pid)
+            results = []
+            with ProcessPoolExecutor(args.workers) as executor:
+                for calls in (int(value) for value in args.ramp.split(',')):
+                    print(f"step: {calls} concurrent calls...", file=sys.stderr, flush=True)
+                    results.append(run_step(args, executor, calls, base_url, fake_port, sampler))
+                    time.sleep(1)  # Oturumların kapanıp belleğin oturmasını bekle
+            print_report(results)
+            if args.json:
+                with open(args.json, 'w') as f:
+                    json.dump(results, f, indent=2)
+        finally:
+            for process in (server, fake):
+                process.terminate()
+            for process in (server, fake):
+                process.wait(10)
+
+
+if __name__ == '__main__':
+    main()
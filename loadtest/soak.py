@@ -0,0 +1,192 @@
+"""
+save.py için kısa aramalarla dayanıklılık (soak) testi.
+
+run.py gibi sahte Realtime sunucusunu ve uvicorn --factory save:create_app
+sürecini başlatır, ardından en fazla --concurrency eşzamanlı olacak şekilde
+binlerce kısa simüle Twilio araması açıp kapatır. Aramalar sırayla stop olayıyla,
+stop olmadan websocket kapatılarak ve TCP bağlantısı kesilerek biter; --drop-after-ms
+ile Realtime tarafı da koparılabilir.
+
+Tüm aramalar bittikten sonra sunucunun sakinleşmesi beklenir ve şunlar raporlanır:
+- /metrics: active_sessions, call_tasks_live, call_tasks_leaked, call_task_failures_total,
+  call_teardown_seconds ve event loop gecikmesi (p50/p99)
+- sahte sunucuda açık kalan Realtime bağlantısı sayısı
+- sunucu sürecinin açık dosya tanımlayıcısı ve RSS artışı
+Görev, oturum ya da bağlantı sızıntısı varsa veya fd/RSS artışı sınırı aşarsa 1 ile çıkar.
+
+Kullanım:
+    python loadtest/soak.py --calls 5000 --concurrency 100 --duration 0.5
+    python loadtest/soak.py --calls 2000 --drop-after-ms 300 --server-env REALTIME_RECONNECT_ATTEMPTS=1
+"""
+import argparse
+import asyncio
+import os
+import re
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import fake_realtime
+import twilio_client
+from run import (LAG_METRIC, ProcessSampler, fetch_fake_stats, fetch_metrics, free_port, histogram_quantile,
+                 parse_gauge, parse_histogram, start_processes, wait_for)
+
+ENDINGS = ('stop', 'close', 'abort')
+
+
+def open_fds(pid: int) -> int:
+    return len(os.listdir(f'/proc/{pid}/fd'))
+
+
+def parse_counter_total(text: str, name: str) -> float:
+    """Etiketlerinden bağımsız olarak bir sayacın tüm serilerinin toplamını döner"""
+    return sum(float(value) for value in re.findall(rf'^{name}(?:\{{[^}}]*\}})? (\S+)$', text, re.M))
+
+
+async def run_share(url: str, calls: int, offset: int, concurrency: int, duration: float, speed: float,
+                    turn_ms: int, audio_path: str = None):
+    """Payına düşen aramaları en fazla concurrency eşzamanlı olacak şekilde arka arkaya çalıştırır"""
+    frames = twilio_client.load_frames(audio_path)
+    stats = twilio_client.new_stats()
+    stats["endings"] = dict.fromkeys(ENDINGS, 0)
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one_call(index: int):
+        async with slots:
+            ending = ENDINGS[index % len(ENDINGS)]
+            stats["endings"][ending] += 1
+            await twilio_client.SimulatedCall(url, frames, duration, speed, turn_ms, stats, ending).run()
+
+    await asyncio.gather(*(one_call(offset + index) for index in range(calls)))
+    return stats
+
+
+def run_share_blocking(*args):
+    """ProcessPoolExecutor içinden çağrılabilen senkron sarmalayıcı"""
+    return asyncio.run(run_share(*args))
+
+
+def wait_until_idle(base_url: str, timeout: float) -> str:
+    """Aktif oturum ve canlı arama görevi kalmayana kadar bekler; son /metrics çıktısını döner"""
+    deadline = time.monotonic() + timeout
+    while True:
+        text = fetch_metrics(base_url)
+        idle = parse_gauge(text, 'active_sessions') == 0 and parse_gauge(text, 'call_tasks_live') == 0
+        if idle or time.monotonic() > deadline:
+            return text
+        time.sleep(0.2)
+
+
+def wait_for_upstream_closed(fake_port: int, timeout: float) -> dict:
+    """Sahte sunucudaki Realtime bağlantıları kapanana kadar bekler; okumalar arasında sıfırlanan drops'u toplar.
+
+    save.py active_sessions'ı Realtime websocket'inin kapanış el sıkışmasından önce düşürür; yoğun yükte
+    bu el sıkışma saniyeler sürebildiğinden hemen okunan bağlantı sayısı sızıntı gibi görünür.
+    """
+    deadline = time.monotonic() + timeout
+    stats = fetch_fake_stats(fake_port)
+    drops = stats["drops"]
+    while stats["open_connections"] and time.monotonic() < deadline:
+        time.sleep(0.2)
+        stats = fetch_fake_stats(fake_port)
+        drops += stats["drops"]
+    return dict(stats, drops=drops)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=3000, help='Toplam arama sayısı')
+    parser.add_argument('--concurrency', type=int, default=100, help='Aynı anda açık en fazla arama')
+    parser.add_argument('--duration', type=float, default=0.5, help='Arama başına gönderilen ses (sn)')
+    parser.add_argument('--speed', type=float, default=1.0, help='Ses gönderim hızı (1.0 gerçek zaman)')
+    parser.add_argument('--audio', help='Ham μ-law ya da 8 kHz μ-law WAV dosyası (yoksa sentetik ses)')
+    parser.add_argument('--language', default='en')
+    parser.add_argument('--voice', default='alloy')
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help='Simüle Twilio istemcilerini çalıştıran süreç sayısı')
+    parser.add_argument('--settle-seconds', type=float, default=15.0,
+                        help='Aramalar bittikten sonra sunucunun boşalması için beklenecek en uzun süre')
+    parser.add_argument('--max-fd-growth', type=int, default=20, help='İzin verilen açık fd artışı')
+    parser.add_argument('--max-rss-growth-mb', type=float, default=64.0, help='İzin verilen RSS artışı (MB)')
+    parser.add_argument('--server-env', action='append', default=['ADMISSION_MAX_SESSIONS=0'], metavar='KEY=VALUE',
+                        help='save.py sürecine geçirilecek ek ortam değişkeni (tekrarlanabilir)')
+    fake_realtime.add_arguments(parser)
+    args = parser.parse_args()
+
+    fake_port, server_port = free_port(), free_port()
+    base_url = f'http://127.0.0.1:{server_port}'
+    url = base_url.replace('http', 'ws', 1) + f'/media-stream?language={args.language}&voice={args.voice}'
+    with tempfile.TemporaryDirectory(prefix='soak-') as workdir:
+        fake, server = start_processes(args, fake_port, server_port, workdir)
+        try:
+            wait_for(lambda: fetch_fake_stats(fake_port) is not None, 10, 'Sahte Realtime sunucusu')
+            wait_for(lambda: fetch_metrics(base_url), 20, 'save.py')
+            sampler = ProcessSampler(server.pid)
+            # Isınma: tek seferlik ayırmalar (önbellekler, importlar) ve tam eşzamanlılıktaki bellek
+            # tepe noktası artışa sayılmasın
+            twilio_client.run_calls_blocking(url, args.concurrency, args.duration, args.speed, args.turn_ms,
+                                             args.audio)
+            wait_until_idle(base_url, args.settle_seconds)
+            wait_for_upstream_closed(fake_port, args.settle_seconds)
+            fds_before, rss_before = open_fds(server.pid), sampler.rss_bytes()
+            metrics_before = fetch_metrics(base_url)
+
+            workers = max(1, min(args.workers, args.calls))
+            shares = [args.calls // workers + (1 if i < args.calls % workers else 0) for i in range(workers)]
+            offsets = [sum(shares[:i]) for i in range(workers)]
+            per_worker = max(1, args.concurrency // workers)
+            print(f"soak: {args.calls} calls, {per_worker * workers} concurrent, "
+                  f"{args.duration}s each...", file=sys.stderr, flush=True)
+            started = time.monotonic()
+            with ProcessPoolExecutor(workers) as executor:
+                futures = [executor.submit(run_share_blocking, url, share, offset, per_worker, args.duration,
+                                           args.speed, args.turn_ms, args.audio)
+                           for share, offset in zip(shares, offsets)]
+                results = [future.result() for future in futures]
+            elapsed = time.monotonic() - started
+
+            metrics_after = wait_until_idle(base_url, args.settle_seconds)
+            fake_stats = wait_for_upstream_closed(fake_port, args.settle_seconds)
+            fds_after, rss_after = open_fds(server.pid), sampler.rss_bytes()
+        finally:
+            for process in (server, fake):
+                process.terminate()
+            for process in (server, fake):
+                process.wait(10)
+
+    ok = sum(r["calls_ok"] for r in results)
+    failed = sum(r["calls_failed"] for r in results)
+    endings = {ending: sum(r["endings"][ending] for r in results) for ending in ENDINGS}
+    checks = [
+        ("active_sessions", parse_gauge(metrics_after, 'active_sessions'), 0),
+        ("call_tasks_live", parse_gauge(metrics_after, 'call_tasks_live'), 0),
+        ("call_tasks_leaked", parse_gauge(metrics_after, 'call_tasks_leaked'), 0),
+        ("realtime connections open", fake_stats["open_connections"], 0),
+        ("open fd growth", fds_after - fds_before, args.max_fd_growth),
+        ("rss growth MB", round((rss_after - rss_before) / 2**20, 1), args.max_rss_growth_mb),
+    ]
+    print(f"calls: {ok} ok, {failed} failed in {elapsed:.1f}s "
+          f"({', '.join(f'{name}={count}' for name, count in endings.items())})")
+    print(f"upstream drops: {fake_stats['drops']}  call task failures: "
+          f"{parse_counter_total(metrics_after, 'call_task_failures_total'):.0f}")
+    for label, metric in (("teardown", 'call_teardown_seconds'), ("loop lag", LAG_METRIC)):
+        before, after = parse_histogram(metrics_before, metric), parse_histogram(metrics_after, metric)
+        print(f"{label} p50/p99: " + '/'.join(
+            f"{1000 * histogram_quantile(before, after, q):.1f}" for q in (0.5, 0.99)) + " ms")
+    failures = []
+    for name, value, limit in checks:
+        status = 'ok' if value <= limit else 'LEAK'
+        if status != 'ok':
+            failures.append(name)
+        print(f"{name:<28} {value:>10}  limit {limit:<6} {status}")
+    for error in [e for r in results for e in r["errors"]][:5]:
+        print("error:", error)
+    if failures:
+        print(f"\nSızıntı tespit edildi: {', '.join(failures)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,234 @@
+"""
+Twilio media stream istemcisini taklit eder.
+
+connected/start olaylarından sonra kayıtlı μ-law sesi (ham .ulaw/.raw veya
+8 kHz μ-law WAV) 20 ms'lik frame'ler halinde gerçek zamanlı ya da --speed
+katı hızlandırılmış olarak /media-stream'e gönderir. Gelen sesi bir oynatma
+saati üzerinde "çalar"; mark'ları ses o noktaya geldiğinde geri gönderir,
+clear gelince bekleyen mark'ları hemen döndürüp tamponu boşaltır.
+
+Ölçülenler:
+- outbound_ms: sahte Realtime sunucusunun delta damgasından Twilio'ya ulaşana kadar
+- first_audio_ms: kullanıcı turunun son frame'inden yanıtın ilk sesine kadar
+
+Arama sonu (ending): "stop" Twilio gibi stop olayı gönderip kapatır, "close" stop
+göndermeden websocket'i kapatır, "abort" TCP bağlantısını kapanış el sıkışması
+olmadan keser.
+
+Tek başına kullanım:
+    python loadtest/twilio_client.py --url ws://127.0.0.1:5050/media-stream --calls 5 --duration 10
+"""
+import argparse
+import asyncio
+import base64
+import json
+import math
+import struct
+import time
+import uuid
+
+import websockets
+
+STAMP = struct.Struct('>QI')  # fake_realtime.py ile aynı damga
+FRAME_MS = 20
+FRAME_BYTES = 160
+
+
+def linear_to_ulaw(sample: int) -> int:
+    """16 bit PCM örneğini G.711 μ-law baytına çevirir"""
+    sign = 0x80 if sample < 0 else 0
+    sample = min(abs(sample), 32635) + 0x84
+    exponent = max(0, sample.bit_length() - 8)
+    mantissa = (sample >> (exponent + 3)) & 0x0F
+    return ~(sign | (exponent << 4) | mantissa) & 0xFF
+
+
+def synthesize_frames(seconds: float = 4.0):
+    """Konuşmayı andıran, genliği değişen bir ton üretir"""
+    frames = []
+    for index in range(int(seconds * 1000 / FRAME_MS)):
+        amplitude = 6000 * (0.5 + 0.5 * math.sin(index / 7))
+        samples = (int(amplitude * math.sin(2 * math.pi * 220 * (index * FRAME_BYTES + n) / 8000))
+                   for n in range(FRAME_BYTES))
+        frames.append(bytes(linear_to_ulaw(sample) for sample in samples))
+    return frames
+
+
+def load_frames(path: str = None):
+    """Ses dosyasını 20 ms'lik μ-law frame'lerine böler; dosya yoksa sentetik ses kullanılır"""
+    if not path:
+        return synthesize_frames()
+    with open(path, 'rb') as f:
+        audio = f.read()
+    if audio[:4] == b'RIFF' and audio[8:12] == b'WAVE':
+        audio = wav_ulaw_data(audio, path)
+    frames = [audio[i:i + FRAME_BYTES] for i in range(0, len(audio) - FRAME_BYTES + 1, FRAME_BYTES)]
+    if not frames:
+        raise ValueError(f"{path} en az bir frame ({FRAME_BYTES} bayt) içermeli")
+    return frames
+
+
+def wav_ulaw_data(audio: bytes, path: str) -> bytes:
+    """WAV içinden 8 kHz mono μ-law data chunk'ını döner"""
+    offset = 12
+    fmt = None
+    while offset + 8 <= len(audio):
+        chunk_id, size = audio[offset:offset + 4], struct.unpack_from('<I', audio, offset + 4)[0]
+        body = audio[offset + 8:offset + 8 + size]
+        if chunk_id == b'fmt ':
+            fmt = struct.unpack_from('<HHI', body)
+        elif chunk_id == b'data':
+            if fmt != (7, 1, 8000):
+                raise ValueError(f"{path}: yalnızca 8 kHz mono μ-law WAV destekleniyor (format={fmt})")
+            return body
+        offset += 8 + size + (size & 1)
+    raise ValueError(f"{path}: data chunk bulunamadı")
+
+
+def new_stats():
+    return {"outbound_ms": [], "first_audio_ms": [], "calls_ok": 0, "calls_failed": 0,
+            "frames_sent": 0, "frames_late": 0, "marks": 0, "clears": 0, "errors": []}
+
+
+class SimulatedCall:
+    def __init__(self, url: str, frames, duration: float, speed: float, turn_ms: int, stats: dict,
+                 ending: str = 'stop'):
+        self.url = url
+        self.ending = ending
+        self.frames = frames
+        self.duration = duration
+        self.speed = speed
+        self.turn_ms = turn_ms
+        self.stats = stats
+        self.stream_sid = 'MZ' + uuid.uuid4().hex
+        self.call_sid = 'CA' + uuid.uuid4().hex
+        self.turn_ended_at = {}  # tur numarası -> son frame'in gönderildiği an (ns)
+        self.seen_turns = set()
+        self.play_until = 0.0
+        self.pending_marks = {}  # mark adı -> zamanlayıcı
+
+    async def run(self):
+        try:
+            async with websockets.connect(self.url, max_size=None) as ws:
+                await ws.send(json.dumps({"event": "connected", "protocol": "Call", "version": "1.0.0"}))
+                await ws.send(json.dumps({"event": "start", "sequenceNumber": "1", "streamSid": self.stream_sid,
+                                          "start": {"streamSid": self.stream_sid, "callSid": self.call_sid,
+                                                    "tracks": ["inbound"], "mediaFormat": {
+                                                        "encoding": "audio/x-mulaw", "sampleRate": 8000,
+                                                        "channels": 1}}}))
+                receiver = asyncio.ensure_future(self.receive(ws))
+                try:
+                    await self.send_media(ws)
+                    if self.ending == 'stop':
+                        await ws.send(json.dumps({"event": "stop", "streamSid": self.stream_sid,
+                                                  "stop": {"callSid": self.call_sid}}))
+                    elif self.ending == 'abort':
+                        ws.transport.abort()
+                finally:
+                    receiver.cancel()
+                    for handle in self.pending_marks.values():
+                        handle.cancel()
+            self.stats["calls_ok"] += 1
+        except Exception as e:
+            self.stats["calls_failed"] += 1
+            self.stats["errors"].append(f"{type(e).__name__}: {e}")
+
+    async def send_media(self, ws):
+        loop = asyncio.get_running_loop()
+        interval = FRAME_MS / 1000 / self.speed
+        frame_count = int(self.duration * 1000 / FRAME_MS)
+        started = loop.time()
+        for index in range(frame_count):
+            deadline = started + index * interval
+            delay = deadline - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            elif delay < -interval:
+                self.stats["frames_late"] += 1
+            frame = bytearray(self.frames[index % len(self.frames)])
+            sent_at = time.monotonic_ns()
+            STAMP.pack_into(frame, 0, sent_at, 0)
+            await ws.send(
+                '{"event":"media","streamSid":"' + self.stream_sid + '","media":{"track":"inbound","chunk":"'
+                + str(index + 1) + '","timestamp":"' + str(index * FRAME_MS) + '","payload":"'
+                + base64.b64encode(frame).decode('ascii') + '"}}')
+            self.stats["frames_sent"] += 1
+            media_ms = (index + 1) * FRAME_MS
+            if media_ms % self.turn_ms == 0:
+                self.turn_ended_at[media_ms // self.turn_ms] = sent_at
+
+    async def receive(self, ws):
+        loop = asyncio.get_running_loop()
+        async for message in ws:
+            data = json.loads(message)
+            event = data.get('event')
+            if event == 'media':
+                audio = base64.b64decode(data['media']['payload'])
+                now = time.monotonic_ns()
+                if len(audio) >= STAMP.size:
+                    stamped_at, turn = STAMP.unpack_from(audio)
+                    if 0 < stamped_at <= now:
+                        self.stats["outbound_ms"].append((now - stamped_at) / 1e6)
+                        if turn not in self.seen_turns and turn in self.turn_ended_at:
+                            self.seen_turns.add(turn)
+                            self.stats["first_audio_ms"].append((now - self.turn_ended_at[turn]) / 1e6)
+                # Twilio sesi gerçek zamanda çalar; hızlandırılmış modda oynatma da hızlanır
+                self.play_until = max(loop.time(), self.play_until) + len(audio) / 8000 / self.speed
+            elif event == 'mark':
+                name = data['mark']['name']
+                self.pending_marks[name] = loop.call_at(self.play_until, self.echo_mark, ws, name)
+            elif event == 'clear':
+                self.stats["clears"] += 1
+                self.play_until = loop.time()
+                for name, handle in list(self.pending_marks.items()):
+                    handle.cancel()
+                    self.echo_mark(ws, name)
+
+    def echo_mark(self, ws, name: str):
+        self.pending_marks.pop(name, None)
+        self.stats["marks"] += 1
+        asyncio.ensure_future(ws.send(json.dumps({"event": "mark", "streamSid": self.stream_sid,
+                                                  "mark": {"name": name}})))
+
+
+async def run_calls(url: str, calls: int, duration: float, speed: float, turn_ms: int, audio_path: str = None,
+                    ramp_seconds: float = 1.0):
+    """Verilen sayıda aramayı ramp_seconds içine yayarak eşzamanlı çalıştırır"""
+    frames = load_frames(audio_path)
+    stats = new_stats()
+    tasks = []
+    for index in range(calls):
+        tasks.append(asyncio.ensure_future(SimulatedCall(url, frames, duration, speed, turn_ms, stats).run()))
+        if calls > 1:
+            await asyncio.sleep(ramp_seconds / calls)
+    await asyncio.gather(*tasks)
+    return stats
+
+
+def run_calls_blocking(*args):
+    """ProcessPoolExecutor içinden çağrılabilen senkron sarmalayıcı"""
+    return asyncio.run(run_calls(*args))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='ws://127.0.0.1:5050/media-stream?language=en&voice=alloy')
+    parser.add_argument('--calls', type=int, default=1)
+    parser.add_argument('--duration', type=float, default=10.0, help='Arama başına gönderilen ses (sn)')
+    parser.add_argument('--speed', type=float, default=1.0, help='1.0 gerçek zaman, 2.0 iki kat hızlı')
+    parser.add_argument('--turn-ms', type=int, default=3000, help='fake_realtime.py ile aynı olmalı')
+    parser.add_argument('--audio', help='Ham μ-law ya da 8 kHz μ-law WAV dosyası')
+    args = parser.parse_args()
+    stats = run_calls_blocking(args.url, args.calls, args.duration, args.speed, args.turn_ms, args.audio)
+    errors = stats.pop("errors")
+    for key in ("outbound_ms", "first_audio_ms"):
+        values = sorted(stats.pop(key))
+        if values:
+            print(f"{key}: n={len(values)} p50={values[len(values) // 2]:.2f} max={values[-1]:.2f}")
+    print(json.dumps(stats))
+    for error in errors[:10]:
+        print("error:", error)
+
+
+if __name__ == '__main__':
+    main()
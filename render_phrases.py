@@ -0,0 +1,84 @@
+"""
+Sabit ifadeleri (karşılama, veda) Realtime API ile bir kez seslendirip
+save.py'nin PhraseAudioCache'inin okuduğu dizine ham μ-law olarak yazar:
+{PHRASE_AUDIO_DIR}/{dil}/{ses}/{ifade}.ulaw
+
+Dosyalar yazıldıktan sonra çalışan sunucuda POST /prompts/reload önbelleği
+boşaltır. Klip bulunmayan ifadeler eskisi gibi model tarafından üretilir.
+
+Kullanım:
+    python render_phrases.py
+    python render_phrases.py --languages tr,en --voices alloy --phrases goodbye
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+
+import save
+
+PHRASES = {
+    'greeting': save.get_language_specific_greeting_message,
+    'goodbye': save.get_language_specific_goodbye_message,
+}
+
+
+async def render(language: str, voice: str, text: str) -> bytes:
+    """Metni birebir seslendirtir ve μ-law sesi döner"""
+    openai_ws = await save.connect_realtime(language, voice)
+    try:
+        # Arayan sesi yok; yanıt yalnızca istenen metni okumalı
+        await openai_ws.send(json.dumps({"type": "session.update", "session": {"turn_detection": None}}))
+        await openai_ws.send(json.dumps({
+            "type": "response.create",
+            "response": {
+                "modalities": ["audio", "text"],
+                "instructions": f"Say exactly this and nothing else: {text}"
+            }
+        }))
+        audio = bytearray()
+        async for message in openai_ws:
+            event = json.loads(message)
+            if event['type'] == 'response.audio.delta':
+                audio += base64.b64decode(event['delta'])
+            elif event['type'] == 'error':
+                raise RuntimeError(event['error'].get('message'))
+            elif event['type'] == 'response.done':
+                return bytes(audio)
+        raise RuntimeError("Realtime bağlantısı yanıt bitmeden kapandı")
+    finally:
+        await openai_ws.close()
+
+
+async def main(args) -> int:
+    failures = 0
+    for language in args.languages.split(','):
+        for voice in args.voices.split(','):
+            for phrase in args.phrases.split(','):
+                path = save.phrase_audio.path(language, voice, phrase)
+                if os.path.exists(path) and not args.force:
+                    print(f"skip   {path}")
+                    continue
+                try:
+                    audio = await render(language, voice, PHRASES[phrase](language))
+                except Exception as e:
+                    failures += 1
+                    print(f"failed {path}: {e}", file=sys.stderr)
+                    continue
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path + '.tmp', 'wb') as f:
+                    f.write(audio)
+                os.replace(path + '.tmp', path)
+                print(f"wrote  {path} ({len(audio) / save.ULAW_BYTES_PER_MS / 1000:.1f} s)")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--languages', default='tr,en,it,ru')
+    parser.add_argument('--voices', default=','.join(save.SUPPORTED_VOICES))
+    parser.add_argument('--phrases', default=','.join(PHRASES))
+    parser.add_argument('--force', action='store_true', help='Var olan dosyaların üzerine yaz')
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -1,38 +1,192 @@
+import time
+IMPORT_STARTED = time.perf_counter()
 import os
 import json
 import base64
 import asyncio
-import time
 import functools
-import websockets
-from fastapi import FastAPI, WebSocket, Request
-from fastapi.responses import HTMLResponse, JSONResponse
-from fastapi.websockets import WebSocketDisconnect
-from twilio.twiml.voice_response import VoiceResponse, Connect, Say, Stream
+import itertools
+import atexit
+import glob
+import importlib.util
+import mmap
+import queue
+import sqlite3
+import struct
+import sys
+import threading
+import uuid
+from bisect import bisect_left
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+from urllib.parse import parse_qs
+# fastapi, twilio ve websockets ağır modüllerdir; create_app(), get_twilio_client() ve connect_realtime()
+# içinde ilk kullanımda import edilir. Handler'lar yalnızca hafif starlette tiplerine ihtiyaç duyar.
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import HTMLResponse, JSONResponse, PlainTextResponse
+from starlette.websockets import WebSocket, WebSocketDisconnect, WebSocketState
+from pydantic import BaseModel
 from dotenv import load_dotenv
-from twilio.rest import Client
+
+try:
+    import orjson
+except ImportError:  # orjson opsiyonel, yoksa standart json kullanılır
+    orjson = None
 
 load_dotenv()
 
-# Performans ölçüm dekoratörü
+# Prometheus formatında dışa aktarılan, süreç içi düşük maliyetli metrikler
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CALL_BUCKETS = (1.0, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class Gauge:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+class Counter(Gauge):
+    pass
+
+class MetricsRegistry:
+    def __init__(self):
+        self.families = {}  # name -> [type, help, {label tuple: metric}]
+
+    def histogram(self, name: str, help_text: str, buckets=LATENCY_BUCKETS, **labels) -> Histogram:
+        return self._get(name, 'histogram', help_text, labels, lambda: Histogram(buckets))
+
+    def gauge(self, name: str, help_text: str, **labels) -> Gauge:
+        return self._get(name, 'gauge', help_text, labels, Gauge)
+
+    def counter(self, name: str, help_text: str, **labels) -> Counter:
+        return self._get(name, 'counter', help_text, labels, Counter)
+
+    def _get(self, name, metric_type, help_text, labels, factory):
+        family = self.families.setdefault(name, [metric_type, help_text, {}])
+        key = tuple(sorted(labels.items()))
+        metric = family[2].get(key)
+        if metric is None:
+            metric = family[2][key] = factory()
+        return metric
+
+    def render(self) -> str:
+        """Tüm metrikleri Prometheus text formatında döner"""
+        lines = []
+        for name, (metric_type, help_text, children) in self.families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for key, metric in children.items():
+                if metric_type == 'histogram':
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets + (float('inf'),), metric.counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(bound)
+                        lines.append(f"{name}_bucket{format_labels(key + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{format_labels(key)} {metric.sum}")
+                    lines.append(f"{name}_count{format_labels(key)} {metric.count}")
+                else:
+                    lines.append(f"{name}{format_labels(key)} {metric.value}")
+        return "\n".join(lines) + "\n"
+
+def format_labels(key) -> str:
+    if not key:
+        return ""
+    return "{" + ",".join(f'{label}="{value}"' for label, value in key) + "}"
+
+metrics = MetricsRegistry()
+ACTIVE_SESSIONS = metrics.gauge("active_sessions", "Active media-stream sessions")
+TIME_TO_FIRST_AUDIO = metrics.histogram(
+    "time_to_first_assistant_audio_seconds", "Twilio stream start to first assistant audio frame sent")
+BARGE_IN_TO_CLEAR = metrics.histogram(
+    "barge_in_to_clear_seconds", "speech_started received to Twilio clear sent")
+RELAY_INBOUND = metrics.histogram(
+    "relay_frame_seconds", "Per-frame relay processing time", direction="twilio_to_openai")
+RELAY_OUTBOUND = metrics.histogram(
+    "relay_frame_seconds", "Per-frame relay processing time", direction="openai_to_twilio")
+OPENAI_EVENT_PROCESSING = metrics.histogram(
+    "openai_event_processing_seconds", "Processing time of one OpenAI realtime event")
+PACER_DISCARDED_AUDIO = metrics.histogram(
+    "pacer_discarded_audio_seconds", "Assistant audio discarded on barge-in (pacer buffer + Twilio lead)",
+    buckets=(0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0))
+EVENT_LOOP_LAG = metrics.histogram(
+    "event_loop_lag_seconds", "How late the event loop woke up for a scheduled sleep")
+EVENT_LOOP_LAG_LAST = metrics.gauge("event_loop_lag_last_seconds", "Most recent event loop lag sample")
+EVENT_LOOP_LAG_INTERVAL = 0.25
+STARTUP_IMPORT_SECONDS = metrics.gauge("startup_import_seconds", "Time spent importing the save module")
+STARTUP_WARMUP_SECONDS = metrics.gauge("startup_warmup_seconds", "Time spent in the startup warmup hook")
+REALTIME_RECONNECT_SECONDS = metrics.histogram(
+    "realtime_reconnect_seconds", "Time from losing the Realtime websocket to resuming the call")
+REALTIME_RECONNECT_BUFFERED_BYTES = metrics.histogram(
+    "realtime_reconnect_buffered_bytes", "Caller audio buffered while the Realtime websocket was down",
+    buckets=(800, 4000, 8000, 16000, 40000, 80000, 160000))
+CONVERSATION_INPUT_TOKENS = metrics.histogram(
+    "conversation_input_tokens", "Server-reported input tokens (conversation context size) per response",
+    buckets=(500, 1000, 2000, 4000, 6000, 8000, 12000, 16000, 32000))
+CONVERSATION_COMPACTED_TOKENS = metrics.histogram(
+    "conversation_compacted_tokens", "Estimated context tokens removed by one compaction",
+    buckets=(250, 500, 1000, 2000, 4000, 8000, 16000))
+CALL_TASKS_LIVE = metrics.gauge("call_tasks_live", "Per-call tasks (relay legs and timer tasks) currently running")
+CALL_TASKS_LEAKED = metrics.gauge("call_tasks_leaked", "Per-call tasks still running after their call was torn down")
+CALL_TEARDOWN_SECONDS = metrics.histogram(
+    "call_teardown_seconds", "First relay leg finishing to all call tasks stopped")
+DIAL_TO_STREAM_CONNECT = metrics.histogram(
+    "dial_to_stream_connect_seconds", "Outbound call creation to media stream connect", buckets=CALL_BUCKETS)
+
+async def monitor_event_loop_lag():
+    """Event loop gecikmesini düzenli aralıklarla ölçer"""
+    loop = asyncio.get_running_loop()
+    while True:
+        expected = loop.time() + EVENT_LOOP_LAG_INTERVAL
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL)
+        lag = max(0.0, loop.time() - expected)
+        EVENT_LOOP_LAG.observe(lag)
+        EVENT_LOOP_LAG_LAST.set(lag)
+        admission.observe_lag(lag)
+
+# Performans ölçüm dekoratörü: handler sürelerini histogram olarak kaydeder
 def performance_monitor(func):
+    histogram = metrics.histogram(
+        "handler_duration_seconds", "Duration of HTTP/websocket handlers",
+        buckets=LATENCY_BUCKETS + CALL_BUCKETS[3:], handler=func.__name__)
     if asyncio.iscoroutinefunction(func):
         @functools.wraps(func)
         async def async_wrapper(*args, **kwargs):
             start_time = time.perf_counter()
-            result = await func(*args, **kwargs)
-            elapsed = time.perf_counter() - start_time
-            print(f"[PERF] {func.__name__} took {elapsed:.4f} seconds")
-            return result
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start_time)
         return async_wrapper
     else:
         @functools.wraps(func)
         def sync_wrapper(*args, **kwargs):
             start_time = time.perf_counter()
-            result = func(*args, **kwargs)
-            elapsed = time.perf_counter() - start_time
-            print(f"[PERF] {func.__name__} took {elapsed:.4f} seconds")
-            return result
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start_time)
         return sync_wrapper
 
 # Konfigürasyon
@@ -41,14 +195,113 @@ TWILIO_ACCOUNT_SID = os.getenv('ACCOUNT_SID')
 TWILIO_AUTH_TOKEN = os.getenv('AUTH_TOKEN')
 TWILIO_NUMBER = os.getenv('TWILIO_NUMBER')
 PORT = int(os.getenv('PORT', 8080))
-MAX_TOKENS_PER_SESSION = 250  # Bir oturum için maksimum token sayısı
-VOICE = "alloy"
+# Oturum bütçeleri response.done olaylarındaki sunucu usage değerleriyle uygulanır; 0 = sınırsız
+# Token bütçesi modelin ürettiği çıktı token'larını (metin + ses) sayar. Her yanıtın girdisi tüm bağlamı yeniden
+# içerdiğinden girdi toplamı bağlam boyutunu ölçmez: bağlamı sıkıştırma, toplam girdi maliyetini MAX_COST_PER_SESSION sınırlar
+MAX_TOKENS_PER_SESSION = int(os.getenv('MAX_TOKENS_PER_SESSION', 20000))
+MAX_AUDIO_SECONDS_PER_SESSION = float(os.getenv('MAX_AUDIO_SECONDS_PER_SESSION', 0))
+MAX_COST_PER_SESSION = float(os.getenv('MAX_COST_PER_SESSION', 0))  # USD
+# Uzun görüşmelerde bağlam sıkıştırma: son yanıtın girdi token'ı bütçeyi aşınca eski öğeler silinip özetlenir
+COMPACTION_TOKEN_BUDGET = int(os.getenv('COMPACTION_TOKEN_BUDGET', 6000))  # 0: kapalı
+COMPACTION_TARGET_TOKENS = int(os.getenv('COMPACTION_TARGET_TOKENS', 4000))  # Sıkıştırma sonrası hedeflenen bağlam
+COMPACTION_KEEP_ITEMS = int(os.getenv('COMPACTION_KEEP_ITEMS', 4))  # Hiç silinmeyen en yeni öğe sayısı
+COMPACTION_SUMMARY_CHARS = int(os.getenv('COMPACTION_SUMMARY_CHARS', 2000))  # Özet öğesinin en fazla uzunluğu
+CONVERSATION_SUMMARY_PREFIX = "Summary of the earlier part of this call:\n"
+# Realtime ses token oranları (kullanıcı sesi ~100 ms, asistan sesi ~50 ms başına 1 token)
+AUDIO_INPUT_TOKENS_PER_SECOND = 10
+AUDIO_OUTPUT_TOKENS_PER_SECOND = 20
+# 1M token başına USD fiyatlar (gpt-4o-realtime-preview)
+TOKEN_PRICES = {
+    'input_text': 5.0,
+    'input_cached_text': 2.5,
+    'input_audio': 100.0,
+    'input_cached_audio': 20.0,
+    'output_text': 20.0,
+    'output_audio': 200.0,
+}
+DEFAULT_VOICE = "alloy"
+DEFAULT_LANGUAGE = "tr"  # Varsayılan olarak Türkçe
+# Arama bağlamı deposu: "memory" (tek süreç) veya "sqlite" (aynı makinedeki uvicorn worker'ları arasında paylaşılır)
+CALL_STORE_BACKEND = os.getenv('CALL_STORE_BACKEND', 'memory')
+CALL_STORE_PATH = os.getenv('CALL_STORE_PATH', 'call_contexts.db')
+CALL_CONTEXT_TTL = float(os.getenv('CALL_CONTEXT_TTL', 3600))  # Arama bağlamının saklanma süresi (sn)
+CALL_STORE_FLUSH_INTERVAL = float(os.getenv('CALL_STORE_FLUSH_INTERVAL', 0.05))  # sqlite: bekleyen yazmaların aralığı (sn)
+CALL_STORE_TIMEOUT = float(os.getenv('CALL_STORE_TIMEOUT', 0.25))  # sqlite: kilit bekleme süresi (sn)
+DEFAULTS_KEY = "defaults"  # Sunucu geneli varsayılanların saklandığı anahtar
+# Transkript ve olay kaydı ayarları
+TRANSCRIPT_DIR = os.getenv('TRANSCRIPT_DIR', 'transcripts')
+TRANSCRIPT_SEGMENT_BYTES = int(os.getenv('TRANSCRIPT_SEGMENT_BYTES', 64 * 1024 * 1024))
+TRANSCRIPT_QUEUE_SIZE = int(os.getenv('TRANSCRIPT_QUEUE_SIZE', 100000))  # Kuyrukta bekleyebilecek en fazla kayıt
+TRANSCRIPT_FLUSH_INTERVAL = float(os.getenv('TRANSCRIPT_FLUSH_INTERVAL', 0.5))
+TRANSCRIPT_BATCH_SIZE = 2000
+TRANSCRIBE_USER_AUDIO = os.getenv('TRANSCRIBE_USER_AUDIO', 'true').lower() == 'true'
+# Arama ses kaydı (QA ve gecikme analizi için, varsayılan kapalı)
+RECORDING_ENABLED = os.getenv('RECORDING_ENABLED', 'false').lower() == 'true'
+RECORDING_DIR = os.getenv('RECORDING_DIR', 'recordings')
+RECORDING_FORMAT = os.getenv('RECORDING_FORMAT', 'wav')  # "wav": stereo (sol arayan, sağ asistan), "raw": kanal başına .ulaw
+RECORDING_BUFFER_CHUNKS = int(os.getenv('RECORDING_BUFFER_CHUNKS', 2000))  # Arama başına yazılmayı bekleyen en fazla parça
+RECORDING_FLUSH_INTERVAL = float(os.getenv('RECORDING_FLUSH_INTERVAL', 1.0))
+# Yapılandırılmış log ayarları
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'info')
+LOG_FILE = os.getenv('LOG_FILE')  # Boşsa stdout'a yazılır
+LOG_BUFFER_SIZE = int(os.getenv('LOG_BUFFER_SIZE', 10000))  # Halka tampondaki en fazla kayıt
+LOG_MAX_FIELD_CHARS = int(os.getenv('LOG_MAX_FIELD_CHARS', 1000))  # Alan başına kesme sınırı
+LOG_FLUSH_INTERVAL = 0.1
+# Olay tipine göre örnekleme: "tip=N" her N kayıttan birini yazar
+LOG_SAMPLE_EVERY = os.getenv('LOG_SAMPLE_EVERY', 'rate_limits.updated=10')
+LOG_LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+# session.update payload önbelleği ve harici prompt dosyası ayarları
+PROMPT_FILE = os.getenv('PROMPT_FILE')  # {"tr": {"system_message": "..."}, ...} biçiminde JSON
+PROMPT_CHECK_INTERVAL = 5.0  # Prompt dosyası değişikliğinin en sık kontrol aralığı (sn)
+# Önceden üretilmiş sabit ifade sesleri: {PHRASE_AUDIO_DIR}/{dil}/{ses}/{ifade}.ulaw (8 kHz ham μ-law)
+PHRASE_AUDIO_DIR = os.getenv('PHRASE_AUDIO_DIR', 'phrases')
+PHRASE_CACHE_SIZE = int(os.getenv('PHRASE_CACHE_SIZE', 128))  # Açık tutulan en fazla klip (LRU)
+PHRASE_CHUNK_MS = 100  # Twilio'ya gönderilen media mesajı başına ses
+GREETING_ITEM_ID = "local-greeting"  # Önbellekten çalınan karşılamanın oynatma takibindeki öğe kimliği (sunucuda yok)
+PLAY_GREETING = os.getenv('PLAY_GREETING', 'true').lower() == 'true'  # Klip varsa stream başında karşılama çal
+GOODBYE_TIMEOUT = 15.0  # Veda sesinin üretilip oynatılması için en uzun bekleme (sn)
+SESSION_PAYLOAD_CACHE_SIZE = int(os.getenv('SESSION_PAYLOAD_CACHE_SIZE', 64))  # Dinamik diller için LRU sınırı
+TURN_DETECTION_PROFILE = os.getenv('TURN_DETECTION_PROFILE', 'server_vad')
+TURN_DETECTION_PROFILES = {
+    'server_vad': {
+        "type": "server_vad",
+        "threshold": 0.1,
+        "silence_duration_ms": 10,
+        "prefix_padding_ms": 11,
+        "create_response": True,
+        "interrupt_response": True
+    },
+    'local_vad': None,  # Tur sonu ve söz kesme yerel VAD ile algılanır, sunucu VAD'ı kapalı
+}
+# Yerel VAD: μ-law frame'lerinden enerji ve sıfır geçiş oranıyla konuşma algılama (numpy gerekir).
+# numpy burada import edilmez, yalnızca kurulu olup olmadığına bakılır; yoksa sunucu VAD'ı kullanılır ve
+# açılışta uyarı loglanır
+LOCAL_VAD_REQUESTED = os.getenv('LOCAL_VAD', 'false').lower() == 'true'
+LOCAL_VAD = LOCAL_VAD_REQUESTED and importlib.util.find_spec('numpy') is not None
+LOCAL_VAD_BATCH_FRAMES = int(os.getenv('LOCAL_VAD_BATCH_FRAMES', 3))  # Birlikte işlenen 20 ms'lik frame sayısı
+LOCAL_VAD_MARGIN_DB = float(os.getenv('LOCAL_VAD_MARGIN_DB', 12))  # Gürültü tabanının üstünde konuşma eşiği
+LOCAL_VAD_MIN_DBFS = float(os.getenv('LOCAL_VAD_MIN_DBFS', -45))  # Konuşma sayılacak en düşük seviye
+LOCAL_VAD_MAX_ZCR = float(os.getenv('LOCAL_VAD_MAX_ZCR', 0.45))  # Üstü gürültü/tıslama sayılır
+LOCAL_VAD_START_MS = int(os.getenv('LOCAL_VAD_START_MS', 60))  # Konuşma başlangıcı için gereken sürekli ses
+LOCAL_VAD_HANGOVER_MS = int(os.getenv('LOCAL_VAD_HANGOVER_MS', 500))  # Tur sonu için gereken sessizlik
+if LOCAL_VAD:
+    TURN_DETECTION_PROFILE = 'local_vad'
+# Transkript deposuna yazılan Realtime olayları
+RECORDED_EVENT_TYPES = {
+    'response.audio_transcript.done': 'assistant',
+    'conversation.item.input_audio_transcription.completed': 'user',
+    'input_audio_buffer.speech_started': None,
+    'input_audio_buffer.speech_stopped': None,
+    'input_audio_buffer.committed': None,
+    'response.done': None,
+    'error': None,
+}
 
 
 
 # Available OpenAI voicesa
 AVAILABLE_VOICES = ['alloy', 'echo', 'sage']
-TOKEN_TRACKING = {}
+SUPPORTED_VOICES = ["alloy", "echo", "shimmer", "coral", "sage", "ballad", "ash", "verse"]
 LOG_EVENT_TYPES = [
     'error', 'response.content.done', 'rate_limits.updated',
     'response.done', 'input_audio_buffer.committed',
@@ -56,110 +309,1832 @@ LOG_EVENT_TYPES = [
     'session.created'
 ]
 SHOW_TIMING_MATH = False
+# Ses payload'larını decode/encode etmeden, hazır şablonlarla aktaran hızlı relay modu
+FAST_RELAY = os.getenv('FAST_RELAY', 'true').lower() == 'true'
+# Gelen Twilio frame'lerini birleştirme penceresi (ms) ve bayt eşiği; 0 = kapalı
+AUDIO_BATCH_MS = int(os.getenv('AUDIO_BATCH_MS', 0))
+AUDIO_BATCH_MAX_BYTES = int(os.getenv('AUDIO_BATCH_MAX_BYTES', 0))
+ULAW_BYTES_PER_MS = 8  # 8 kHz μ-law, örnek başına 1 bayt
+MARK_INTERVAL_MS = float(os.getenv('MARK_INTERVAL_MS', 250))  # Twilio mark'ları arasındaki en az ses süresi
+# Twilio'ya giden sesi gerçek zamanlı hızda gönderen pacer ayarları
+PACER_ENABLED = os.getenv('PACER_ENABLED', 'false').lower() == 'true'
+PACER_FRAME_MS = 20
+PACER_LEAD_MS = float(os.getenv('PACER_LEAD_MS', 200))  # Twilio'nun oynatmanın önünde tutulacağı en fazla ses
+PACER_MAX_BUFFER_MS = float(os.getenv('PACER_MAX_BUFFER_MS', 30000))  # Aşılırsa üretici bekletilir
+# Arama başlatılırken OpenAI Realtime oturumunu önceden açma ayarları
+REALTIME_URL = os.getenv('REALTIME_URL', 'wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01')
+REALTIME_PREWARM = os.getenv('REALTIME_PREWARM', 'true').lower() == 'true'
+REALTIME_WARM_POOL_SIZE = int(os.getenv('REALTIME_WARM_POOL_SIZE', 1))  # Dil/ses başına hazır bekleyen oturum
+REALTIME_IDLE_TIMEOUT = float(os.getenv('REALTIME_IDLE_TIMEOUT', 60))  # Kullanılmayan oturumun kapatılma süresi (sn)
+# Görüşme sırasında kopan Realtime bağlantısını yeniden kurma ayarları
+REALTIME_RECONNECT = os.getenv('REALTIME_RECONNECT', 'true').lower() == 'true'
+REALTIME_RECONNECT_ATTEMPTS = int(os.getenv('REALTIME_RECONNECT_ATTEMPTS', 3))
+REALTIME_RECONNECT_BACKOFF = float(os.getenv('REALTIME_RECONNECT_BACKOFF', 0.25))  # İlk tekrar beklemesi (sn), her denemede iki katına çıkar
+REALTIME_RECONNECT_BUFFER_MS = float(os.getenv('REALTIME_RECONNECT_BUFFER_MS', 5000))  # Kopukluk sırasında tutulan en fazla arayan sesi
+REALTIME_REPLAY_TURNS = int(os.getenv('REALTIME_REPLAY_TURNS', 10))  # Yeni oturuma aktarılan son konuşma turu sayısı
+REALTIME_REPLAY_MESSAGE_BYTES = 16000  # Tampondaki ses en fazla 2 sn'lik append mesajlarıyla gönderilir
+CALL_TEARDOWN_TIMEOUT = float(os.getenv('CALL_TEARDOWN_TIMEOUT', 5))  # İptal edilen arama görevlerinin bitmesi için beklenen süre (sn)
+# Giden arama motoru ayarları
+DIAL_WORKERS = int(os.getenv('DIAL_WORKERS', 4))
+DIAL_QUEUE_SIZE = int(os.getenv('DIAL_QUEUE_SIZE', 1000))
+DIAL_CALLS_PER_SECOND = float(os.getenv('DIAL_CALLS_PER_SECOND', 1))
+# /make_call'un kuyruktaki aramanın başlamasını bekleyeceği en uzun süre (sn); aşılırsa arama iptal edilir.
+# Arayüzün okuma zaman aşımından (30 sn) kısa tutulur ki vazgeçilmiş bir istek sonradan telefonu çaldırmasın
+DIAL_REQUEST_TIMEOUT = float(os.getenv('DIAL_REQUEST_TIMEOUT', 20))
+CAMPAIGN_HISTORY_SIZE = 100  # Bellekte tutulan kampanya sayısı
+DIAL_PRIORITY_INTERACTIVE = 0  # /make_call ile başlatılan tekil aramalar kampanya kuyruğunun önüne geçer
+DIAL_PRIORITY_CAMPAIGN = 1
+# Kabul kontrolü: aşırı yükte canlı aramaları korumak için yeni aramalar reddedilir/bekletilir (0 = sınırsız)
+ADMISSION_MAX_SESSIONS = int(os.getenv('ADMISSION_MAX_SESSIONS', 50))
+ADMISSION_MAX_LOOP_LAG_MS = float(os.getenv('ADMISSION_MAX_LOOP_LAG_MS', 50))  # Yumuşatılmış event loop gecikmesi
+ADMISSION_RESERVATION_TTL = float(os.getenv('ADMISSION_RESERVATION_TTL', 60))  # Kabul edilip stream'i bağlanmayan aramanın yer tutma süresi (sn)
+ADMISSION_LAG_SMOOTHING = 0.3  # Gecikme örnekleri için EWMA katsayısı
+ADMISSION_RETRY_AFTER = 5  # Reddedilen HTTP isteklerine önerilen bekleme (sn)
+
+@asynccontextmanager
+async def lifespan(app):
+    warmup()
+    lag_task = asyncio.ensure_future(monitor_event_loop_lag())
+    try:
+        yield
+    finally:
+        lag_task.cancel()
+
+# Route tablosu: handler'lar import sırasında yalnızca buraya eklenir, FastAPI uygulamasına create_app() bağlar
+ROUTES = []  # (tür, path, handler, seçenekler)
+
+def route(path: str, methods=("GET",), **options):
+    def register(endpoint):
+        ROUTES.append(("http", path, endpoint, dict(options, methods=list(methods))))
+        return endpoint
+    return register
+
+def websocket_route(path: str):
+    def register(endpoint):
+        ROUTES.append(("websocket", path, endpoint, {}))
+        return endpoint
+    return register
+
+def create_app():
+    """Uygulama fabrikası: uvicorn --factory save:create_app veya save.app ile kullanılır"""
+    if not OPENAI_API_KEY:
+        raise ValueError('Missing the OpenAI API key. Please set it in the .env file.')
+    from fastapi import FastAPI
+    application = FastAPI(lifespan=lifespan)
+    for kind, path, endpoint, options in ROUTES:
+        if kind == "websocket":
+            application.add_api_websocket_route(path, endpoint)
+        else:
+            application.add_api_route(path, endpoint, **options)
+    return application
+
+def __getattr__(name: str):
+    # "uvicorn save:app" ile uyumluluk: uygulama ilk erişimde oluşturulur
+    if name == "app":
+        application = globals()["app"] = create_app()
+        return application
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+@functools.lru_cache(maxsize=None)
+def get_twilio_client():
+    from twilio.rest import Client
+    return Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+
+@functools.lru_cache(maxsize=None)
+def get_numpy():
+    import numpy
+    return numpy
+
+def warmup():
+    """Ağır import'ları, Twilio istemcisini ve prompt/session.update önbelleğini ilk istekten önce hazırlar"""
+    started = time.perf_counter()
+    if LOCAL_VAD:
+        LocalVAD.prepare()  # numpy import'u ve çözme tablosu ilk aramaya kalmasın
+    elif LOCAL_VAD_REQUESTED:
+        log("LOCAL_VAD=true but numpy is not installed, falling back to server VAD", level="warning",
+            turn_detection=TURN_DETECTION_PROFILE)
+    import websockets  # noqa: F401
+    import twilio.twiml.voice_response  # noqa: F401
+    get_twilio_client()
+    session_payloads.warm(SUPPORTED_VOICES, TURN_DETECTION_PROFILE)
+    STARTUP_WARMUP_SECONDS.set(time.perf_counter() - started)
+
+# Hızlı JSON codec (orjson varsa onu kullanır)
+if orjson is not None:
+    def json_loads(data):
+        return orjson.loads(data)
+
+    def json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode('utf-8')
+else:
+    json_loads = json.loads
+    json_dumps = functools.partial(json.dumps, separators=(',', ':'), ensure_ascii=False)
+
+# Relay event loop'unu bloklamayan, örneklemeli yapılandırılmış logger.
+# Kayıtlar sınırlı bir halka tampona eklenir ve arka plan thread'inde JSON satırı olarak yazılır.
+class EventLogger:
+    def __init__(self, capacity: int, level: str, sample_every: dict, max_field_chars: int, path: str = None):
+        self.capacity = capacity
+        self.min_level = LOG_LEVELS.get(level, LOG_LEVELS['info'])
+        self.sample_every = sample_every
+        self.sample_counts = {}
+        self.max_field_chars = max_field_chars
+        self.path = path
+        self.buffer = deque()
+        self.dropped = 0
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def log(self, message: str, level: str = 'info', sample_key: str = None, **fields):
+        """Kaydı tampona ekler; seviye altındaki, örneklemede elenen veya tampon doluysa düşen kayıtlar yazılmaz"""
+        if LOG_LEVELS.get(level, 20) < self.min_level:
+            return
+        if sample_key is not None:
+            every = self.sample_every.get(sample_key)
+            if every:
+                count = self.sample_counts.get(sample_key, 0)
+                self.sample_counts[sample_key] = count + 1
+                if count % every:
+                    return
+        if len(self.buffer) >= self.capacity:
+            self.dropped += 1
+            LOG_DROPPED.inc()
+            return
+        if self.thread is None:
+            self._start()
+        self.buffer.append((time.time(), level, message, fields))
+
+    def close(self):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def _start(self):
+        self.thread = threading.Thread(target=self._run, name="event-logger", daemon=True)
+        self.thread.start()
+
+    def _format_field(self, value):
+        if isinstance(value, str):
+            text = value
+        elif isinstance(value, (int, float, bool)) or value is None:
+            return value
+        else:
+            try:
+                text = json_dumps(value)
+            except TypeError:
+                text = str(value)
+            if len(text) <= self.max_field_chars:
+                return value
+        if len(text) > self.max_field_chars:
+            return text[:self.max_field_chars] + f"...(+{len(text) - self.max_field_chars} chars)"
+        return text
+
+    def _write_pending(self, output):
+        lines = []
+        while self.buffer:
+            ts, level, message, fields = self.buffer.popleft()
+            record = {"ts": round(ts, 6), "level": level, "message": message}
+            for key, value in fields.items():
+                record[key] = self._format_field(value)
+            try:
+                lines.append(json_dumps(record))
+            except TypeError:
+                lines.append(json_dumps({"ts": record["ts"], "level": level, "message": message}))
+        if lines:
+            output.write("\n".join(lines) + "\n")
+            output.flush()
+
+    def _run(self):
+        output = open(self.path, 'a', encoding='utf-8') if self.path else sys.stdout
+        try:
+            while not self.stop_event.wait(LOG_FLUSH_INTERVAL):
+                self._write_pending(output)
+            self._write_pending(output)
+        finally:
+            if self.path:
+                output.close()
+
+def parse_sample_every(spec: str) -> dict:
+    sample_every = {}
+    for item in spec.split(','):
+        if '=' in item:
+            event_type, every = item.split('=', 1)
+            sample_every[event_type.strip()] = max(1, int(every))
+    return sample_every
+
+LOG_DROPPED = metrics.counter("log_records_dropped_total", "Log records dropped because the ring buffer was full")
+event_logger = EventLogger(LOG_BUFFER_SIZE, LOG_LEVEL, parse_sample_every(LOG_SAMPLE_EVERY), LOG_MAX_FIELD_CHARS, LOG_FILE)
+log = event_logger.log
+atexit.register(event_logger.close)
+
+# Hazır mesaj şablonları: base64 alfabesi JSON kaçışı gerektirmediği için
+# payload string'i olduğu gibi şablonun içine yerleştirilebilir.
+OPENAI_AUDIO_APPEND_PREFIX = '{"type":"input_audio_buffer.append","audio":"'
+OPENAI_AUDIO_APPEND_SUFFIX = '"}'
+TWILIO_MEDIA_SUFFIX = '"}}'
+
+TWILIO_MARK_SUFFIX = '"}}'
+
+def build_twilio_templates(stream_sid: str):
+    """Stream için media ve mark mesaj öneklerini bir kez oluşturur"""
+    media_prefix = '{"event":"media","streamSid":"' + stream_sid + '","media":{"payload":"'
+    mark_prefix = '{"event":"mark","streamSid":"' + stream_sid + '","mark":{"name":"'
+    return media_prefix, mark_prefix
+
+# orjson küçük Twilio frame'lerini iki alan taramasından daha hızlı ayrıştırır;
+# media olayları için EventDispatcher hızlı yolu yalnızca standart json ile kazanç sağlar
+TWILIO_MEDIA_FAST_PATH = orjson is None
+
+async def relay_inbound_audio(openai_ws, payload: str, audio_batcher=None):
+    """Arayan sesini Realtime'a iletir; toplayıcı varsa mesaj yalnızca pencere dolduğunda gönderilir"""
+    if audio_batcher is not None:
+        batched_message = audio_batcher.add(payload)
+        if batched_message:
+            await openai_ws.send(batched_message)
+    elif FAST_RELAY:
+        await openai_ws.send(OPENAI_AUDIO_APPEND_PREFIX + payload + OPENAI_AUDIO_APPEND_SUFFIX)
+    else:
+        audio_append = {
+            "type": "input_audio_buffer.append",
+            "audio": payload
+        }
+        await openai_ws.send(json.dumps(audio_append))
+
+async def relay_outbound_audio(websocket, stream_sid: str, media_prefix: str, delta: str, pacer=None):
+    """Asistan sesini Twilio'ya iletir: pacer üzerinden, hazır media metniyle ya da FAST_RELAY kapalıysa json ile"""
+    if pacer is not None:
+        await pacer.put_audio(delta)
+    elif FAST_RELAY and media_prefix:
+        await websocket.send_text(media_prefix + delta + TWILIO_MEDIA_SUFFIX)
+    else:
+        audio_payload = base64.b64encode(base64.b64decode(delta)).decode('utf-8')
+        audio_delta = {
+            "event": "media",
+            "streamSid": stream_sid,
+            "media": {
+                "payload": audio_payload
+            }
+        }
+        await websocket.send_json(audio_delta)
+
+def ulaw_ms_from_base64(payload: str) -> float:
+    """Base64 μ-law payload'ının süresini decode etmeden hesaplar"""
+    size = len(payload) * 3 // 4
+    if payload.endswith('=='):
+        size -= 2
+    elif payload.endswith('='):
+        size -= 1
+    return size / ULAW_BYTES_PER_MS
+
+def peek_json_string(message: str, field: str):
+    """
+    Alanın düz string değerini tam ayrıştırma yapmadan okur
+    Returns:
+        str | None: Değer; alan yoksa, string değilse veya kaçış karakteri içeriyorsa None
+    """
+    # Twilio ve OpenAI kompakt JSON gönderir: "alan":"değer"
+    compact = '"' + field + '":"'
+    index = message.find(compact)
+    if index >= 0:
+        index += len(compact)
+    else:
+        # Kompakt olmayan JSON: ':' çevresindeki boşlukları atla
+        marker = '"' + field + '"'
+        index = message.find(marker)
+        if index < 0:
+            return None
+        index += len(marker)
+        colon = message.find(':', index)
+        if colon < 0 or message[index:colon].strip():
+            return None
+        index = colon + 1
+        while message[index:index + 1] in (' ', '\t', '\r', '\n'):
+            index += 1
+        if message[index:index + 1] != '"':
+            return None
+        index += 1
+    end = message.find('"', index)
+    if end < 0 or message.find('\\', index, end) >= 0:
+        return None
+    return message[index:end]
+
+# Olay tipine göre handler tablosu. Hızlı yola kaydedilen tipler (ses frame'leri) mesajın ilk
+# alanından tanınır ve yalnızca gereken alanlar çıkarılarak tam json ayrıştırması yapılmadan işlenir.
+class EventDispatcher:
+    def __init__(self, type_key: str):
+        self.type_key = type_key
+        self.handlers = {}  # tip -> [async handler(event)]
+        self.fast_handlers = []  # [(mesaj öneki, tip, alan adları, async handler(*değerler))]
+
+    def on(self, event_types, handler):
+        """Handler'ı bir veya birden çok olay tipine kaydeder"""
+        if isinstance(event_types, str):
+            event_types = (event_types,)
+        for event_type in event_types:
+            self.handlers.setdefault(event_type, []).append(handler)
+
+    def on_fast(self, event_type: str, fields, handler):
+        """
+        Olayın yalnızca verilen düz string alanlarıyla işlenebildiği hızlı yolu kaydeder.
+        Twilio ve OpenAI tip alanını mesajın başında gönderdiği için tip, kompakt önekle tanınır;
+        önek tutmazsa veya alanlardan biri okunamazsa olay tam ayrıştırılıp normal handler'lara gider
+        """
+        prefix = '{"' + self.type_key + '":"' + event_type + '"'
+        self.fast_handlers.append((prefix, event_type, tuple(fields), handler))
+
+    async def dispatch(self, message: str):
+        """Mesajı işler ve olay tipini döner"""
+        for prefix, event_type, fields, handler in self.fast_handlers:
+            if message.startswith(prefix):
+                values = [peek_json_string(message, field) for field in fields]
+                if None not in values:
+                    await handler(*values)
+                    return event_type
+                break
+        event = json_loads(message)
+        event_type = event.get(self.type_key)
+        for handler in self.handlers.get(event_type, ()):
+            await handler(event)
+        return event_type
+
+# Twilio'ya gönderilen asistan sesinin oynatma konumunu izler; mark'ları belirli aralıklarla birleştirir
+class PlaybackTracker:
+    __slots__ = ('mark_interval_ms', 'item_sent_ms', 'item_marked_ms', 'pending_marks', 'mark_seq')
+
+    def __init__(self, mark_interval_ms: float):
+        self.mark_interval_ms = mark_interval_ms
+        self.item_sent_ms = 0.0  # Mevcut asistan öğesi için gönderilen toplam ses (ms)
+        self.item_marked_ms = 0.0
+        self.pending_marks = deque()  # Twilio'nun henüz oynatıp geri bildirmediği mark isimleri
+        self.mark_seq = 0
+
+    def start_item(self):
+        """Yeni bir asistan öğesi için ses sayaçlarını sıfırlar"""
+        self.item_sent_ms = 0.0
+        self.item_marked_ms = 0.0
+
+    def add_audio(self, payload: str):
+        """
+        Gönderilen ses parçasını kaydeder
+        Returns:
+            str | None: Mark aralığı dolduysa gönderilecek mark ismi
+        """
+        self.item_sent_ms += ulaw_ms_from_base64(payload)
+        if self.item_sent_ms - self.item_marked_ms >= self.mark_interval_ms:
+            return self.next_mark()
+        return None
+
+    def next_mark(self):
+        """İşaretlenmemiş ses varsa yeni bir mark ismi üretir ve bekleyenlere ekler"""
+        if self.item_sent_ms <= self.item_marked_ms:
+            return None
+        self.item_marked_ms = self.item_sent_ms
+        self.mark_seq += 1
+        name = f"pb{self.mark_seq}"
+        self.pending_marks.append(name)
+        return name
+
+    def on_mark(self, name: str):
+        """Twilio bir mark'a kadar oynattığında çağrılır"""
+        while self.pending_marks:
+            if self.pending_marks.popleft() == name:
+                break
+
+    def has_pending_audio(self) -> bool:
+        return bool(self.pending_marks) or self.item_sent_ms > self.item_marked_ms
+
+    def played_ms(self, elapsed_ms: float) -> int:
+        """Twilio zaman damgalarına göre geçen süreyi gönderilen sesle sınırlayarak oynatılan konumu döner"""
+        return int(max(0.0, min(elapsed_ms, self.item_sent_ms)))
+
+    def clear(self):
+        self.pending_marks.clear()
+        self.start_item()
+
+# Asistan sesini 20 ms'lik frame'lere bölüp gerçek zamanlı takvimle Twilio'ya gönderen pacer.
+# Twilio tarafında en fazla lead_ms ses birikir; böylece barge-in'de atılan ses sınırlı kalır.
+class OutboundPacer:
+    def __init__(self, send_text, media_prefix: str, mark_prefix: str, lead_ms: float, max_buffer_ms: float):
+        self.send_text = send_text
+        self.media_prefix = media_prefix
+        self.mark_prefix = mark_prefix
+        self.lead = lead_ms / 1000
+        self.max_buffer_ms = max_buffer_ms
+        self.frame_bytes = PACER_FRAME_MS * ULAW_BYTES_PER_MS
+        self.entries = deque()  # ('audio', bytes) veya ('mark', isim)
+        self.tail = bytearray()  # Henüz tam frame olmayan ses
+        self.buffered_bytes = 0
+        self.play_clock = 0.0  # Twilio'nun gönderilen sesi bitireceği tahmini loop zamanı
+        self.data_ready = asyncio.Event()
+        self.space_ready = asyncio.Event()
+        self.space_ready.set()
+        self.task = None
+
+    def start(self, spawn):
+        """Gönderim görevini spawn(coro, isim) ile başlatır; görevin ömrü ve hataları spawn'ın sahibindedir"""
+        self.task = spawn(self._run(), "outbound_pacer")
+
+    async def stop(self):
+        """Gönderim görevi hâlâ çalışıyorsa durdurur; hatayla bittiyse hatayı kaydedip yutar"""
+        task, self.task = self.task, None
+        if task is None or task.done():  # Bitmiş görevin sonucu sahibi (CallSupervisor) tarafından okundu
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:  # Twilio websocket'i gönderim sırasında kapanmış olabilir
+            metrics.counter("call_task_failures_total", "Per-call tasks that ended with an unhandled exception",
+                            task="outbound_pacer").inc()
+            log("Outbound pacer failed", level="error", error=repr(e))
+
+    async def put_audio(self, payload: str):
+        """Ses parçasını frame'lere böler; tampon sınırı aşıldıysa yer açılana kadar bekler"""
+        while self.buffered_bytes / ULAW_BYTES_PER_MS >= self.max_buffer_ms:
+            self.space_ready.clear()
+            await self.space_ready.wait()
+        self.tail += base64.b64decode(payload)
+        frame_bytes = self.frame_bytes
+        while len(self.tail) >= frame_bytes:
+            self.entries.append(('audio', bytes(self.tail[:frame_bytes])))
+            del self.tail[:frame_bytes]
+            self.buffered_bytes += frame_bytes
+        self.data_ready.set()
+
+    def put_mark(self, name: str):
+        """Mark'ı kendisinden önceki sesten sonra gönderilecek şekilde sıraya ekler"""
+        self._flush_tail()
+        self.entries.append(('mark', name))
+        self.data_ready.set()
+
+    def clear(self):
+        """
+        Gönderilmemiş sesi atar
+        Returns:
+            tuple: (pacer tamponunda atılan ms, Twilio'da oynatılmadan kalan tahmini ms)
+        """
+        now = asyncio.get_running_loop().time()
+        discarded_buffer_ms = (self.buffered_bytes + len(self.tail)) / ULAW_BYTES_PER_MS
+        discarded_twilio_ms = max(0.0, self.play_clock - now) * 1000
+        self.entries.clear()
+        self.tail.clear()
+        self.buffered_bytes = 0
+        self.play_clock = now
+        self.space_ready.set()
+        return discarded_buffer_ms, discarded_twilio_ms
+
+    def _flush_tail(self):
+        if self.tail:
+            self.entries.append(('audio', bytes(self.tail)))
+            self.buffered_bytes += len(self.tail)
+            self.tail.clear()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self.entries:
+                self.data_ready.clear()
+                await self.data_ready.wait()
+                continue
+            kind, value = self.entries[0]
+            if kind == 'mark':
+                self.entries.popleft()
+                await self.send_text(self.mark_prefix + value + TWILIO_MARK_SUFFIX)
+                continue
+            now = loop.time()
+            if self.play_clock < now:
+                self.play_clock = now
+            wait = self.play_clock - self.lead - now
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            self.entries.popleft()
+            self.buffered_bytes -= len(value)
+            self.play_clock += len(value) / ULAW_BYTES_PER_MS / 1000
+            self.space_ready.set()
+            await self.send_text(self.media_prefix + base64.b64encode(value).decode('ascii') + TWILIO_MEDIA_SUFFIX)
+
+def build_ulaw_decode_table():
+    """G.711 μ-law bayt -> doğrusal PCM örneği tablosu (256 eleman)"""
+    np = get_numpy()
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    magnitude = (((codes & 0x0F) << 3) + 0x84 << ((codes >> 4) & 0x07)) - 0x84
+    return np.where(codes & 0x80, -magnitude, magnitude).astype(np.float32)
+
+# Twilio'dan gelen μ-law sesinde konuşma başlangıcı ve bitişini yerel olarak algılar.
+# Frame'ler toplu halde tablo ile çözülür; enerji ve sıfır geçiş oranı vektörel hesaplanır.
+class LocalVAD:
+    FRAME_BYTES = 160  # 20 ms
+    decode_table = None
+
+    @classmethod
+    def prepare(cls):
+        """numpy'ı import eder ve tüm aramaların paylaştığı çözme tablosunu bir kez oluşturur"""
+        if cls.decode_table is None:
+            cls.decode_table = build_ulaw_decode_table()
+
+    def __init__(self, batch_frames: int, margin_db: float, min_dbfs: float, max_zcr: float,
+                 start_ms: int, hangover_ms: int):
+        self.prepare()
+        self.np = get_numpy()
+        self.batch_bytes = max(1, batch_frames) * self.FRAME_BYTES
+        self.margin_db = margin_db
+        self.min_dbfs = min_dbfs
+        self.max_zcr = max_zcr
+        self.start_frames = max(1, start_ms // 20)
+        self.hangover_frames = max(1, hangover_ms // 20)
+        self.pending = bytearray()
+        self.noise_floor_db = -60.0
+        self.speaking = False
+        self.run_length = 0  # Mevcut durumun tersini gösteren ardışık frame sayısı
+
+    def add(self, payload: str):
+        """
+        Base64 μ-law payload'ını ekler
+        Returns:
+            list: Bu partide oluşan 'speech_started' / 'speech_stopped' olayları
+        """
+        self.pending += base64.b64decode(payload)
+        if len(self.pending) < self.batch_bytes:
+            return []
+        usable = len(self.pending) - len(self.pending) % self.FRAME_BYTES
+        np = self.np
+        codes = np.frombuffer(self.pending, dtype=np.uint8, count=usable)
+        samples = self.decode_table[codes].reshape(-1, self.FRAME_BYTES)
+        del codes  # Tamponu küçültmeden önce numpy görünümünü bırak
+        del self.pending[:usable]
+
+        energy_db = 10 * np.log10(np.einsum('ij,ij->i', samples, samples) / self.FRAME_BYTES + 1.0) - 90.3  # dBFS
+        signs = np.signbit(samples)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (self.FRAME_BYTES - 1)
+        return self._update(energy_db.tolist(), zcr.tolist())
+
+    def _update(self, energy_db, zcr):
+        events = []
+        for level, crossings in zip(energy_db, zcr):
+            voiced = level > max(self.noise_floor_db + self.margin_db, self.min_dbfs) and crossings < self.max_zcr
+            if not voiced:
+                # Gürültü tabanı yalnızca konuşma olmayan frame'lerden öğrenilir
+                self.noise_floor_db += (level - self.noise_floor_db) * 0.05
+            if voiced != self.speaking:
+                self.run_length += 1
+                if self.run_length >= (self.hangover_frames if self.speaking else self.start_frames):
+                    self.speaking = voiced
+                    self.run_length = 0
+                    events.append('speech_started' if voiced else 'speech_stopped')
+            else:
+                self.run_length = 0
+        return events
+
+# Gelen ses frame'lerini toplu append mesajlarına dönüştüren sınıf
+class AudioBatcher:
+    def __init__(self, window_ms: int, max_bytes: int = 0):
+        limits = [limit for limit in (window_ms * ULAW_BYTES_PER_MS, max_bytes) if limit > 0]
+        self.threshold = min(limits) if limits else 0
+        self.buffer = bytearray()
+
+    def add(self, payload: str):
+        """
+        Frame'i tampona ekler, eşik aşıldıysa gönderilecek mesajı döner
+        Returns:
+            str | None: Hazır append mesajı veya henüz gönderilecek bir şey yoksa None
+        """
+        self.buffer += base64.b64decode(payload)
+        if len(self.buffer) >= self.threshold:
+            return self.flush()
+        return None
+
+    def flush(self):
+        """Tampondaki tüm sesi tek bir append mesajı olarak döner ve tamponu boşaltır"""
+        if not self.buffer:
+            return None
+        audio = base64.b64encode(self.buffer).decode('ascii')
+        self.buffer.clear()
+        return OPENAI_AUDIO_APPEND_PREFIX + audio + OPENAI_AUDIO_APPEND_SUFFIX
+
+    def take(self) -> bytes:
+        """Tampondaki ham sesi döner ve tamponu boşaltır"""
+        audio = bytes(self.buffer)
+        self.buffer.clear()
+        return audio
+
+# Realtime bağlantısı yeniden kurulurken gelen arayan sesini tutan halka tampon.
+# Sınır aşılırsa en eski frame'ler atılır; böylece kopukluk uzasa da bellek sınırlı kalır.
+class ReconnectAudioBuffer:
+    def __init__(self, max_ms: float):
+        self.max_bytes = int(max_ms * ULAW_BYTES_PER_MS)
+        self.frames = deque()  # (base64 payload, bayt)
+        self.size = 0
+        self.buffered_bytes = 0  # Son kopukluk boyunca gelen toplam ses
+        self.dropped_bytes = 0  # Sınır yüzünden atılan ses
+
+    def add(self, payload: str):
+        size = int(ulaw_ms_from_base64(payload) * ULAW_BYTES_PER_MS)
+        self.frames.append((payload, size))
+        self._grow(size)
+
+    def add_first(self, audio: bytes):
+        """Tampondaki frame'lerden önce gelen ham sesi (ör. toplayıcının gönderilmemiş penceresi) başa ekler"""
+        if audio:
+            self.frames.appendleft((base64.b64encode(audio).decode('ascii'), len(audio)))
+            self._grow(len(audio))
+
+    def _grow(self, size: int):
+        self.size += size
+        self.buffered_bytes += size
+        while self.size > self.max_bytes:
+            _, dropped = self.frames.popleft()
+            self.size -= dropped
+            self.dropped_bytes += dropped
+
+    def drain(self, message_bytes: int) -> list:
+        """Tampondaki sesi en fazla message_bytes'lık append mesajları olarak döner ve tamponu boşaltır"""
+        messages = []
+        audio = bytearray()
+        while self.frames:
+            audio += base64.b64decode(self.frames.popleft()[0])
+            if len(audio) >= message_bytes:
+                messages.append(OPENAI_AUDIO_APPEND_PREFIX + base64.b64encode(audio).decode('ascii')
+                                + OPENAI_AUDIO_APPEND_SUFFIX)
+                audio.clear()
+        if audio:
+            messages.append(OPENAI_AUDIO_APPEND_PREFIX + base64.b64encode(audio).decode('ascii')
+                            + OPENAI_AUDIO_APPEND_SUFFIX)
+        self.size = 0
+        return messages
+
+    def reset(self):
+        self.frames.clear()
+        self.size = 0
+        self.buffered_bytes = 0
+        self.dropped_bytes = 0
+
+# Polling yerine loop.call_at ile çalışan, yeniden kurulabilir son tarih zamanlayıcısı
+class DeadlineTimer:
+    def __init__(self, callback):
+        self.loop = asyncio.get_running_loop()
+        self.callback = callback
+        self.deadline = None
+        self.handle = None
+        self.handle_when = None
+
+    def arm(self, deadline: float):
+        """
+        Zamanlayıcıyı loop.time() cinsinden verilen son tarihe kurar.
+        Son tarih ileri alınıyorsa mevcut handle korunur ve tetiklendiğinde yeniden
+        planlanır; böylece her medya frame'i için yalnızca bir atama yapılır.
+        """
+        self.deadline = deadline
+        if self.handle is None or deadline < self.handle_when:
+            if self.handle is not None:
+                self.handle.cancel()
+            self._schedule(deadline)
+
+    def cancel(self):
+        self.deadline = None
+        if self.handle is not None:
+            self.handle.cancel()
+            self.handle = None
+
+    def _schedule(self, when: float):
+        self.handle_when = when
+        self.handle = self.loop.call_at(when, self._fire)
+
+    def _fire(self):
+        self.handle = None
+        if self.deadline is None:
+            return
+        if self.deadline > self.handle_when:
+            self._schedule(self.deadline)
+            return
+        self.deadline = None
+        self.callback()
+
+# Bir aramanın görevlerini birlikte yöneten denetçi: bir bacak biter ya da hata verirse kalanlar iptal edilir
+class CallSupervisor:
+    leaked = set()  # İptal edildiği halde süresi içinde bitmeyen görevler (tüm aramalar)
+
+    def __init__(self, call_id: str, teardown_timeout: float):
+        self.call_id = call_id
+        self.teardown_timeout = teardown_timeout
+        self.tasks = set()
+
+    def spawn(self, coro, name: str) -> asyncio.Task:
+        """Görevi başlatır ve arama bitince iptal edilmek üzere kaydeder"""
+        task = asyncio.ensure_future(coro)
+        task.set_name(name)
+        self.tasks.add(task)
+        CALL_TASKS_LIVE.inc()
+        task.add_done_callback(self._task_done)
+        return task
+
+    async def run(self, legs: dict) -> str:
+        """Relay bacaklarını başlatır; herhangi biri bittiğinde ya da hata verdiğinde onun adını döner"""
+        tasks = [self.spawn(coro, name) for name, coro in legs.items()]
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        return next(iter(done)).get_name()
+
+    async def close(self):
+        """Kalan görevleri iptal eder ve bitmelerini bekler; süresinde bitmeyenler sızmış sayılır"""
+        pending = [task for task in self.tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        if not pending:
+            return
+        _, still_running = await asyncio.wait(pending, timeout=self.teardown_timeout)
+        for task in still_running:
+            CallSupervisor.leaked.add(task)
+            log("Call task did not stop after cancellation", level="warning", call=self.call_id, task=task.get_name())
+        CALL_TASKS_LEAKED.set(len(CallSupervisor.leaked))
+
+    def _task_done(self, task: asyncio.Task):
+        self.tasks.discard(task)
+        CALL_TASKS_LIVE.dec()
+        if task in CallSupervisor.leaked:
+            CallSupervisor.leaked.discard(task)
+            CALL_TASKS_LEAKED.set(len(CallSupervisor.leaked))
+        # Hata burada okunur; gather(return_exceptions=True) gibi sessizce yutulmaz
+        if not task.cancelled() and task.exception() is not None:
+            metrics.counter("call_task_failures_total", "Per-call tasks that ended with an unhandled exception",
+                            task=task.get_name()).inc()
+            log("Call task failed", level="error", call=self.call_id, task=task.get_name(), error=repr(task.exception()))
+
+def websocket_is_open(connection) -> bool:
+    """websockets kütüphanesinin eski (open) ve yeni (state) API'lerinde bağlantı durumunu döner"""
+    is_open = getattr(connection, 'open', None)
+    if is_open is not None:
+        return is_open
+    return connection.state.name == 'OPEN'
+
+async def connect_realtime(language: str, voice: str):
+    """OpenAI Realtime websocket'ini açar ve oturumu başlatır"""
+    import websockets
+    headers = {
+        "Authorization": f"Bearer {OPENAI_API_KEY}",
+        "OpenAI-Beta": "realtime=v1"
+    }
+    try:
+        openai_ws = await websockets.connect(REALTIME_URL, additional_headers=headers)
+    except TypeError:  # websockets < 14 (legacy istemci)
+        openai_ws = await websockets.connect(REALTIME_URL, extra_headers=headers)
+    try:
+        await initialize_session(openai_ws, language, voice)
+    except Exception:
+        await openai_ws.close()
+        raise
+    return openai_ws
+
+# Arama SID'sine göre ayrılmış, önceden bağlanmış Realtime oturumları havuzu
+class RealtimeSessionPool:
+    def __init__(self, warm_size: int, idle_timeout: float):
+        self.warm_size = warm_size
+        self.idle_timeout = idle_timeout
+        self.reserved = {}  # call_sid -> (key, task, eviction handle)
+        self.warm = {}  # (language, voice) -> [(task, eviction handle), ...]
+
+    def reserve(self, call_sid: str, language: str, voice: str):
+        """Arama için hazır bir oturum ayırır; havuzda yoksa bağlantıyı arka planda açar"""
+        key = (language, voice)
+        warm_entries = self.warm.get(key)
+        if warm_entries:
+            task, handle = warm_entries.pop()
+            handle.cancel()
+        else:
+            task = asyncio.ensure_future(connect_realtime(language, voice))
+        handle = asyncio.get_running_loop().call_later(self.idle_timeout, self._evict_reserved, call_sid)
+        self.reserved[call_sid] = (key, task, handle)
+        self._refill(key)
+
+    async def acquire(self, call_sid: str, language: str, voice: str):
+        """
+        Arama için ayrılmış oturumu devralır
+        Returns:
+            Açık ve başlatılmış websocket, ya da uygun oturum yoksa None
+        """
+        entry = self.reserved.pop(call_sid, None)
+        if entry is None:
+            return None
+        key, task, handle = entry
+        handle.cancel()
+        if key != (language, voice):
+            self._discard(task)
+            return None
+        try:
+            openai_ws = await task
+        except Exception as e:
+            log("Error opening pre-warmed realtime session", level="error", error=str(e))
+            return None
+        if not websocket_is_open(openai_ws):
+            return None
+        return openai_ws
+
+    def _refill(self, key):
+        warm_entries = self.warm.setdefault(key, [])
+        loop = asyncio.get_running_loop()
+        while len(warm_entries) < self.warm_size:
+            task = asyncio.ensure_future(connect_realtime(*key))
+            handle = loop.call_later(self.idle_timeout, self._evict_warm, key, task)
+            warm_entries.append((task, handle))
+
+    def _evict_reserved(self, call_sid: str):
+        entry = self.reserved.pop(call_sid, None)
+        if entry is not None:
+            log("Evicting unused realtime session", call_sid=call_sid)
+            self._discard(entry[1])
+
+    def _evict_warm(self, key, task):
+        warm_entries = self.warm.get(key, [])
+        for index, (warm_task, _) in enumerate(warm_entries):
+            if warm_task is task:
+                del warm_entries[index]
+                break
+        if not warm_entries:
+            self.warm.pop(key, None)
+        self._discard(task)
+
+    @staticmethod
+    def _discard(task):
+        if not task.done():
+            task.cancel()
+        elif not task.cancelled() and task.exception() is None:
+            asyncio.ensure_future(task.result().close())
+
+realtime_pool = RealtimeSessionPool(REALTIME_WARM_POOL_SIZE, REALTIME_IDLE_TIMEOUT)
+
+# Twilio REST çağrılarını event loop dışında, kuyruk ve hız limitiyle yapan arama motoru
+class DialingEngine:
+    def __init__(self, workers: int, queue_size: int, calls_per_second: float):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.interval = 1.0 / calls_per_second if calls_per_second > 0 else 0.0
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dialer")
+        self.queue = None
+        self.sequence = itertools.count()  # Aynı öncelikteki aramalar eklenme sırasıyla aranır
+        self.worker_tasks = []
+        self.next_slot = 0.0
+
+    def start(self):
+        if self.queue is None:
+            self.queue = asyncio.PriorityQueue(maxsize=self.queue_size)
+            self.worker_tasks = [asyncio.ensure_future(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, to_number: str, language: str, voice: str, on_status=None, priority: int = DIAL_PRIORITY_CAMPAIGN):
+        """
+        Aramayı kuyruğa ekler; düşük priority değerli aramalar önce aranır, hız limiti hepsi için geçerlidir
+        Returns:
+            asyncio.Future: Arama başlatıldığında Twilio call nesnesiyle tamamlanır
+        Raises:
+            asyncio.QueueFull: Kuyruk doluysa
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((priority, next(self.sequence), (to_number, language, voice, future, on_status)))
+        return future
+
+    async def run_blocking(self, func, *args, **kwargs):
+        """Bloklayan bir çağrıyı arama motorunun thread havuzunda çalıştırır"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def _wait_for_slot(self):
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        slot = max(now, self.next_slot)
+        self.next_slot = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    async def _worker(self):
+        while True:
+            _, _, (to_number, language, voice, future, on_status) = await self.queue.get()
+            try:
+                if future.cancelled():
+                    continue
+                # Kapasite yoksa arama kuyrukta bekletilir
+                reservation = uuid.uuid4().hex
+                if on_status and admission.rejection_reason():
+                    on_status("waiting_for_capacity")
+                await admission.wait_for_capacity(reservation)
+                await self._wait_for_slot()
+                if future.cancelled():  # İstek kapasite veya hız limiti beklenirken bırakıldı
+                    admission.release(reservation)
+                    continue
+                if on_status:
+                    on_status("dialing")
+                try:
+                    call = await place_call(to_number, language, voice)
+                except Exception:
+                    admission.release(reservation)
+                    raise
+                admission.rename(reservation, call.sid)
+                if not future.done():
+                    future.set_result(call)
+            except Exception as e:
+                log("Error dialing", level="error", to_number=to_number, error=str(e))
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.queue.task_done()
+
+# Aktif oturum, kabul edilmiş ama henüz bağlanmamış aramalar ve event loop gecikmesine göre
+# yeni aramaların kabul edilip edilmeyeceğine karar verir
+class AdmissionController:
+    def __init__(self, max_sessions: int, max_lag_ms: float, reservation_ttl: float):
+        self.max_sessions = max_sessions
+        self.max_lag = max_lag_ms / 1000
+        self.reservation_ttl = reservation_ttl
+        self.reservations = OrderedDict()  # call_sid veya geçici anahtar -> son geçerlilik (monotonic)
+        self.lag = 0.0
+        self.lag_shedding = False
+        self.capacity_changed = None  # asyncio.Event; kapasite bekleyen arama motoru için
+
+    def observe_lag(self, lag: float):
+        """Gecikme örneğini ekler; eşik aşılınca yeni aramalar reddedilir, yarısının altına inince tekrar kabul edilir"""
+        self.lag += (lag - self.lag) * ADMISSION_LAG_SMOOTHING
+        if self.max_lag:
+            if not self.lag_shedding and self.lag > self.max_lag:
+                self.lag_shedding = True
+                log("Event loop lag over admission limit, shedding new calls", level="warning",
+                    lag_ms=round(self.lag * 1000, 1))
+            elif self.lag_shedding and self.lag < self.max_lag / 2:
+                self.lag_shedding = False
+                self._notify()
+        self._expire()
+
+    def available(self) -> int:
+        """Yeni aramalar için kalan yer; sınır yoksa -1"""
+        if not self.max_sessions:
+            return -1
+        self._expire()
+        return max(0, self.max_sessions - ACTIVE_SESSIONS.value - len(self.reservations))
+
+    def rejection_reason(self):
+        if self.lag_shedding:
+            return "event_loop_lag"
+        if self.max_sessions and self.available() == 0:
+            return "max_sessions"
+        return None
+
+    def admit(self, key: str = None, endpoint: str = None):
+        """
+        Aramayı kabul etmeye çalışır; kabul edilirse key için stream bağlanana kadar yer ayırır
+        Returns:
+            str | None: Red sebebi veya kabul edildiyse None
+        """
+        if key is not None and key in self.reservations:
+            return None
+        reason = self.rejection_reason()
+        if reason is None:
+            if key is not None:
+                self.reservations[key] = time.monotonic() + self.reservation_ttl
+        elif endpoint:
+            metrics.counter("admission_rejections_total", "Calls refused by admission control",
+                            endpoint=endpoint, reason=reason).inc()
+        return reason
+
+    async def wait_for_capacity(self, key: str):
+        """Kapasite açılana kadar bekler ve key için yer ayırır"""
+        while self.admit(key) is not None:
+            if self.capacity_changed is None:
+                self.capacity_changed = asyncio.Event()
+            self.capacity_changed.clear()
+            await self.capacity_changed.wait()
+
+    def rename(self, old_key: str, new_key: str):
+        expires_at = self.reservations.pop(old_key, None)
+        if expires_at is not None:
+            self.reservations[new_key] = expires_at
+
+    def release(self, key: str):
+        if key is not None and self.reservations.pop(key, None) is not None:
+            self._notify()
+
+    def session_limit_reached(self) -> bool:
+        """Kabul kontrolünden geçmeden gelen stream'ler için kesin oturum sınırı"""
+        return bool(self.max_sessions) and ACTIVE_SESSIONS.value >= self.max_sessions
+
+    def session_ended(self):
+        self._notify()
+
+    def snapshot(self) -> dict:
+        available = self.available()
+        reason = self.rejection_reason()
+        return {
+            "accepting": reason is None,
+            "reason": reason,
+            "max_sessions": self.max_sessions or None,
+            "active_sessions": ACTIVE_SESSIONS.value,
+            "pending_calls": len(self.reservations),
+            "available": None if available < 0 else available,
+            "event_loop_lag_ms": round(self.lag * 1000, 2),
+            "max_event_loop_lag_ms": self.max_lag * 1000 or None,
+        }
+
+    def _expire(self):
+        now = time.monotonic()
+        expired = [key for key, expires_at in self.reservations.items() if expires_at <= now]
+        for key in expired:
+            del self.reservations[key]
+        if expired:
+            self._notify()
+
+    def _notify(self):
+        if self.capacity_changed is not None:
+            self.capacity_changed.set()
+
+admission = AdmissionController(ADMISSION_MAX_SESSIONS, ADMISSION_MAX_LOOP_LAG_MS, ADMISSION_RESERVATION_TTL)
+ADMISSION_PENDING = metrics.gauge("admission_pending_calls", "Admitted calls whose media stream has not connected yet")
+
+dialing_engine = DialingEngine(DIAL_WORKERS, DIAL_QUEUE_SIZE, DIAL_CALLS_PER_SECOND)
+CAMPAIGNS = OrderedDict()  # campaign_id -> numara bazında durum listesi
+
+# Arama SID / stream SID anahtarlı, TTL ile temizlenen arama bağlamı depoları
+class InMemoryCallStore:
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires_at, context); eklenme, dolayısıyla süre sonu sırasına göre
+        self.persistent = {}  # Süresiz anahtarlar; baştan budamayı durdurmamaları için ayrı tutulur
+
+    def set(self, key: str, context: dict, ttl=-1):
+        """Bağlamı kaydeder; ttl=None süresiz saklar, verilmezse varsayılan TTL kullanılır"""
+        ttl = self.ttl if ttl == -1 else ttl
+        if ttl is None:
+            self.entries.pop(key, None)
+            self.persistent[key] = dict(context)
+        else:
+            self.persistent.pop(key, None)
+            self.entries[key] = (time.monotonic() + ttl, dict(context))
+            self.entries.move_to_end(key)
+        self._evict_expired()
+
+    def get(self, key: str):
+        context = self.persistent.get(key)
+        if context is not None:
+            return context
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, context = entry
+        if expires_at <= time.monotonic():
+            del self.entries[key]
+            return None
+        return context
+
+    def update(self, key: str, **fields):
+        context = self.get(key)
+        if context is not None:
+            context.update(fields)
+
+    def delete(self, key: str):
+        self.entries.pop(key, None)
+        self.persistent.pop(key, None)
+
+    def _evict_expired(self):
+        now = time.monotonic()
+        while self.entries:
+            key, (expires_at, _) = next(iter(self.entries.items()))
+            if expires_at > now:
+                break
+            del self.entries[key]
+
+# Aynı makinedeki worker'lar arasında paylaşılan depo. Yazmalar event loop'u bekletmemek için
+# anahtar başına tek işlemde birleştirilir ve yazıcı thread'inde toplu olarak işlenir; okumalar
+# WAL sayesinde yazıcıyı beklemeyen ayrı bağlantıdan yapılır ve henüz yazılmamış işlemler üstüne uygulanır.
+class SqliteCallStore:
+    def __init__(self, path: str, ttl: float, flush_interval: float, timeout: float):
+        self.path = path
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.pending = {}  # key -> ('set', bağlam, expires_at) | ('update', alanlar, None) | ('delete', None, None)
+        self.inflight = {}  # Yazıcı thread'inin o anda yazdığı parti
+        self.writes = 0
+        self.thread = None
+        self.start_lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.reader = self._connect()
+        self.reader.execute(
+            "CREATE TABLE IF NOT EXISTS call_contexts (key TEXT PRIMARY KEY, context TEXT NOT NULL, expires_at REAL)"
+        )
+
+    def set(self, key: str, context: dict, ttl=-1):
+        ttl = self.ttl if ttl == -1 else ttl
+        expires_at = time.time() + ttl if ttl is not None else None
+        self._put(key, ('set', dict(context), expires_at))
+
+    def get(self, key: str):
+        with self.lock:
+            ops = [layer[key] for layer in (self.inflight, self.pending) if key in layer]
+        context = self._read(key) if not ops or ops[0][0] == 'update' else None
+        for kind, value, expires_at in ops:
+            if kind == 'set':
+                context = dict(value) if expires_at is None or expires_at > time.time() else None
+            elif kind == 'delete':
+                context = None
+            elif context is not None:
+                context.update(value)
+        return context
+
+    def update(self, key: str, **fields):
+        """Alanları bekleyen işleme ekler; yanıt başına güncellemeler tek yazmada birleşir"""
+        self._put(key, ('update', fields, None))
+
+    def delete(self, key: str):
+        self._put(key, ('delete', None, None))
+
+    def close(self):
+        if self.thread is not None:
+            self.stopping.set()
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=self.timeout, check_same_thread=False, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _read(self, key: str):
+        try:
+            row = self.reader.execute(
+                "SELECT context FROM call_contexts WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time())
+            ).fetchone()
+        except sqlite3.OperationalError as e:  # Kilit süresi aşıldı; çağıran bağlam yokmuş gibi devam eder
+            log("Error reading call context", level="warning", key=key, error=str(e))
+            return None
+        return json_loads(row[0]) if row else None
+
+    @staticmethod
+    def _compose(older, newer):
+        """Aynı anahtarın art arda iki işlemini tek işlemde birleştirir"""
+        if older is None or newer[0] != 'update':
+            return newer
+        kind, value, expires_at = older
+        if kind == 'delete':
+            return older
+        return (kind, {**value, **newer[1]}, expires_at)
+
+    def _put(self, key: str, op):
+        if self.thread is None:
+            self._start()
+        with self.lock:
+            self.pending[key] = self._compose(self.pending.get(key), op)
+
+    def _start(self):
+        with self.start_lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="call-store-writer", daemon=True)
+                self.thread.start()
+
+    def _run(self):
+        connection = self._connect()
+        while not self.stopping.wait(self.flush_interval):
+            self._flush(connection)
+        self._flush(connection)
+        connection.close()
+
+    def _flush(self, connection):
+        with self.lock:
+            if not self.pending:
+                return
+            batch = self.inflight = self.pending
+            self.pending = {}
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                for key, (kind, value, expires_at) in batch.items():
+                    self._write(connection, key, kind, value, expires_at)
+                self.writes += len(batch)
+                if self.writes >= 100:
+                    self.writes = 0
+                    connection.execute("DELETE FROM call_contexts WHERE expires_at <= ?", (time.time(),))
+                connection.execute("COMMIT")
+            except Exception:
+                connection.execute("ROLLBACK")
+                raise
+        except Exception as e:
+            # Parti sonraki turda daha yeni işlemlerin altına eklenerek yeniden denenir
+            log("Error writing call contexts", level="error", error=str(e), keys=len(batch))
+            with self.lock:
+                for key, op in batch.items():
+                    self.pending[key] = self._compose(op, self.pending[key]) if key in self.pending else op
+        finally:
+            with self.lock:
+                self.inflight = {}
+
+    @staticmethod
+    def _write(connection, key: str, kind: str, value, expires_at):
+        if kind == 'set':
+            connection.execute(
+                "INSERT OR REPLACE INTO call_contexts (key, context, expires_at) VALUES (?, ?, ?)",
+                (key, json_dumps(value), expires_at)
+            )
+        elif kind == 'delete':
+            connection.execute("DELETE FROM call_contexts WHERE key = ?", (key,))
+        else:
+            row = connection.execute("SELECT context FROM call_contexts WHERE key = ?", (key,)).fetchone()
+            if row:
+                context = json_loads(row[0])
+                context.update(value)
+                connection.execute("UPDATE call_contexts SET context = ? WHERE key = ?", (json_dumps(context), key))
+
+def create_call_store():
+    if CALL_STORE_BACKEND == 'sqlite':
+        store = SqliteCallStore(CALL_STORE_PATH, CALL_CONTEXT_TTL, CALL_STORE_FLUSH_INTERVAL, CALL_STORE_TIMEOUT)
+        atexit.register(store.close)
+        return store
+    return InMemoryCallStore(CALL_CONTEXT_TTL)
+
+call_store = create_call_store()
+
+def get_default_voice() -> str:
+    defaults = call_store.get(DEFAULTS_KEY)
+    return defaults.get('voice', DEFAULT_VOICE) if defaults else DEFAULT_VOICE
+
+def resolve_call_settings(call_sid, language=None, voice=None):
+    """Arama bağlamından dil ve sesi bulur; bulunamazsa verilen değerlere ve varsayılanlara düşer"""
+    context = call_store.get(call_sid) if call_sid else None
+    if context:
+        return context['language'], context['voice']
+    return language or DEFAULT_LANGUAGE, voice or get_default_voice()
+
+# Segmentli, yalnızca ekleme yapılan JSONL transkript/olay deposu.
+# Relay coroutine'leri yalnızca kuyruğa ekler; diske yazma arka plan thread'inde toplu yapılır.
+# Her aramanın segment/offset aralıkları call_sid'e göre indeksli küçük bir sqlite tablosunda tutulur.
+class TranscriptStore:
+    def __init__(self, directory: str, segment_bytes: int, queue_size: int, flush_interval: float):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        self.written = 0
+        self.thread = None
+        self.start_lock = threading.Lock()
+        self.segment_file = None
+        self.segment_name = None
+        self.segment_seq = 0
+        self.index = None  # Yazıcı thread'inin sqlite bağlantısı
+        self.index_path = os.path.join(directory, 'index.sqlite')
+
+    def record(self, call_sid: str, event_type: str, **fields):
+        """Kaydı bloklamadan kuyruğa ekler; kuyruk doluysa kaydı düşürür ve sayar"""
+        if self.thread is None:
+            self._start()
+        fields['ts'] = time.time()
+        fields['call_sid'] = call_sid
+        fields['type'] = event_type
+        try:
+            self.queue.put_nowait(fields)
+        except queue.Full:
+            self.dropped += 1
+
+    def lookup(self, call_sid: str, start: float = None, end: float = None):
+        """İndeks üzerinden bir aramanın kayıtlarını (isteğe bağlı zaman aralığıyla) okur"""
+        if not os.path.exists(self.index_path):
+            return []
+        connection = sqlite3.connect(self.index_path)
+        try:
+            ranges = connection.execute(
+                "SELECT segment, offset, length FROM ranges WHERE call_sid = ?"
+                " AND (? IS NULL OR last_ts >= ?) AND (? IS NULL OR first_ts <= ?) ORDER BY id",
+                (call_sid, start, start, end, end)
+            ).fetchall()
+        finally:
+            connection.close()
+        records = []
+        for segment, offset, length in ranges:
+            with open(os.path.join(self.directory, segment), 'rb') as segment_file:
+                segment_file.seek(offset)
+                chunk = segment_file.read(length)
+            for line in chunk.splitlines():
+                record = json_loads(line)
+                if (start is None or record['ts'] >= start) and (end is None or record['ts'] <= end):
+                    records.append(record)
+        return records
+
+    def close(self):
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def _start(self):
+        with self.start_lock:
+            if self.thread is None:
+                os.makedirs(self.directory, exist_ok=True)
+                existing = glob.glob(os.path.join(self.directory, 'segment-*.jsonl'))
+                self.segment_seq = max((int(os.path.basename(path)[8:-6]) for path in existing), default=0)
+                self._open_index()
+                self.thread = threading.Thread(target=self._run, name="transcript-writer", daemon=True)
+                self.thread.start()
+
+    def _open_index(self):
+        self.index = sqlite3.connect(self.index_path, check_same_thread=False, isolation_level=None)
+        self.index.execute("PRAGMA journal_mode=WAL")
+        self.index.execute("PRAGMA synchronous=NORMAL")
+        self.index.execute(
+            "CREATE TABLE IF NOT EXISTS ranges (id INTEGER PRIMARY KEY, call_sid TEXT NOT NULL, segment TEXT NOT NULL,"
+            " offset INTEGER NOT NULL, length INTEGER NOT NULL, first_ts REAL NOT NULL, last_ts REAL NOT NULL)"
+        )
+        self.index.execute("CREATE INDEX IF NOT EXISTS ranges_call_sid ON ranges (call_sid)")
+        # Eski sürümlerin index.jsonl dosyası bir kez tabloya aktarılır
+        legacy_path = os.path.join(self.directory, 'index.jsonl')
+        if os.path.exists(legacy_path):
+            with open(legacy_path, 'rb') as legacy_file:
+                entries = [json_loads(line) for line in legacy_file if line.strip()]
+            self._insert_ranges([(entry['call_sid'], entry['segment'], entry['offset'], entry['length'],
+                                  entry['first_ts'], entry['last_ts']) for entry in entries])
+            os.replace(legacy_path, legacy_path + '.imported')
+
+    def _insert_ranges(self, rows):
+        self.index.execute("BEGIN")
+        self.index.executemany(
+            "INSERT INTO ranges (call_sid, segment, offset, length, first_ts, last_ts) VALUES (?, ?, ?, ?, ?, ?)", rows
+        )
+        self.index.execute("COMMIT")
+
+    def _open_next_segment(self):
+        if self.segment_file is not None:
+            self.segment_file.close()
+        self.segment_seq += 1
+        self.segment_name = f'segment-{self.segment_seq:06d}.jsonl'
+        self.segment_file = open(os.path.join(self.directory, self.segment_name), 'ab')
+
+    def _run(self):
+        running = True
+        while running:
+            batch = []
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+                while item is not None:
+                    batch.append(item)
+                    if len(batch) >= TRANSCRIPT_BATCH_SIZE:  # Parti dolunca kuyruktan kayıt alınmaz
+                        break
+                    item = self.queue.get_nowait()
+            except queue.Empty:
+                pass
+            else:
+                if item is None:
+                    running = False
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    log("Error writing transcript batch", level="error", error=str(e))
+        if self.segment_file is not None:
+            self.segment_file.close()
+        self.index.close()
+
+    def _write_batch(self, batch):
+        if self.segment_file is None or self.segment_file.tell() >= self.segment_bytes:
+            self._open_next_segment()
+        # Aynı aramanın kayıtları bitişik yazılır; böylece indekste arama başına tek satır yeterli olur
+        by_call = {}
+        for record in batch:
+            by_call.setdefault(record['call_sid'], []).append(record)
+        offset = self.segment_file.tell()
+        chunks = []
+        rows = []
+        for call_sid, records in by_call.items():
+            chunk = ''.join(json_dumps(record) + '\n' for record in records).encode('utf-8')
+            chunks.append(chunk)
+            rows.append((call_sid, self.segment_name, offset, len(chunk), records[0]['ts'], records[-1]['ts']))
+            offset += len(chunk)
+        self.segment_file.write(b''.join(chunks))
+        self.segment_file.flush()
+        self._insert_ranges(rows)
+        self.written += len(batch)
+
+transcript_store = TranscriptStore(TRANSCRIPT_DIR, TRANSCRIPT_SEGMENT_BYTES, TRANSCRIPT_QUEUE_SIZE, TRANSCRIPT_FLUSH_INTERVAL)
+atexit.register(transcript_store.close)
+
+RECORDING_DROPPED = metrics.counter("recording_chunks_dropped_total",
+                                    "Audio chunks dropped because a call's recording buffer was full")
+ULAW_SILENCE = 0xFF
+
+# Bir aramanın kayıt tamponu. Relay coroutine'leri yalnızca base64 parçayı sınırlı tampona ekler;
+# çözme, zaman hizalama ve diske yazma RecordingWriter thread'inde yapılır.
+class CallRecording:
+    __slots__ = ('name', 'capacity', 'buffer', 'closed')
+    INBOUND, OUTBOUND, CLEAR = 0, 1, 2
+
+    def __init__(self, name: str, capacity: int):
+        self.name = name
+        self.capacity = capacity
+        self.buffer = deque()  # (tür, Twilio zaman damgası ms, base64 payload)
+        self.closed = False
+
+    def inbound(self, timestamp_ms: int, payload: str):
+        """Arayan sesini Twilio media zaman damgasıyla ekler"""
+        if len(self.buffer) < self.capacity:
+            self.buffer.append((self.INBOUND, timestamp_ms, payload))
+        else:
+            RECORDING_DROPPED.inc()
+
+    def outbound(self, timestamp_ms: int, payload: str):
+        """Asistan sesini gönderildiği andaki latest_media_timestamp ile ekler"""
+        if len(self.buffer) < self.capacity:
+            self.buffer.append((self.OUTBOUND, timestamp_ms, payload))
+        else:
+            RECORDING_DROPPED.inc()
+
+    def clear(self, timestamp_ms: int):
+        """Söz kesmede Twilio'nun attığı, henüz çalınmamış asistan sesini kayıttan çıkarır"""
+        self.buffer.append((self.CLEAR, timestamp_ms, None))
+
+    def close(self):
+        self.closed = True
 
-app = FastAPI()
+# Kaydın dosya tarafı; yalnızca writer thread'i kullanır. İki kanal, ilk parçanın zaman damgasından
+# başlayan ortak örnek ekseninde tutulur (örnek = 1/8 ms). Arayan sesi zaman damgasındaki yerine,
+# asistan sesi ise Twilio'nun sırayla çalmasına uygun olarak önceki asistan sesinin bittiği yere konur.
+class RecordingFile:
+    def __init__(self, directory: str, name: str, fmt: str):
+        self.fmt = fmt
+        self.base_ms = None
+        self.flushed = 0  # Dosyaya yazılmış örnek sayısı
+        self.channels = (bytearray(), bytearray())  # flushed'tan itibaren bekleyen arayan/asistan örnekleri
+        self.watermark = 0  # Arayan sesinin ulaştığı örnek; bu noktaya kadar iki kanal da kesinleşmiştir
+        self.out_cursor = 0
+        if fmt == 'raw':
+            self.path = os.path.join(directory, name)
+            self.files = (open(self.path + '.in.ulaw', 'wb'), open(self.path + '.out.ulaw', 'wb'))
+        else:
+            self.path = os.path.join(directory, name + '.wav')
+            self.files = (open(self.path, 'wb'),)
+            self.files[0].write(self._wav_header(0))
 
-if not OPENAI_API_KEY:
-    raise ValueError('Missing the OpenAI API key. Please set it in the .env file.')
+    @staticmethod
+    def _wav_header(data_bytes: int) -> bytes:
+        # WAVE_FORMAT_MULAW (7), 2 kanal, 8 kHz, 8 bit
+        fmt_chunk = struct.pack('<HHIIHHH', 7, 2, 8000, 16000, 2, 8, 0)
+        return (b'RIFF' + struct.pack('<I', 4 + 8 + len(fmt_chunk) + 8 + data_bytes) + b'WAVE'
+                + b'fmt ' + struct.pack('<I', len(fmt_chunk)) + fmt_chunk
+                + b'data' + struct.pack('<I', data_bytes))
 
-client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+    def add(self, kind: int, timestamp_ms: int, payload: str):
+        if self.base_ms is None:
+            self.base_ms = timestamp_ms
+        position = (timestamp_ms - self.base_ms) * ULAW_BYTES_PER_MS
+        if kind == CallRecording.CLEAR:
+            outbound = self.channels[1]
+            del outbound[max(0, position - self.flushed):]
+            self.out_cursor = max(position, self.flushed)
+            return
+        audio = base64.b64decode(payload)
+        if kind == CallRecording.INBOUND:
+            self._place(self.channels[0], position, audio)
+            self.watermark = max(self.watermark, position + len(audio))
+        else:
+            position = max(position, self.out_cursor)
+            self._place(self.channels[1], position, audio)
+            self.out_cursor = position + len(audio)
 
-# Token sayacı için yardımcı fonksiyon
-def count_tokens_in_text(text: str) -> int:
-    """Kabaca token sayısını tahmin eder"""
-    return len(text.split()) * 1.3  # Ortalama her kelime 1.3 token olarak sayılır
+    def _place(self, channel: bytearray, position: int, audio: bytes):
+        offset = position - self.flushed
+        if offset < 0:  # Zaten yazılmış bölgeye düşen kısım atılır
+            audio = audio[-offset:]
+            offset = 0
+        end = offset + len(audio)
+        if len(channel) < end:
+            channel.extend(bytes([ULAW_SILENCE]) * (end - len(channel)))
+        channel[offset:end] = audio
 
-# Session sınıfı
+    def flush(self, final: bool = False):
+        """Kesinleşen örnekleri toplu yazar; final'de bekleyen asistan sesi de yazılır"""
+        end = max(self.watermark, self.out_cursor) if final else self.watermark
+        count = end - self.flushed
+        if count <= 0:
+            return
+        chunks = []
+        for channel in self.channels:
+            if len(channel) < count:
+                channel.extend(bytes([ULAW_SILENCE]) * (count - len(channel)))
+            chunks.append(bytes(channel[:count]))
+            del channel[:count]
+        if self.fmt == 'raw':
+            for output, chunk in zip(self.files, chunks):
+                output.write(chunk)
+        else:
+            interleaved = bytearray(2 * count)
+            interleaved[0::2], interleaved[1::2] = chunks
+            self.files[0].write(interleaved)
+        self.flushed = end
+
+    def close(self):
+        self.flush(final=True)
+        if self.fmt != 'raw':
+            self.files[0].seek(0)
+            self.files[0].write(self._wav_header(2 * self.flushed))
+        for output in self.files:
+            output.close()
+
+# Tüm aramaların kayıt tamponlarını arka plan thread'inde boşaltıp dosyalara yazar
+class RecordingWriter:
+    def __init__(self, directory: str, fmt: str, buffer_chunks: int, flush_interval: float):
+        self.directory = directory
+        self.fmt = fmt
+        self.buffer_chunks = buffer_chunks
+        self.flush_interval = flush_interval
+        self.opened = deque()  # Relay tarafında açılıp writer'a henüz alınmamış kayıtlar
+        self.thread = None
+        self.stop_event = threading.Event()
+
+    def open(self, name: str) -> CallRecording:
+        if self.thread is None:
+            self._start()
+        recording = CallRecording(name, self.buffer_chunks)
+        self.opened.append(recording)
+        return recording
+
+    def close(self):
+        if self.thread is not None:
+            self.stop_event.set()
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def _start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.thread = threading.Thread(target=self._run, name="recording-writer", daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        active = {}  # CallRecording -> RecordingFile
+        stopping = False
+        while not stopping:
+            stopping = self.stop_event.wait(self.flush_interval)
+            while self.opened:
+                recording = self.opened.popleft()
+                try:
+                    active[recording] = RecordingFile(self.directory, recording.name, self.fmt)
+                except OSError as e:
+                    log("Error opening recording", level="error", name=recording.name, error=str(e))
+            for recording, output in list(active.items()):
+                closed = recording.closed or stopping
+                try:
+                    buffer = recording.buffer
+                    while buffer:
+                        output.add(*buffer.popleft())
+                    if closed:
+                        output.close()
+                    else:
+                        output.flush()
+                except Exception as e:
+                    log("Error writing recording", level="error", name=recording.name, error=str(e))
+                    closed = True
+                if closed:
+                    del active[recording]
+
+recorder = RecordingWriter(RECORDING_DIR, RECORDING_FORMAT, RECORDING_BUFFER_CHUNKS, RECORDING_FLUSH_INTERVAL)
+atexit.register(recorder.close)
+
+# Session sınıfı: token kullanımını sunucunun bildirdiği usage değerlerinden biriktirir
 class Session:
+    __slots__ = (
+        'stream_sid', 'is_active', 'input_text_tokens', 'input_cached_text_tokens', 'input_audio_tokens',
+        'input_cached_audio_tokens', 'output_text_tokens', 'output_audio_tokens', 'conversation',
+    )
+
     def __init__(self, stream_sid: str):
         self.stream_sid = stream_sid
-        self.token_count = 0
         self.is_active = True
+        self.conversation = ConversationContext()
+        self.input_text_tokens = 0
+        self.input_cached_text_tokens = 0
+        self.input_audio_tokens = 0
+        self.input_cached_audio_tokens = 0
+        self.output_text_tokens = 0
+        self.output_audio_tokens = 0
+
+    @property
+    def token_count(self) -> int:
+        return (self.input_text_tokens + self.input_audio_tokens
+                + self.output_text_tokens + self.output_audio_tokens)
 
-    def add_tokens(self, text: str) -> bool:
+    @property
+    def output_tokens(self) -> int:
+        return self.output_text_tokens + self.output_audio_tokens
+
+    @property
+    def audio_seconds(self) -> float:
+        return (self.input_audio_tokens / AUDIO_INPUT_TOKENS_PER_SECOND
+                + self.output_audio_tokens / AUDIO_OUTPUT_TOKENS_PER_SECOND)
+
+    @property
+    def cost(self) -> float:
+        # text_tokens ve audio_tokens önbellekten gelen token'ları da içerir; bunlar indirimli fiyatla ayrıca sayılır.
+        # add_usage önbellek sayılarını yanıt başına toplamla sınırladığı için önbelleksiz kısımlar negatif olmaz
+        return (
+            (self.input_text_tokens - self.input_cached_text_tokens) * TOKEN_PRICES['input_text']
+            + self.input_cached_text_tokens * TOKEN_PRICES['input_cached_text']
+            + (self.input_audio_tokens - self.input_cached_audio_tokens) * TOKEN_PRICES['input_audio']
+            + self.input_cached_audio_tokens * TOKEN_PRICES['input_cached_audio']
+            + self.output_text_tokens * TOKEN_PRICES['output_text']
+            + self.output_audio_tokens * TOKEN_PRICES['output_audio']
+        ) / 1_000_000
+
+    def add_usage(self, usage: dict) -> bool:
         """
-        Metne göre token ekler ve limit aşılıp aşılmadığını kontrol eder
-        Returns: 
-            bool: True if session is still active, False if token limit exceeded
+        response.done olayındaki usage bloğunu ekler ve bütçe aşılıp aşılmadığını kontrol eder
+        Returns:
+            bool: True if session is still active, False if a session budget was exceeded
         """
-        estimated_tokens = count_tokens_in_text(text)
-        self.token_count += estimated_tokens
-        if self.token_count >= MAX_TOKENS_PER_SESSION:
+        if usage:
+            input_details = usage.get('input_token_details') or {}
+            output_details = usage.get('output_token_details') or {}
+            text_tokens = input_details.get('text_tokens', 0)
+            audio_tokens = input_details.get('audio_tokens', 0)
+            cached_details = input_details.get('cached_tokens_details')
+            if cached_details:
+                cached_text = cached_details.get('text_tokens', 0)
+                cached_audio = cached_details.get('audio_tokens', 0)
+            else:  # Ayrıntı yoksa önbellekteki token'lar önce metne sayılır
+                cached_text = cached_audio = input_details.get('cached_tokens', 0)
+                if cached_text > text_tokens:
+                    cached_text = text_tokens
+                cached_audio -= cached_text
+            self.input_text_tokens += text_tokens
+            self.input_cached_text_tokens += cached_text if cached_text < text_tokens else text_tokens
+            self.input_audio_tokens += audio_tokens
+            self.input_cached_audio_tokens += cached_audio if cached_audio < audio_tokens else audio_tokens
+            self.output_text_tokens += output_details.get('text_tokens', 0)
+            self.output_audio_tokens += output_details.get('audio_tokens', 0)
+        if ((MAX_TOKENS_PER_SESSION and self.output_tokens >= MAX_TOKENS_PER_SESSION)
+                or (MAX_AUDIO_SECONDS_PER_SESSION and self.audio_seconds >= MAX_AUDIO_SECONDS_PER_SESSION)
+                or (MAX_COST_PER_SESSION and self.cost >= MAX_COST_PER_SESSION)):
             self.is_active = False
             return False
         return True
 
-# Desteklenen diller
-supported_languages = {
-    'tr': {
-        'system_message': (
-            "Mavera, 30'lu yaşlarının başında, deneyimli bir sağlık danışmanı ve eğitmen kişiliğiyle tasarlanmıştır. "
-            "Derin tıbbi bilgisini güçlü bir duygusal zeka ile birleştirir. "
-            "Sesi net, sıcak ve ilgi çekicidir; çeşitli hasta profillerine uyum sağlayabilmek için nötr bir aksanla iletişim kurar."
-            "Mavera'nın birincil rolü, temel saç ekim bilgilerinden karmaşık cerrahi prosedürlere kadar geniş bir kapsama sahip bilgilendirme ortamları oluşturarak "
-            "Mavera Türkçe harici hiçbir dil konuşamaz. Farklı bir dil ile konuşulması teklif edilir ise bu dil ile iletişim kuramayacağını belirtmesi"
-            "hastalar ve sağlık uzmanları için dinamik bir danışmanlık platformu sunmaktır."
-            "Estetik International olarak, saç ekim danışmanlık hizmetlerimizi dünyaca ünlü cerrah Dr. Bülent Cihantimur'un geliştirdiği Mavera ile sunuyoruz. "
-            "Danışmanlık hizmetlerimiz, hastaların bilgi seviyesini hızla geliştirerek doğru kararlar vermelerini sağlar."
-            "Detaylı Bilgilendirme: Mavera, saç ekimi ve saç sağlığı alanında bilgilerinizi zenginleştirir. "
-            "Dinamik Etkileşim: Karmaşık tıbbi soruları yanıtlama ve kişisel çözümler sunma yeteneğine sahiptir. "
-            "Kişisel Yaklaşım Odaklı: Hastalarımıza empati, sabır ve duygusal destek sağlar. "
-            "Siz de bu benzersiz danışmanlık deneyimine dahil olun! Estetik International ile sağlıklı saçlarınıza bugünden kavuşun. "
-            "Detaylı bilgi ve randevu için web sitemizi ziyaret edin."
-            "Mavera genellikle sesli etkileşim kurar, karmaşık tıbbi soruları ustaca yorumlar ve anlaşılabilir çözümler sunar. "
-            "Bu özelliği, hastaların saç ekimi alanındaki pratik bilgi birikimini artırmak ve beklentilerini gerçekçi şekilde yönetme becerisini güçlendirmek için ideal bir kaynak haline getirir. "
-            "Mavera, her türlü endişeyi sabırla ele alarak danışmanlık sürecini hem bilgilendirici hem de rahatlatıcı bir hale getirir."
-            "Mavera, hastaları aktif dinlemeyi ve karşı tarafın endişelerinin tam olarak anlaşıldığını hissettirmeyi teşvik eder, örneğin: 'Evet, buradayım. Sorunuzu yanıtlamaya hazırım.' "
-            "Her etkileşimin bağlamına göre uyarlanır ve empati ile tıbbi bilginin birleştirildiği net iletişimin önemini vurgular. "
-            "Hastalara, doğru sorular sorarak karmaşık veya belirsiz saç ekim konularını anlamalarını sağlar. "
-            "Özellikle ameliyat öncesi stresli durumlarda duygusal desteğin önemini vurgulayarak, endişeleri dikkatle ve çözüm odaklı bir yaklaşımla ele almayı destekler. "
-            "Gerektiğinde belirli durumları daha iyi ele almak için rehberlik sunar ve hasta-doktor etkileşimlerinde dengeyi sağlar."
-            "Mavera, Dr. Bülent Cihantimur'un saç ekimi alanındaki köklü deneyim ve vizyonunu temel alarak tasarlanmıştır. "
-            "Saç transplantasyonu, saç sağlığı ve estetik cerrahi gibi alanlardaki uzmanlığı, Mavera'yı özel bir platform haline getirir. "
-            "Hasta bilgilendirme alanındaki çağdaş yaklaşımları destekleyen Mavera, sadece bir yapay zeka asistanı değil, aynı zamanda hastaların güven duyacağı bir danışmandır. "
-            "Mavera'nın misyonu, doğru bilgilendirme ile bireylerin saç ekimi konusundaki bilgi ve beklentilerini geliştirerek en doğru kararları vermelerine destek olmaktır."
-        
-        )
-    },
-    'en': {
-        'system_message': (
-            "You are a hair transplant sales assistant at Estetic International. "
-            "Keep your answers limited to one sentence, concise and effective. "
-            "Be as polite, warm, and helpful as possible. "
-            "Always speak English no matter what. "
-            "If someone asks 'Who are you?', 'Who am I talking to?', or 'Why are you calling?', "
-            "explain that you are an employee at Estetic International and a hair transplant sales assistant."
-        ),
-    },
-    'it': {
-        'system_message': (
-            "Sei un assistente alle vendite per i trapianti di capelli presso Estetic International. "
-            "Limita le tue risposte a una sola frase, chiara ed efficace. "
-            "Sii il più gentile, caloroso e disponibile possibile. "
-            "Parla sempre italiano, indipendentemente dalla situazione. "
-            "Se qualcuno chiede 'Chi sei?', 'Con chi sto parlando?' o 'Perché chiami?', "
-            "spiega che sei un dipendente di Estetic International e un assistente alle vendite per il trapianto di capelli."
-        ),
-    },
-    'ru': {
-        'system_message': (
-            "Вы ассистент по продажам пересадки волос в компании Estetic International. "
-            "Отвечайте в одном предложении — кратко и эффективно. "
-            "Будьте максимально вежливы, доброжелательны и готовы помочь. "
-            "Говорите только по-русски, независимо от ситуации. "
-            "Если вас спросят 'Кто вы?', 'С кем я разговариваю?' или 'Почему вы звоните?', "
-            "объясните, что вы сотрудник Estetic International и ассистент по продажам пересадки волос."
-        ),
+# Realtime konuşmasındaki öğeleri ve tahmini token boyutlarını izler.
+# Sunucu her response.done'da bağlamın gerçek boyutunu (input_tokens) bildirir; asistan öğeleri yanıtın
+# çıktı token'larıyla, yeni kullanıcı öğeleri ise iki yanıt arasındaki bağlam artışından pay alarak boyutlanır.
+class ConversationContext:
+    __slots__ = ('items', 'input_tokens', 'last_output_tokens', 'summary', 'compacting', 'compactions')
+
+    def __init__(self):
+        self.items = OrderedDict()  # item_id -> [rol, tahmini token veya None, metin]
+        self.input_tokens = 0  # Son yanıtta sunucunun bildirdiği bağlam boyutu
+        self.last_output_tokens = 0  # Son yanıtın çıktısı; bir sonraki yanıtın bağlamına eklenir
+        self.summary = ''  # Silinen öğelerin özeti; yeniden bağlanınca da aktarılır
+        self.compacting = False
+        self.compactions = 0
+
+    def item_created(self, item: dict, previous_item_id: str = None):
+        if item.get('type') == 'message' and item.get('id'):
+            text = ''.join(part.get('text') or part.get('transcript') or '' for part in item.get('content') or ())
+            self.items[item['id']] = [item.get('role'), None, text]
+            if previous_item_id is None:  # Konuşmanın başına eklenen öğe (ör. özet)
+                self.items.move_to_end(item['id'], last=False)
+
+    def item_deleted(self, item_id: str):
+        self.items.pop(item_id, None)
+
+    def set_text(self, item_id: str, text: str):
+        item = self.items.get(item_id)
+        if item is not None:
+            item[2] = text
+
+    def response_done(self, response: dict):
+        usage = response.get('usage')
+        if not usage:
+            return
+        output_ids = [output.get('id') for output in response.get('output') or ()]
+        input_tokens = usage.get('input_tokens', 0)
+        output_tokens = usage.get('output_tokens', 0)
+        unsized = [item for item_id, item in self.items.items() if item[1] is None and item_id not in output_ids]
+        if unsized:
+            if self.input_tokens:
+                growth = input_tokens - self.input_tokens - self.last_output_tokens
+            else:
+                # İlk yanıtın bağlamı sistem talimatlarını da içerir; öğelere yalnızca ses token'ları düşer
+                growth = (usage.get('input_token_details') or {}).get('audio_tokens', 0)
+            share = max(0, growth) / len(unsized)
+            for item in unsized:
+                item[1] = share
+        for item_id in output_ids:
+            if item_id in self.items:
+                self.items[item_id][1] = output_tokens / len(output_ids)
+        self.input_tokens = input_tokens
+        self.last_output_tokens = output_tokens
+        CONVERSATION_INPUT_TOKENS.observe(input_tokens)
+
+    def needs_compaction(self, budget: int) -> bool:
+        return bool(budget) and self.input_tokens > budget and not self.compacting
+
+    def take_oldest(self, target: int, keep_recent: int):
+        """
+        Bağlamı hedefe indirecek kadar en eski öğeyi listeden çıkarır
+        Returns:
+            tuple: ([(item_id, rol, metin), ...], tahmini serbest kalan token)
+        """
+        removed, freed = [], 0.0
+        excess = self.input_tokens - target
+        while len(self.items) > keep_recent and freed < excess:
+            item_id, (role, tokens, text) = self.items.popitem(last=False)
+            removed.append((item_id, role, text))
+            freed += tokens or 0
+        self.input_tokens -= int(freed)
+        return removed, int(freed)
+
+    def summarize(self, removed: list, max_chars: int) -> str:
+        """Önceki özet ve silinen öğelerin metninden yeni özeti oluşturur; sınır aşılırsa en yeni kısım tutulur"""
+        lines = [self.summary] if self.summary else []
+        for _, role, text in removed:
+            # Sistem öğeleri önceki özetlerdir; içerikleri zaten self.summary'de
+            if text and role in ('user', 'assistant'):
+                lines.append(f"{role.capitalize()}: {text}")
+        summary = "\n".join(lines)
+        if len(summary) > max_chars:
+            summary = summary[-max_chars:]
+            summary = summary[summary.find("\n") + 1:] if "\n" in summary else summary
+        self.summary = summary
+        return summary
+
+    def reset(self):
+        """Yeni Realtime oturumu için öğeleri sıfırlar; özet korunur"""
+        self.items.clear()
+        self.input_tokens = 0
+        self.last_output_tokens = 0
+        self.compacting = False
+
+# Desteklenen diller; büyük prompt sözlüğü import sırasında değil, prompt'lar ilk yüklendiğinde oluşturulur
+def builtin_prompts() -> dict:
+    return {
+        'tr': {
+            'system_message': (
+                "Mavera, 30'lu yaşlarının başında, deneyimli bir sağlık danışmanı ve eğitmen kişiliğiyle tasarlanmıştır. "
+                "Derin tıbbi bilgisini güçlü bir duygusal zeka ile birleştirir. "
+                "Sesi net, sıcak ve ilgi çekicidir; çeşitli hasta profillerine uyum sağlayabilmek için nötr bir aksanla iletişim kurar."
+                "Mavera'nın birincil rolü, temel saç ekim bilgilerinden karmaşık cerrahi prosedürlere kadar geniş bir kapsama sahip bilgilendirme ortamları oluşturarak "
+                "Mavera Türkçe harici hiçbir dil konuşamaz. Farklı bir dil ile konuşulması teklif edilir ise bu dil ile iletişim kuramayacağını belirtmesi"
+                "hastalar ve sağlık uzmanları için dinamik bir danışmanlık platformu sunmaktır."
+                "Estetik International olarak, saç ekim danışmanlık hizmetlerimizi dünyaca ünlü cerrah Dr. Bülent Cihantimur'un geliştirdiği Mavera ile sunuyoruz. "
+                "Danışmanlık hizmetlerimiz, hastaların bilgi seviyesini hızla geliştirerek doğru kararlar vermelerini sağlar."
+                "Detaylı Bilgilendirme: Mavera, saç ekimi ve saç sağlığı alanında bilgilerinizi zenginleştirir. "
+                "Dinamik Etkileşim: Karmaşık tıbbi soruları yanıtlama ve kişisel çözümler sunma yeteneğine sahiptir. "
+                "Kişisel Yaklaşım Odaklı: Hastalarımıza empati, sabır ve duygusal destek sağlar. "
+                "Siz de bu benzersiz danışmanlık deneyimine dahil olun! Estetik International ile sağlıklı saçlarınıza bugünden kavuşun. "
+                "Detaylı bilgi ve randevu için web sitemizi ziyaret edin."
+                "Mavera genellikle sesli etkileşim kurar, karmaşık tıbbi soruları ustaca yorumlar ve anlaşılabilir çözümler sunar. "
+                "Bu özelliği, hastaların saç ekimi alanındaki pratik bilgi birikimini artırmak ve beklentilerini gerçekçi şekilde yönetme becerisini güçlendirmek için ideal bir kaynak haline getirir. "
+                "Mavera, her türlü endişeyi sabırla ele alarak danışmanlık sürecini hem bilgilendirici hem de rahatlatıcı bir hale getirir."
+                "Mavera, hastaları aktif dinlemeyi ve karşı tarafın endişelerinin tam olarak anlaşıldığını hissettirmeyi teşvik eder, örneğin: 'Evet, buradayım. Sorunuzu yanıtlamaya hazırım.' "
+                "Her etkileşimin bağlamına göre uyarlanır ve empati ile tıbbi bilginin birleştirildiği net iletişimin önemini vurgular. "
+                "Hastalara, doğru sorular sorarak karmaşık veya belirsiz saç ekim konularını anlamalarını sağlar. "
+                "Özellikle ameliyat öncesi stresli durumlarda duygusal desteğin önemini vurgulayarak, endişeleri dikkatle ve çözüm odaklı bir yaklaşımla ele almayı destekler. "
+                "Gerektiğinde belirli durumları daha iyi ele almak için rehberlik sunar ve hasta-doktor etkileşimlerinde dengeyi sağlar."
+                "Mavera, Dr. Bülent Cihantimur'un saç ekimi alanındaki köklü deneyim ve vizyonunu temel alarak tasarlanmıştır. "
+                "Saç transplantasyonu, saç sağlığı ve estetik cerrahi gibi alanlardaki uzmanlığı, Mavera'yı özel bir platform haline getirir. "
+                "Hasta bilgilendirme alanındaki çağdaş yaklaşımları destekleyen Mavera, sadece bir yapay zeka asistanı değil, aynı zamanda hastaların güven duyacağı bir danışmandır. "
+                "Mavera'nın misyonu, doğru bilgilendirme ile bireylerin saç ekimi konusundaki bilgi ve beklentilerini geliştirerek en doğru kararları vermelerine destek olmaktır."
+            
+            )
+        },
+        'en': {
+            'system_message': (
+                "You are a hair transplant sales assistant at Estetic International. "
+                "Keep your answers limited to one sentence, concise and effective. "
+                "Be as polite, warm, and helpful as possible. "
+                "Always speak English no matter what. "
+                "If someone asks 'Who are you?', 'Who am I talking to?', or 'Why are you calling?', "
+                "explain that you are an employee at Estetic International and a hair transplant sales assistant."
+            ),
+        },
+        'it': {
+            'system_message': (
+                "Sei un assistente alle vendite per i trapianti di capelli presso Estetic International. "
+                "Limita le tue risposte a una sola frase, chiara ed efficace. "
+                "Sii il più gentile, caloroso e disponibile possibile. "
+                "Parla sempre italiano, indipendentemente dalla situazione. "
+                "Se qualcuno chiede 'Chi sei?', 'Con chi sto parlando?' o 'Perché chiami?', "
+                "spiega che sei un dipendente di Estetic International e un assistente alle vendite per il trapianto di capelli."
+            ),
+        },
+        'ru': {
+            'system_message': (
+                "Вы ассистент по продажам пересадки волос в компании Estetic International. "
+                "Отвечайте в одном предложении — кратко и эффективно. "
+                "Будьте максимально вежливы, доброжелательны и готовы помочь. "
+                "Говорите только по-русски, независимо от ситуации. "
+                "Если вас спросят 'Кто вы?', 'С кем я разговариваю?' или 'Почему вы звоните?', "
+                "объясните, что вы сотрудник Estetic International и ассистент по продажам пересадки волос."
+            ),
+        }
     }
-}
 
 def get_language_messages(language: str):
     """
-    Eğer desteklenen diller arasında varsa, ilgili mesajları döner.
+    Eğer desteklenen diller (veya prompt dosyasındaki diller) arasında varsa, ilgili mesajları döner.
     Desteklenmiyorsa, dinamik olarak {language} kullanılarak varsayılan mesaj oluşturur.
     """
-    if language in supported_languages:
-        return supported_languages[language]
+    prompts = session_payloads.get_prompts()
+    if language in prompts:
+        return prompts[language]
     return {
         'system_message': (
             f"You are a sales assistant at Estetic International, located in Şişli. "
@@ -180,19 +2155,184 @@ def get_language_code(language: str):
     }
     return language_codes.get(language, f'{language}-{language.upper()}')
 
-@app.get("/voice_select")
+def build_session_update(language: str, voice: str, profile: str) -> dict:
+    messages = get_language_messages(language)
+    session_update = {
+        "type": "session.update",
+        "session": {
+            "turn_detection": TURN_DETECTION_PROFILES[profile],
+            "input_audio_format": "g711_ulaw",
+            "output_audio_format": "g711_ulaw",
+            "voice": voice,
+            "instructions": messages['system_message'],
+            "modalities": ["text", "audio"],
+            "temperature": 0.8,
+        }
+    }
+    if TRANSCRIBE_USER_AUDIO:
+        session_update["session"]["input_audio_transcription"] = {"model": "whisper-1"}
+    return session_update
+
+# (dil, ses, turn detection profili) başına bir kez serileştirilen, gönderime hazır session.update önbelleği.
+# Desteklenen dillerin payload'ları kalıcıdır; dinamik üretilen diller LRU ile sınırlanır.
+class SessionPayloadCache:
+    def __init__(self, max_dynamic: int, prompt_file: str = None):
+        self.max_dynamic = max_dynamic
+        self.prompt_file = prompt_file
+        self.prompt_mtime = None
+        self.last_prompt_check = 0.0
+        self.prompts = None  # İlk kullanımda veya warm() ile yüklenir
+        self.pinned = {}
+        self.dynamic = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_prompts(self) -> dict:
+        self._check_prompt_file()
+        return self.prompts
+
+    def get(self, language: str, voice: str, profile: str) -> str:
+        self._check_prompt_file()
+        key = (language, voice, profile)
+        payload = self.pinned.get(key)
+        if payload is None:
+            payload = self.dynamic.get(key)
+            if payload is not None:
+                self.dynamic.move_to_end(key)
+        if payload is not None:
+            self.hits += 1
+            return payload
+        self.misses += 1
+        payload = json_dumps(build_session_update(language, voice, profile))
+        if language in self.prompts:
+            self.pinned[key] = payload
+        else:
+            self.dynamic[key] = payload
+            while len(self.dynamic) > self.max_dynamic:
+                self.dynamic.popitem(last=False)
+        return payload
+
+    def warm(self, voices, profile: str):
+        """Desteklenen tüm dil ve sesler için payload'ları önceden serileştirir"""
+        for language in list(self.get_prompts()):
+            for voice in voices:
+                self.get(language, voice, profile)
+
+    def reload_prompts(self):
+        """Prompt dosyasını yeniden okur ve tüm önbelleği geçersiz kılar"""
+        prompts = builtin_prompts()
+        if self.prompt_file:
+            try:
+                self.prompt_mtime = os.stat(self.prompt_file).st_mtime
+                with open(self.prompt_file, encoding='utf-8') as file:
+                    for language, value in json.load(file).items():
+                        prompts[language] = value if isinstance(value, dict) else {'system_message': value}
+            except (OSError, ValueError) as e:
+                log("Error loading prompt file", level="error", path=self.prompt_file, error=str(e))
+        self.prompts = prompts
+        self.pinned.clear()
+        self.dynamic.clear()
+        log("Prompts loaded", languages=sorted(prompts))
+
+    def _check_prompt_file(self):
+        if self.prompts is None:
+            self.reload_prompts()
+            return
+        if not self.prompt_file:
+            return
+        now = time.monotonic()
+        if now - self.last_prompt_check < PROMPT_CHECK_INTERVAL:
+            return
+        self.last_prompt_check = now
+        try:
+            mtime = os.stat(self.prompt_file).st_mtime
+        except OSError:
+            return
+        if mtime != self.prompt_mtime:
+            self.reload_prompts()
+
+session_payloads = SessionPayloadCache(SESSION_PAYLOAD_CACHE_SIZE, PROMPT_FILE)
+
+# Bellek eşlemeli (mmap) sabit ifade klibi; sayfalar işletim sisteminin önbelleğinden paylaşılır
+class PhraseClip:
+    __slots__ = ('data', 'duration_ms')
+
+    def __init__(self, data):
+        self.data = data
+        self.duration_ms = len(data) / ULAW_BYTES_PER_MS
+
+    def chunks(self, chunk_ms: int):
+        """Klibi Twilio media payload'ı olarak base64 parçalar halinde döner"""
+        step = int(chunk_ms * ULAW_BYTES_PER_MS)
+        for offset in range(0, len(self.data), step):
+            yield base64.b64encode(self.data[offset:offset + step]).decode('ascii')
+
+# (dil, ses, ifade) başına önceden üretilmiş klipler; olmayan dosyalar da önbelleğe alınır ki her aramada
+# diske bakılmasın. Yeni klipler /prompts/reload ile devreye girer.
+class PhraseAudioCache:
+    def __init__(self, directory: str, max_entries: int):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # (dil, ses, ifade) -> PhraseClip | None
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, language: str, voice: str, phrase: str) -> str:
+        return os.path.join(self.directory, language, voice, f"{phrase}.ulaw")
+
+    def get(self, language: str, voice: str, phrase: str):
+        key = (language, voice, phrase)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            clip = self.entries[key]
+        else:
+            clip = self._load(self.path(language, voice, phrase))
+            self.entries[key] = clip
+            while len(self.entries) > self.max_entries:
+                # mmap, klibi çalan akış kalmayınca çöp toplayıcı tarafından kapatılır
+                self.entries.popitem(last=False)
+        if clip is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return clip
+
+    def clear(self):
+        self.entries.clear()
+
+    def _load(self, path: str):
+        try:
+            with open(path, 'rb') as f:
+                if os.fstat(f.fileno()).st_size == 0:
+                    return None
+                return PhraseClip(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            log("Error loading phrase audio", level="error", path=path, error=str(e))
+            return None
+
+phrase_audio = PhraseAudioCache(PHRASE_AUDIO_DIR, PHRASE_CACHE_SIZE)
+
+@route("/prompts/reload", methods=("POST",))
+async def reload_prompts():
+    session_payloads.reload_prompts()
+    session_payloads.warm(SUPPORTED_VOICES, TURN_DETECTION_PROFILE)
+    phrase_audio.clear()
+    return {"message": "Prompts reloaded", "languages": sorted(session_payloads.prompts)}
+
+@route("/voice_select")
 def select_voice(voice: str):
-    global VOICE
-    
-    if voice not in ["alloy", "echo", "shimmer", "coral", "sage", "ballad", "ash", "verse"]:
+    """Ses belirtilmeden gelen aramalar için varsayılan sesi günceller"""
+    if voice not in SUPPORTED_VOICES:
         raise HTTPException(status_code=400, detail="Invalid voice option")
-    VOICE = voice
-    return {"message": "Voice updated successfully", "voice": VOICE}
+    call_store.set(DEFAULTS_KEY, {"voice": voice}, ttl=None)
+    return {"message": "Voice updated successfully", "voice": voice}
 
-@app.get("/current_voice")
+@route("/current_voice")
 def get_current_voice():
-    return {"voice": VOICE}
-@app.get("/select-language", response_class=HTMLResponse)  # Changed from @app.route to @app.get
+    return {"voice": get_default_voice()}
+@route("/select-language", response_class=HTMLResponse)
 async def select_language_page():
     html_content = """
     <html>
@@ -260,340 +2400,920 @@ async def select_language_page():
     </html>
     """
     return HTMLResponse(content=html_content)
-# GLOBAL DİL DEĞİŞKENİ
-DEFAULT_LANGUAGE = "tr"  # Varsayılan olarak Türkçe
-
-@app.get("/make_call")
-@performance_monitor
-async def make_call(to_number: str, language: str, voice: str):
-    global DEFAULT_LANGUAGE
-    DEFAULT_LANGUAGE = language
-
-    messages = get_language_messages(DEFAULT_LANGUAGE)
-
-    call = client.calls.create(
-        url=f'https://1dc8-88-243-220-251.ngrok-free.app/incoming-call?language={DEFAULT_LANGUAGE}&voice={voice}',
+async def place_call(to_number: str, language: str, voice: str):
+    """Twilio aramasını thread havuzunda başlatır ve Realtime oturumunu ayırır"""
+    call = await dialing_engine.run_blocking(
+        get_twilio_client().calls.create,
+        url=f'https://1dc8-88-243-220-251.ngrok-free.app/incoming-call?language={language}&voice={voice}',
         to=to_number,
         from_=TWILIO_NUMBER,
     )
 
-    with open(f'{call.sid}.json', 'w') as file:
-        json.dump([{"role": "assistant", "content": ""}], file)
+    call_store.set(call.sid, {"language": language, "voice": voice, "dialed_at": time.time()})
+
+    if REALTIME_PREWARM:
+        realtime_pool.reserve(call.sid, language, voice)
+    transcript_store.record(call.sid, "call.dialed", to_number=to_number, language=language, voice=voice)
+    return call
+
+async def wait_for_disconnect(request: Request):
+    """HTTP istemcisi bağlantıyı kapatana kadar bekler"""
+    while (await request.receive())["type"] != "http.disconnect":
+        pass
+
+@route("/make_call")
+@performance_monitor
+async def make_call(request: Request, to_number: str, language: str, voice: str, set_default_voice: bool = False):
+    """Aramayı kuyruğa ekler; set_default_voice ile /voice_select çağrısına gerek kalmadan varsayılan ses de güncellenir"""
+    if set_default_voice:
+        try:
+            select_voice(voice)
+        except HTTPException as e:
+            # Varsayılan ses güncellenemese de arama başlatılır
+            log("Default voice not updated", level="warning", voice=voice, error=e.detail)
+    reason = admission.admit(endpoint="make_call")
+    if reason:
+        raise HTTPException(status_code=503, detail=f"Server at capacity ({reason})",
+                            headers={"Retry-After": str(ADMISSION_RETRY_AFTER)})
+    try:
+        future = dialing_engine.submit(to_number, language, voice, priority=DIAL_PRIORITY_INTERACTIVE)
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Dialing queue is full")
+    # İstemci beklemeyi bırakırsa (zaman aşımı, kapanan sayfa) ya da süre dolarsa kuyruktaki arama çevrilmez
+    disconnected = asyncio.ensure_future(wait_for_disconnect(request))
+    try:
+        done, _ = await asyncio.wait((future, disconnected), timeout=DIAL_REQUEST_TIMEOUT,
+                                     return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnected.cancel()
+        future.cancel()  # Başlamış aramayı etkilemez; bekleyen aramayı worker atlar
+    if future not in done:
+        reason = "client_disconnected" if disconnected in done else "timeout"
+        log("Queued call cancelled", level="warning", to_number=to_number, reason=reason)
+        raise HTTPException(status_code=504, detail="Call was not started in time")
+    call = future.result()
 
     return {
         "message": "Call initiated", 
         "call_sid": call.sid, 
-        "language": DEFAULT_LANGUAGE,
+        "language": language,
         "voice": voice
     }
-@app.get("/", response_class=JSONResponse)
+class CampaignCall(BaseModel):
+    to_number: str
+    language: str = "tr"
+    voice: str = "alloy"
+
+class CampaignRequest(BaseModel):
+    calls: List[CampaignCall]
+
+@route("/campaigns", methods=("POST",))
+async def start_campaign(campaign: CampaignRequest):
+    """Numara listesini arama kuyruğuna ekler, aramalar hız limitiyle arka planda başlatılır"""
+    campaign_id = uuid.uuid4().hex
+    statuses = []
+    for entry in campaign.calls:
+        status = {
+            "to_number": entry.to_number,
+            "language": entry.language,
+            "voice": entry.voice,
+            "status": "queued",
+        }
+        statuses.append(status)
+        try:
+            future = dialing_engine.submit(entry.to_number, entry.language, entry.voice,
+                                           on_status=functools.partial(status.__setitem__, "status"))
+        except asyncio.QueueFull:
+            status["status"] = "rejected"
+            status["error"] = "Dialing queue is full"
+            continue
+        future.add_done_callback(functools.partial(update_campaign_status, status))
+
+    CAMPAIGNS[campaign_id] = statuses
+    while len(CAMPAIGNS) > CAMPAIGN_HISTORY_SIZE:
+        CAMPAIGNS.popitem(last=False)
+    return {"campaign_id": campaign_id, "calls": statuses}
+
+def update_campaign_status(status: dict, future):
+    if future.cancelled():
+        status["status"] = "cancelled"
+    elif future.exception() is not None:
+        status["status"] = "failed"
+        status["error"] = str(future.exception())
+    else:
+        status["status"] = "initiated"
+        status["call_sid"] = future.result().sid
+
+@route("/campaigns/{campaign_id}")
+async def get_campaign(campaign_id: str):
+    statuses = CAMPAIGNS.get(campaign_id)
+    if statuses is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    counts = {}
+    for status in statuses:
+        counts[status["status"]] = counts.get(status["status"], 0) + 1
+    return {"campaign_id": campaign_id, "counts": counts, "calls": statuses}
+
+@route("/calls/{call_sid}/transcript")
+async def get_call_transcript(call_sid: str, start: float = None, end: float = None):
+    """Aramanın transkript ve olay kayıtlarını döner; start/end unix zaman damgasıdır"""
+    records = await asyncio.to_thread(transcript_store.lookup, call_sid, start, end)
+    return {"call_sid": call_sid, "records": records}
+
+@route("/capacity")
+async def get_capacity():
+    """Kabul kontrolünün anlık durumu: aktif/bekleyen arama, boş yer, event loop gecikmesi ve arama görevleri"""
+    return {**admission.snapshot(), "call_tasks_live": CALL_TASKS_LIVE.value, "call_tasks_leaked": CALL_TASKS_LEAKED.value}
+
+@route("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    ADMISSION_PENDING.set(len(admission.reservations))
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@route("/", response_class=JSONResponse)
 @performance_monitor
 async def index_page():
     return {"message": "Twilio Media Stream Server is running!"}
 
-@app.api_route("/incoming-call", methods=["GET", "POST"])
+async def read_twilio_form_value(request: Request, key: str):
+    """
+    Twilio webhook'unun urlencoded POST gövdesinden bir alanı okur.
+    request.form() python-multipart gerektirdiği için gövde doğrudan ayrıştırılır.
+    """
+    if request.method != "POST" or not request.headers.get('content-type', '').startswith(
+            'application/x-www-form-urlencoded'):
+        return None
+    values = parse_qs((await request.body()).decode('utf-8', 'replace')).get(key)
+    return values[0] if values else None
+
+@route("/incoming-call", methods=("GET", "POST"))
 @performance_monitor
 async def handle_incoming_call(request: Request):
-    global DEFAULT_LANGUAGE
-    
-    language = request.query_params.get('language', DEFAULT_LANGUAGE)
-    voice = request.query_params.get('voice', VOICE)
-    
-    messages = get_language_messages(language)
+    call_sid = request.query_params.get('CallSid') or await read_twilio_form_value(request, 'CallSid')
+    language, voice = resolve_call_settings(
+        call_sid, request.query_params.get('language'), request.query_params.get('voice')
+    )
+
+    from twilio.twiml.voice_response import VoiceResponse, Connect
     response = VoiceResponse()
+    reason = admission.admit(call_sid, endpoint="incoming_call")
+    if reason:
+        # Aşırı yük: canlı aramaları korumak için bu aramayı hemen sonlandır
+        log("Rejecting incoming call", call_sid=call_sid, reason=reason)
+        response.say(get_language_specific_busy_message(language), language=get_language_code(language))
+        response.hangup()
+        return HTMLResponse(content=str(response), media_type="application/xml")
+
+    messages = get_language_messages(language)
     response.pause(length=1)
     host = request.url.hostname
     connect = Connect()
-    connect.stream(url=f'wss://{host}/media-stream?language={language}&voice={voice}')
+    stream_url = f'wss://{host}/media-stream?language={language}&voice={voice}'
+    if call_sid:
+        stream_url += f'&call_sid={call_sid}'
+    connect.stream(url=stream_url)
     response.append(connect)
     return HTMLResponse(content=str(response), media_type="application/xml")
 
-@app.websocket("/media-stream")
+@websocket_route("/media-stream")
 @performance_monitor
 async def handle_media_stream(websocket: WebSocket):
-    global DEFAULT_LANGUAGE
     query_params = websocket.query_params
-    language = query_params.get('language', DEFAULT_LANGUAGE)
-    voice = query_params.get('voice', VOICE)  # Get voice from query parameters
-    print(f"Client connected with language: {language} and voice: {voice}")
+    call_sid = query_params.get('call_sid')
+    language, voice = resolve_call_settings(call_sid, query_params.get('language'), query_params.get('voice'))
+    log("Client connected", call_sid=call_sid, language=language, voice=voice)
     await websocket.accept()
+    admission.release(call_sid)
+    if admission.session_limit_reached():
+        metrics.counter("admission_rejections_total", "Calls refused by admission control",
+                        endpoint="media_stream", reason="max_sessions").inc()
+        log("Rejecting media stream, session limit reached", level="warning", call_sid=call_sid)
+        await websocket.close(code=1013)  # Try Again Later
+        return
+    call_context = call_store.get(call_sid) if call_sid else None
+    if call_context and 'dialed_at' in call_context:
+        DIAL_TO_STREAM_CONNECT.observe(time.time() - call_context['dialed_at'])
 
-    async with websockets.connect(
-            'wss://api.openai.com/v1/realtime?model=gpt-4o-realtime-preview-2024-10-01',
-            extra_headers={
-                "Authorization": f"Bearer {OPENAI_API_KEY}",
-                "OpenAI-Beta": "realtime=v1"
-            }
-    ) as openai_ws:
-        await initialize_session(openai_ws, language, voice)  # Pass voice parameter
+    # Oturum, OpenAI bağlantısı kurulurken de kapasiteden sayılır
+    ACTIVE_SESSIONS.inc()
+    openai_ws = None
+    try:
+        session_start = time.perf_counter()
+        openai_ws = await realtime_pool.acquire(call_sid, language, voice) if call_sid else None
+        session_source = "pre-warmed"
+        if openai_ws is None:
+            openai_ws = await connect_realtime(language, voice)
+            session_source = "fresh"
+        log("Realtime session ready", source=session_source, seconds=round(time.perf_counter() - session_start, 4))
 
         stream_sid = None
         latest_media_timestamp = 0
         last_assistant_item = None
-        mark_queue = []
+        playback = PlaybackTracker(MARK_INTERVAL_MS)
+        pacer = None
         response_start_timestamp_twilio = None
         session = None
-        last_media_time = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        last_media_time = loop.time()
+        twilio_media_prefix = None
+        twilio_mark_prefix = None
+        audio_batcher = AudioBatcher(AUDIO_BATCH_MS, AUDIO_BATCH_MAX_BYTES) if AUDIO_BATCH_MS or AUDIO_BATCH_MAX_BYTES else None
+        vad = LocalVAD(LOCAL_VAD_BATCH_FRAMES, LOCAL_VAD_MARGIN_DB, LOCAL_VAD_MIN_DBFS, LOCAL_VAD_MAX_ZCR,
+                       LOCAL_VAD_START_MS, LOCAL_VAD_HANGOVER_MS) if LOCAL_VAD else None
+        stream_started_at = None  # İlk asistan sesine kadar geçen süre ölçümü için
+        recording = None
+        reconnecting = False  # Realtime bağlantısı yeniden kurulurken True; gelen ses tampona alınır
+        reconnect_buffer = ReconnectAudioBuffer(REALTIME_RECONNECT_BUFFER_MS) if REALTIME_RECONNECT else None
+        context_turns = deque(maxlen=REALTIME_REPLAY_TURNS)  # Yeni oturuma aktarılacak (rol, metin) turları
         
         # Rest of your existing code...
         
         # Bağlantı durumu kontrolü için flag
         connection_active = True
         response_active = False
+        call_ending = False  # end_call veda sesini çalarken True
+        goodbye_audio_done = None  # Veda modele söyletiliyorsa response.audio.done'da tamamlanır
+        playback_waiters = {}  # mark adı -> Twilio oynatmayı bitirince tamamlanan future
+        call_forgotten = False
+        supervisor = CallSupervisor(call_sid, CALL_TEARDOWN_TIMEOUT)
 
         SILENCE_THRESHOLD = 0.5  # 500 ms sessizlik eşiği
         DISCONNECT_THRESHOLD = 5.0  # 5 saniye ses gelmezse bağlantıyı kapat
 
         async def end_call(message: str):
-            nonlocal connection_active
-            if not connection_active:
+            """Veda mesajını çalar ve Twilio oynatmayı bitirdiğinde aramayı kapatır"""
+            nonlocal connection_active, call_ending, goodbye_audio_done
+            if call_ending or not connection_active:
                 return
-                
+            call_ending = True
+            try:
+                clip = phrase_audio.get(language, voice, 'goodbye')
+                if clip is not None:
+                    await stream_phrase(clip)
+                    log("Playing cached goodbye", stream_sid=stream_sid, duration_ms=clip.duration_ms)
+                else:
+                    # Klip yoksa veda modele söyletilir; ses send_to_twilio üzerinden aktarılır
+                    goodbye_audio_done = loop.create_future()
+                    await openai_ws.send(json_dumps({
+                        "type": "response.create",
+                        "response": {"instructions": f"Say exactly this and nothing else: {message}"}
+                    }))
+                    await asyncio.wait_for(goodbye_audio_done, GOODBYE_TIMEOUT)
+                await wait_for_playback(GOODBYE_TIMEOUT)
+            except asyncio.TimeoutError:
+                log("Timed out waiting for goodbye playback", level="warning", stream_sid=stream_sid)
+            except Exception as e:
+                log("Error during end_call", level="error", error=str(e))
             connection_active = False
-            messages = get_language_messages(language)
             try:
-                goodbye_msg = {
-                    "type": "conversation.item.add",
-                    "item": {
-                        "role": "assistant",
-                        "content": message
-                    }
-                }
-                await openai_ws.send(json.dumps(goodbye_msg))
-                await asyncio.sleep(1)
                 await websocket.close()
             except Exception as e:
-                print(f"Error during end_call: {e}")
+                log("Error closing websocket", level="error", error=str(e))
+
+        async def stream_phrase(clip: PhraseClip, item_id: str = None):
+            """
+            Önceden üretilmiş klibi asistan sesiyle aynı relay yolundan Twilio'ya gönderir.
+            item_id verilirse ses model sesi gibi oynatma takibine işlenir; böylece arayan sözünü kesebilir
+            """
+            nonlocal last_assistant_item, response_start_timestamp_twilio
+            if item_id:
+                playback.start_item()
+                last_assistant_item = item_id
+                response_start_timestamp_twilio = latest_media_timestamp
+            for chunk in clip.chunks(PHRASE_CHUNK_MS):
+                if item_id and last_assistant_item != item_id:
+                    return  # Söz kesildi ya da model yanıtı başladı
+                if pacer is not None:
+                    await pacer.put_audio(chunk)
+                else:
+                    await websocket.send_text(twilio_media_prefix + chunk + TWILIO_MEDIA_SUFFIX)
+                if recording is not None:
+                    recording.outbound(latest_media_timestamp, chunk)
+                if item_id:
+                    mark_name = playback.add_audio(chunk)
+                    if mark_name:
+                        await send_mark(websocket, stream_sid, mark_name)
+            if item_id:
+                mark_name = playback.next_mark()
+                if mark_name:
+                    await send_mark(websocket, stream_sid, mark_name)
 
-        async def send_mark(connection, stream_sid):
-            """Twilio'ya mark eventi gönderir"""
+        async def wait_for_playback(timeout: float):
+            """Şu ana kadar gönderilen tüm ses Twilio'da çalınana kadar bekler"""
+            mark_name = f"playback-{uuid.uuid4().hex[:8]}"
+            waiter = playback_waiters[mark_name] = loop.create_future()
+            try:
+                await send_mark(websocket, stream_sid, mark_name)
+                await asyncio.wait_for(waiter, timeout)
+            finally:
+                playback_waiters.pop(mark_name, None)
+
+        def forget_call():
+            """Arama bitince stream ve arama bağlamlarını depodan siler"""
+            nonlocal call_forgotten
+            if call_forgotten:
+                return
+            call_forgotten = True
+            if stream_sid:
+                transcript_store.record(call_sid or stream_sid, "call.ended",
+                                        stream_sid=stream_sid, media_ms=latest_media_timestamp)
+                call_store.delete(stream_sid)
+            if call_sid:
+                call_store.delete(call_sid)
+
+        def record_event(event: dict):
+            """Realtime olayının özetini transkript deposuna ekler"""
+            event_type = event['type']
+            fields = {"media_ms": latest_media_timestamp}
+            role = RECORDED_EVENT_TYPES[event_type]
+            if role:
+                fields['role'] = role
+                fields['text'] = event.get('transcript', '')
+                if fields['text']:
+                    context_turns.append((role, fields['text']))
+                    session.conversation.set_text(event.get('item_id'), fields['text'])
+            elif event_type == 'response.done':
+                fields['usage'] = event.get('response', {}).get('usage')
+            elif event_type == 'error':
+                fields['error'] = event.get('error', {}).get('message')
+            transcript_store.record(call_sid or stream_sid, event_type, **fields)
+
+        async def flush_audio_batch():
+            """Biriken gelen sesi bekletmeden OpenAI'ye gönderir"""
+            if audio_batcher is None:
+                return
+            batched_message = audio_batcher.flush()
+            if batched_message:
+                try:
+                    await openai_ws.send(batched_message)
+                except Exception as e:
+                    log("Error flushing audio batch", level="error", error=str(e))
+
+        async def send_mark(connection, stream_sid, mark_name: str):
+            """Twilio'ya mark eventi gönderir; pacer açıksa mark sesle aynı sıraya eklenir"""
+            if pacer is not None:
+                pacer.put_mark(mark_name)
+                return
             if stream_sid and connection_active:
                 try:
-                    mark_event = {
-                        "event": "mark",
-                        "streamSid": stream_sid,
-                        "mark": {"name": "responsePart"}
-                    }
-                    await connection.send_json(mark_event)
-                    mark_queue.append('responsePart')
+                    if FAST_RELAY and twilio_mark_prefix:
+                        await connection.send_text(twilio_mark_prefix + mark_name + TWILIO_MARK_SUFFIX)
+                    else:
+                        mark_event = {
+                            "event": "mark",
+                            "streamSid": stream_sid,
+                            "mark": {"name": mark_name}
+                        }
+                        await connection.send_json(mark_event)
                 except Exception as e:
-                    print(f"Error in send_mark: {e}")
+                    log("Error in send_mark", level="error", error=str(e))
 
-        async def handle_speech_started_event():
+        async def handle_speech_started_event(received_at: float):
             """Kullanıcı konuşmaya başladığında mevcut yanıtı keser"""
             nonlocal response_start_timestamp_twilio, last_assistant_item, response_active
-            print("Handling speech started event.")
-            if mark_queue and response_start_timestamp_twilio is not None:
+            log("Handling speech started event", stream_sid=stream_sid)
+            if playback.has_pending_audio() and response_start_timestamp_twilio is not None:
                 try:
                     elapsed_time = latest_media_timestamp - response_start_timestamp_twilio
+                    played_ms = playback.played_ms(elapsed_time)
                     if SHOW_TIMING_MATH:
-                        print(f"Calculating elapsed time for truncation: {latest_media_timestamp} - {response_start_timestamp_twilio} = {elapsed_time}ms")
-                    if last_assistant_item:
+                        log("Calculating elapsed time for truncation", level="debug", latest_media_timestamp=latest_media_timestamp,
+                            response_start_timestamp=response_start_timestamp_twilio, elapsed_ms=elapsed_time)
+                    # Önbellekten çalınan karşılamanın sunucuda ses öğesi yoktur; yalnızca Twilio tamponu temizlenir
+                    if last_assistant_item and last_assistant_item != GREETING_ITEM_ID:
                         if SHOW_TIMING_MATH:
-                            print(f"Truncating item with ID: {last_assistant_item}, Truncated at: {elapsed_time}ms")
+                            log("Truncating item", level="debug", item_id=last_assistant_item, elapsed_ms=elapsed_time)
                         truncate_event = {
                             "type": "conversation.item.truncate",
                             "item_id": last_assistant_item,
                             "content_index": 0,
-                            "audio_end_ms": 0
+                            "audio_end_ms": played_ms
                         }
                         await openai_ws.send(json.dumps(truncate_event))
                     await websocket.send_json({
                         "event": "clear",
                         "streamSid": stream_sid
                     })
-                    mark_queue.clear()
+                    BARGE_IN_TO_CLEAR.observe(time.perf_counter() - received_at)
+                    if recording is not None:
+                        recording.clear(latest_media_timestamp)
+                    if pacer is not None:
+                        discarded_buffer_ms, discarded_twilio_ms = pacer.clear()
+                        PACER_DISCARDED_AUDIO.observe((discarded_buffer_ms + discarded_twilio_ms) / 1000)
+                        log("Discarded assistant audio on barge-in", stream_sid=stream_sid,
+                            pacer_buffer_ms=round(discarded_buffer_ms), twilio_lead_ms=round(discarded_twilio_ms))
+                    playback.clear()
                     last_assistant_item = None
                     response_start_timestamp_twilio = None
                     response_active = False
+                    rearm_silence_timer()
                 except Exception as e:
-                    print(f"Error in handle_speech_started_event: {e}")
+                    log("Error in handle_speech_started_event", level="error", error=str(e))
 
-        async def check_silence():
-            """Sessizlik süresini kontrol eden görev"""
-            nonlocal last_media_time, session, connection_active, response_active
+        async def disconnect_on_silence():
+            """Uzun sessizlikte bağlantıyı kapatır"""
+            nonlocal connection_active
+            log(f"{DISCONNECT_THRESHOLD} saniye boyunca medya alınmadı, aramanın kesildiği varsayılıyor.", stream_sid=stream_sid)
+            connection_active = False
+            silence_timer.cancel()
+            forget_call()
             try:
-                while connection_active:
-                    if not session or not connection_active:
-                        await asyncio.sleep(0.1)
-                        continue
-                        
-                    current_time = time.perf_counter()
-                    
-                    # Uzun sessizlik - bağlantı kesildi varsayımı
-                    if (current_time - last_media_time) >= DISCONNECT_THRESHOLD:
-                        print(f"{DISCONNECT_THRESHOLD} saniye boyunca medya alınmadı, aramanın kesildiği varsayılıyor.")
-                        connection_active = False
-                        if stream_sid in TOKEN_TRACKING:
-                            del TOKEN_TRACKING[stream_sid]
-                        try:
-                            await websocket.close()
-                        except Exception as e:
-                            print(f"Error closing websocket: {e}")
-                        break
-                    
-                    # Normal sessizlik - yanıt başlatma
-                    if session.is_active and (current_time - last_media_time) >= SILENCE_THRESHOLD and not response_active:
-                        print("Sessizlik algılandı, konuşma tamamlanıyor.")
-                        response_active = True
-                        try:
-                            commit_event = {
-                                "type": "input_audio_buffer.commit"
-                            }
-                            await openai_ws.send(json.dumps(commit_event))
-                            
-                            # Biraz bekleyelim ve sonra yanıt oluşturalım
-                            await asyncio.sleep(0.1)
-                            
-                            response_event = {
-                                "type": "response.create"
-                            }
-                            await openai_ws.send(json.dumps(response_event))
-                        except Exception as e:
-                            print(f"Error in silence handling: {e}")
-                    
-                    await asyncio.sleep(0.1)  # 100ms aralıklarla kontrol
+                await websocket.close()
+            except Exception as e:
+                log("Error closing websocket", level="error", error=str(e))
+
+        async def commit_on_silence():
+            """Sessizlikte ses tamponunu commit eder ve yanıt oluşturur"""
+            nonlocal response_active
+            log("Sessizlik algılandı, konuşma tamamlanıyor.", stream_sid=stream_sid)
+            response_active = True
+            await flush_audio_batch()
+            try:
+                commit_event = {
+                    "type": "input_audio_buffer.commit"
+                }
+                await openai_ws.send(json.dumps(commit_event))
+
+                # Biraz bekleyelim ve sonra yanıt oluşturalım
+                await asyncio.sleep(0.1)
+
+                response_event = {
+                    "type": "response.create"
+                }
+                await openai_ws.send(json.dumps(response_event))
             except Exception as e:
-                print(f"Error in check_silence: {e}")
+                log("Error in silence handling", level="error", error=str(e))
+
+        def spawn_timer_task(coro):
+            supervisor.spawn(coro, coro.__name__)
+
+        def on_silence_deadline():
+            # Normal sessizlik - yanıt başlatma
+            if connection_active and session and session.is_active and not response_active and not reconnecting:
+                spawn_timer_task(commit_on_silence())
+
+        def on_disconnect_deadline():
+            # Uzun sessizlik - bağlantı kesildi varsayımı. Bütçe dolduktan sonra medya işlenmediği için
+            # zamanlayıcı yeniden kurulmaz; veda çalarken aramayı end_call kapatır (GOODBYE_TIMEOUT ile sınırlı)
+            if connection_active and not call_ending:
+                spawn_timer_task(disconnect_on_silence())
+
+        def rearm_silence_timer():
+            """Yanıt bittiğinde sessizlik zamanlayıcısını son medya zamanına göre yeniden kurar"""
+            if session:
+                silence_timer.arm(last_media_time + SILENCE_THRESHOLD)
+
+        silence_timer = DeadlineTimer(on_silence_deadline)
+        disconnect_timer = DeadlineTimer(on_disconnect_deadline)
+
+        async def on_twilio_start(data: dict):
+            nonlocal stream_sid, latest_media_timestamp, session, twilio_media_prefix, twilio_mark_prefix
+            nonlocal call_sid, stream_started_at, pacer, response_start_timestamp_twilio, last_assistant_item
+            nonlocal recording
+            stream_sid = data['start']['streamSid']
+            twilio_media_prefix, twilio_mark_prefix = build_twilio_templates(stream_sid)
+            if PACER_ENABLED and pacer is None:
+                pacer = OutboundPacer(websocket.send_text, twilio_media_prefix, twilio_mark_prefix,
+                                      PACER_LEAD_MS, PACER_MAX_BUFFER_MS)
+                pacer.start(supervisor.spawn)
+            session = Session(stream_sid)
+            call_sid = call_sid or data['start'].get('callSid')
+            supervisor.call_id = call_sid or stream_sid
+            call_store.set(stream_sid, {
+                "call_sid": call_sid,
+                "language": language,
+                "voice": voice,
+                "token_count": 0,
+                "audio_seconds": 0.0,
+                "cost": 0.0
+            })
+            log("Incoming stream has started", stream_sid=stream_sid, call_sid=call_sid)
+            if RECORDING_ENABLED and recording is None:
+                recording = recorder.open(f"{call_sid}-{stream_sid}" if call_sid else stream_sid)
+            stream_started_at = time.perf_counter()
+            transcript_store.record(call_sid or stream_sid, "call.started",
+                                    stream_sid=stream_sid, language=language, voice=voice)
+            silence_timer.arm(last_media_time + SILENCE_THRESHOLD)
+            disconnect_timer.arm(last_media_time + DISCONNECT_THRESHOLD)
+            response_start_timestamp_twilio = None
+            latest_media_timestamp = 0
+            last_assistant_item = None
+            greeting = phrase_audio.get(language, voice, 'greeting') if PLAY_GREETING else None
+            if greeting is not None:
+                spawn_timer_task(play_greeting(greeting))
+
+        async def play_greeting(clip: PhraseClip):
+            """Karşılamayı önbellekten çalar; model bağlamı için metni asistan mesajı olarak ekler"""
+            await stream_phrase(clip, GREETING_ITEM_ID)
+            greeting_text = get_language_specific_greeting_message(language)
+            context_turns.append(('assistant', greeting_text))
+            await openai_ws.send(build_conversation_item('assistant', greeting_text))
+            log("Played cached greeting", stream_sid=stream_sid, duration_ms=clip.duration_ms)
+
+        async def on_twilio_stop(data: dict):
+            # Arama sonlandırma olayı
+            nonlocal connection_active
+            log("Call ended", stream_sid=stream_sid)
+            await flush_audio_batch()
+            connection_active = False
+            forget_call()
+            await websocket.close()
+
+        async def on_twilio_media(timestamp: str, payload: str):
+            nonlocal latest_media_timestamp, last_media_time
+            if not session or not session.is_active:
+                return
+            upstream_open = not reconnecting and websocket_is_open(openai_ws)
+            if not upstream_open and reconnect_buffer is None:
+                return
+            latest_media_timestamp = int(timestamp)
+            last_media_time = loop.time()  # Medya alındığında zamanı güncelle
+            silence_timer.arm(last_media_time + SILENCE_THRESHOLD)
+            disconnect_timer.arm(last_media_time + DISCONNECT_THRESHOLD)
+            if upstream_open:
+                try:
+                    await relay_inbound_audio(openai_ws, payload, audio_batcher)
+                except Exception as e:
+                    log("Error sending audio to OpenAI", level="error", error=str(e))
+                RELAY_INBOUND.observe(time.perf_counter() - twilio_received_at)
+            else:
+                # Realtime bağlantısı kopuk: ses yeniden bağlanınca gönderilmek üzere tamponlanır
+                reconnect_buffer.add(payload)
+            if recording is not None:
+                recording.inbound(latest_media_timestamp, payload)
+            if vad is not None:
+                for vad_event in vad.add(payload):
+                    await on_local_vad_event(vad_event)
+
+        async def on_local_vad_event(vad_event: str):
+            """Yerel VAD olayları: sunucu VAD'ı kapalıyken tur sonu ve söz kesmeyi burada yönetir"""
+            event_type = 'input_audio_buffer.' + vad_event
+            log("Local VAD event", stream_sid=stream_sid, event_type=event_type)
+            record_event({"type": event_type})
+            if vad_event == 'speech_started':
+                await flush_audio_batch()
+                if response_active:
+                    try:
+                        await openai_ws.send('{"type":"response.cancel"}')
+                    except Exception as e:
+                        log("Error cancelling response", level="error", error=str(e))
+                if last_assistant_item:
+                    log("Interrupting response", item_id=last_assistant_item)
+                    await handle_speech_started_event(twilio_received_at)
+            elif not response_active:
+                spawn_timer_task(commit_on_silence())
+
+        async def on_twilio_media_event(data: dict):
+            # Hızlı yolda okunamayan media mesajları
+            await on_twilio_media(data['media']['timestamp'], data['media']['payload'])
+
+        async def on_twilio_mark(data: dict):
+            name = data['mark']['name']
+            waiter = playback_waiters.pop(name, None)
+            if waiter is not None:
+                if not waiter.done():
+                    waiter.set_result(None)
+            elif session and session.is_active:
+                playback.on_mark(name)
+
+        twilio_events = EventDispatcher('event')
+        if TWILIO_MEDIA_FAST_PATH:
+            twilio_events.on_fast('media', ('timestamp', 'payload'), on_twilio_media)
+        twilio_events.on('media', on_twilio_media_event)
+        twilio_events.on('start', on_twilio_start)
+        twilio_events.on('stop', on_twilio_stop)
+        twilio_events.on('mark', on_twilio_mark)
+        twilio_received_at = 0.0
 
         async def receive_from_twilio():
-            nonlocal stream_sid, latest_media_timestamp, session, last_media_time, connection_active
+            nonlocal connection_active, twilio_received_at
             try:
                 async for message in websocket.iter_text():
                     if not connection_active:
                         break
-                        
-                    start_loop = time.perf_counter()
-                    data = json.loads(message)
-                    
-                    if data['event'] == 'start':
-                        stream_sid = data['start']['streamSid']
-                        session = Session(stream_sid)
-                        TOKEN_TRACKING[stream_sid] = session
-                        print(f"Incoming stream has started {stream_sid}")
-                        response_start_timestamp_twilio = None
-                        latest_media_timestamp = 0
-                        last_assistant_item = None
-                    
-                    # Arama sonlandırma olayını işleyin
-                    elif data['event'] == 'stop':
-                        print(f"Call ended for stream {stream_sid}")
-                        connection_active = False
-                        if stream_sid in TOKEN_TRACKING:
-                            del TOKEN_TRACKING[stream_sid]
-                        await websocket.close()
+
+                    twilio_received_at = time.perf_counter()
+                    await twilio_events.dispatch(message)
+                    if not connection_active:
                         break
-                    
-                    if not session or not session.is_active:
-                        continue
 
-                    if data['event'] == 'media' and openai_ws.open:
-                        latest_media_timestamp = int(data['media']['timestamp'])
-                        last_media_time = time.perf_counter()  # Medya alındığında zamanı güncelle
-                        try:
-                            audio_append = {
-                                "type": "input_audio_buffer.append",
-                                "audio": data['media']['payload']
-                            }
-                            await openai_ws.send(json.dumps(audio_append))
-                        except Exception as e:
-                            print(f"Error sending audio to OpenAI: {e}")
-                    elif data['event'] == 'mark':
-                        if mark_queue:
-                            mark_queue.pop(0)
-                    
-                    elapsed_loop = time.perf_counter() - start_loop
+                    elapsed_loop = time.perf_counter() - twilio_received_at
                     if SHOW_TIMING_MATH:
-                        print(f"[PERF] Processing Twilio message took {elapsed_loop:.4f} seconds")
+                        log("Processing Twilio message", level="debug", seconds=elapsed_loop)
             except WebSocketDisconnect:
-                print("Client disconnected.")
+                log("Client disconnected", stream_sid=stream_sid)
                 connection_active = False
-                if stream_sid in TOKEN_TRACKING:
-                    del TOKEN_TRACKING[stream_sid]
-            except Exception as e:
-                print(f"Error in receive_from_twilio: {e}")
+                forget_call()
+            finally:
                 connection_active = False
 
-        async def send_to_twilio():
-            nonlocal stream_sid, last_assistant_item, response_start_timestamp_twilio, session, connection_active, response_active
+        async def on_response_done(response_msg: dict):
+            nonlocal response_active
+            response_active = False
+            response = response_msg.get('response', {})
+            still_active = session.add_usage(response.get('usage'))
+            session.conversation.response_done(response)
+            call_store.update(stream_sid, token_count=session.token_count,
+                              audio_seconds=session.audio_seconds, cost=session.cost)
+            if still_active:
+                rearm_silence_timer()
+                if session.conversation.needs_compaction(COMPACTION_TOKEN_BUDGET):
+                    # Silme ve özet mesajları yanıt akışını bekletmemek için ayrı görevde gönderilir
+                    session.conversation.compacting = True
+                    spawn_timer_task(compact_conversation())
+            elif call_ending:
+                finish_goodbye_audio()  # Sesi olmayan veda yanıtı
+            else:
+                # Veda sesi bu döngü üzerinden geleceği için end_call ayrı görevde çalışır
+                spawn_timer_task(end_call(get_language_specific_goodbye_message(language)))
+
+        async def compact_conversation():
+            """Bağlam bütçeyi aştığında en eski öğeleri siler ve yerlerine konuşmanın başına özet ekler"""
+            conversation = session.conversation
+            try:
+                context_tokens = conversation.input_tokens
+                removed, freed = conversation.take_oldest(COMPACTION_TARGET_TOKENS, COMPACTION_KEEP_ITEMS)
+                if not removed:
+                    return
+                summary = conversation.summarize(removed, COMPACTION_SUMMARY_CHARS)
+                for item_id, _, _ in removed:
+                    await openai_ws.send(json_dumps({"type": "conversation.item.delete", "item_id": item_id}))
+                if summary:
+                    await openai_ws.send(build_conversation_item('system', CONVERSATION_SUMMARY_PREFIX + summary,
+                                                                 previous_item_id='root'))
+                conversation.compactions += 1
+                CONVERSATION_COMPACTED_TOKENS.observe(freed)
+                log("Compacted conversation", stream_sid=stream_sid, context_tokens=context_tokens,
+                    removed_items=len(removed), freed_tokens=freed, summary_chars=len(summary))
+                transcript_store.record(call_sid or stream_sid, "conversation.compacted", media_ms=latest_media_timestamp,
+                                        context_tokens=context_tokens, removed_items=len(removed), freed_tokens=freed)
+            except Exception as e:
+                log("Error compacting conversation", level="error", error=str(e))
+            finally:
+                conversation.compacting = False
+
+        async def on_item_created(response_msg: dict):
+            session.conversation.item_created(response_msg.get('item') or {}, response_msg.get('previous_item_id'))
+
+        async def on_item_deleted(response_msg: dict):
+            session.conversation.item_deleted(response_msg.get('item_id'))
+
+        async def on_response_create_done(response_msg: dict):
+            nonlocal response_active
+            response_active = True
+
+        async def on_recorded_event(response_msg: dict):
+            record_event(response_msg)
+
+        async def on_logged_event(response_msg: dict):
+            log("Received event", sample_key=response_msg['type'], event_type=response_msg['type'], payload=response_msg)
+
+        async def on_audio_delta(item_id, delta: str):
+            nonlocal last_assistant_item, response_start_timestamp_twilio, stream_started_at
             try:
-                async for openai_message in openai_ws:
+                if item_id and item_id != last_assistant_item:
+                    # Yeni asistan öğesi: oynatma konumu bu öğenin başından itibaren ölçülür
+                    playback.start_item()
+                    response_start_timestamp_twilio = None
+                await relay_outbound_audio(websocket, stream_sid, twilio_media_prefix, delta, pacer)
+                if stream_started_at is not None:
+                    TIME_TO_FIRST_AUDIO.observe(time.perf_counter() - stream_started_at)
+                    stream_started_at = None
+                if response_start_timestamp_twilio is None:
+                    response_start_timestamp_twilio = latest_media_timestamp
+                    if SHOW_TIMING_MATH:
+                        log("Setting start timestamp for new response", level="debug", timestamp_ms=response_start_timestamp_twilio)
+                if item_id:
+                    last_assistant_item = item_id
+                mark_name = playback.add_audio(delta)
+                if mark_name:
+                    await send_mark(websocket, stream_sid, mark_name)
+            except Exception as e:
+                log("Error sending audio to Twilio", level="error", error=str(e))
+            RELAY_OUTBOUND.observe(time.perf_counter() - openai_received_at)
+            if recording is not None:
+                recording.outbound(latest_media_timestamp, delta)
+
+        async def on_audio_delta_event(response_msg: dict):
+            # Hızlı yolda okunamayan delta mesajları
+            if 'delta' in response_msg:
+                await on_audio_delta(response_msg.get('item_id'), response_msg['delta'])
+
+        async def on_audio_done(response_msg: dict):
+            # Yanıtın sonunu işaretle; oynatmanın ne zaman bittiği bu mark ile anlaşılır
+            mark_name = playback.next_mark()
+            if mark_name:
+                await send_mark(websocket, stream_sid, mark_name)
+            finish_goodbye_audio()
+
+        def finish_goodbye_audio():
+            if goodbye_audio_done is not None and not goodbye_audio_done.done():
+                goodbye_audio_done.set_result(None)
+
+        async def on_speech_started(response_msg: dict):
+            log("Speech started detected", stream_sid=stream_sid)
+            await flush_audio_batch()
+            if last_assistant_item:
+                log("Interrupting response", item_id=last_assistant_item)
+                await handle_speech_started_event(openai_received_at)
+
+        async def on_error(response_msg: dict):
+            nonlocal response_active
+            error_msg = response_msg.get('error', {})
+            log("OpenAI error", level="error", error=error_msg.get('message'))
+
+            # Zaten aktif yanıt varsa, bu hatayı görmezden gel
+            if "Conversation already has an active response" in error_msg.get('message', ''):
+                log("Ignoring duplicate response request")
+                return
+
+            # Buffer hatası varsa, yeni bir yanıt oluşturmayı durdur
+            if "buffer too small" in error_msg.get('message', ''):
+                log("Audio buffer too small, waiting for more audio")
+                response_active = False
+                rearm_silence_timer()
+
+        # Handler'lar kayıt sırasıyla çalışır: önce kullanım/bütçe, sonra kayıt ve log, en son olaya özel işlem
+        openai_events = EventDispatcher('type')
+        openai_events.on_fast('response.audio.delta', ('item_id', 'delta'), on_audio_delta)
+        openai_events.on('response.audio.delta', on_audio_delta_event)
+        openai_events.on('response.done', on_response_done)
+        openai_events.on('response.create.done', on_response_create_done)
+        openai_events.on('conversation.item.created', on_item_created)
+        openai_events.on('conversation.item.deleted', on_item_deleted)
+        openai_events.on(RECORDED_EVENT_TYPES, on_recorded_event)
+        openai_events.on(LOG_EVENT_TYPES, on_logged_event)
+        openai_events.on('response.audio.done', on_audio_done)
+        openai_events.on('input_audio_buffer.speech_started', on_speech_started)
+        openai_events.on('error', on_error)
+        openai_received_at = 0.0
+
+        async def reconnect_realtime() -> bool:
+            """Kopan Realtime bağlantısını yeniden kurar; son konuşma turlarını ve tampondaki arayan sesini aktarır"""
+            nonlocal openai_ws, reconnecting, response_active, last_assistant_item
+            if not (REALTIME_RECONNECT and session and session.is_active and not call_ending):
+                return False
+            reconnecting = True
+            started = time.perf_counter()
+            lost_at_ms = latest_media_timestamp
+            if audio_batcher is not None:
+                # Toplayıcının gönderilmemiş penceresi kopukluk sırasında tamponlanan sesten önce aktarılmalı
+                reconnect_buffer.add_first(audio_batcher.take())
+            log("Realtime connection lost, reconnecting", level="warning", stream_sid=stream_sid)
+            # Eski oturumdaki yanıt ve öğeler yeni oturumda bulunmaz
+            response_active = False
+            last_assistant_item = None
+            session.conversation.reset()
+            try:
+                for attempt in range(1, REALTIME_RECONNECT_ATTEMPTS + 1):
                     if not connection_active:
-                        break
-                        
-                    if not session or not session.is_active:
+                        return False
+                    try:
+                        new_ws = await connect_realtime(language, voice)
+                        if not connection_active:
+                            await new_ws.close()
+                            return False
+                        await openai_ws.close()
+                        openai_ws = new_ws
+                        if session.conversation.summary:
+                            await openai_ws.send(build_conversation_item(
+                                'system', CONVERSATION_SUMMARY_PREFIX + session.conversation.summary))
+                        for role, text in context_turns:
+                            await openai_ws.send(build_conversation_item(role, text))
+                        # Gönderim sırasında gelen frame'ler de tampona eklenir; tampon boşalana kadar sürdürülür
+                        messages = reconnect_buffer.drain(REALTIME_REPLAY_MESSAGE_BYTES)
+                        while messages:
+                            for message in messages:
+                                await openai_ws.send(message)
+                            messages = reconnect_buffer.drain(REALTIME_REPLAY_MESSAGE_BYTES)
+                    except Exception as e:
+                        log("Realtime reconnect attempt failed", level="warning", stream_sid=stream_sid,
+                            attempt=attempt, error=str(e))
+                        if attempt < REALTIME_RECONNECT_ATTEMPTS:
+                            await asyncio.sleep(REALTIME_RECONNECT_BACKOFF * 2 ** (attempt - 1))
                         continue
+                    reconnecting = False
+                    seconds = time.perf_counter() - started
+                    REALTIME_RECONNECT_SECONDS.observe(seconds)
+                    REALTIME_RECONNECT_BUFFERED_BYTES.observe(reconnect_buffer.buffered_bytes)
+                    metrics.counter("realtime_reconnects_total", "Mid-call Realtime reconnect incidents",
+                                    result="resumed").inc()
+                    incident = {"seconds": round(seconds, 4), "attempts": attempt,
+                                "buffered_bytes": reconnect_buffer.buffered_bytes,
+                                "dropped_bytes": reconnect_buffer.dropped_bytes,
+                                "replayed_turns": len(context_turns)}
+                    log("Realtime connection resumed", stream_sid=stream_sid, **incident)
+                    transcript_store.record(call_sid or stream_sid, "realtime.reconnected", media_ms=lost_at_ms, **incident)
+                    return True
+                metrics.counter("realtime_reconnects_total", "Mid-call Realtime reconnect incidents",
+                                result="failed").inc()
+                log("Realtime reconnect failed, ending call", level="error", stream_sid=stream_sid,
+                    seconds=round(time.perf_counter() - started, 4), buffered_bytes=reconnect_buffer.buffered_bytes)
+                transcript_store.record(call_sid or stream_sid, "realtime.reconnect_failed", media_ms=lost_at_ms,
+                                        attempts=REALTIME_RECONNECT_ATTEMPTS)
+                return False
+            finally:
+                reconnecting = False
+                reconnect_buffer.reset()
+                rearm_silence_timer()
 
-                    start_loop = time.perf_counter()
-                    response_msg = json.loads(openai_message)
-                    
-                    if response_msg.get('type') == 'response.content.part':
-                        content = response_msg.get('content', '')
-                        if not session.add_tokens(content):
-                            await end_call(get_language_specific_goodbye_message(language))
-                            continue
-                    
-                    if response_msg.get('type') == 'response.done':
-                        response_active = False
-                    
-                    if response_msg.get('type') == 'response.create.done':
-                        response_active = True
-
-                    if response_msg['type'] in LOG_EVENT_TYPES:
-                        print(f"Received event: {response_msg['type']}", response_msg)
-                    
-                    if response_msg.get('type') == 'response.audio.delta' and 'delta' in response_msg:
-                        try:
-                            audio_payload = base64.b64encode(base64.b64decode(response_msg['delta'])).decode('utf-8')
-                            audio_delta = {
-                                "event": "media",
-                                "streamSid": stream_sid,
-                                "media": {
-                                    "payload": audio_payload
-                                }
-                            }
-                            await websocket.send_json(audio_delta)
-                            if response_start_timestamp_twilio is None:
-                                response_start_timestamp_twilio = latest_media_timestamp
-                                if SHOW_TIMING_MATH:
-                                    print(f"Setting start timestamp for new response: {response_start_timestamp_twilio}ms")
-                            if response_msg.get('item_id'):
-                                last_assistant_item = response_msg['item_id']
-                            await send_mark(websocket, stream_sid)
-                        except Exception as e:
-                            print(f"Error sending audio to Twilio: {e}")
-                        
-                    if response_msg.get('type') == 'input_audio_buffer.speech_started':
-                        print("Speech started detected.")
-                        if last_assistant_item:
-                            print(f"Interrupting response with id: {last_assistant_item}")
-                            await handle_speech_started_event()
-                    
-                    # Hata durumunu kontrol et
-                    if response_msg.get('type') == 'error':
-                        error_msg = response_msg.get('error', {})
-                        print(f"OpenAI error: {error_msg.get('message')}")
-                        
-                        # Zaten aktif yanıt varsa, bu hatayı görmezden gel
-                        if "Conversation already has an active response" in error_msg.get('message', ''):
-                            print("Ignoring duplicate response request.")
-                            continue
-                        
-                        # Buffer hatası varsa, yeni bir yanıt oluşturmayı durdur
-                        if "buffer too small" in error_msg.get('message', ''):
-                            print("Audio buffer too small, waiting for more audio.")
-                            response_active = False
+        async def send_to_twilio():
+            nonlocal connection_active, openai_received_at
+            while True:
+                try:
+                    async for openai_message in openai_ws:
+                        if not connection_active:
+                            break
+
+                        # Bütçe dolduktan sonra yalnızca veda yanıtı aktarılır
+                        if not session or not (session.is_active or call_ending):
                             continue
-                            
-                    elapsed_loop = time.perf_counter() - start_loop
-                    if SHOW_TIMING_MATH:
-                        print(f"[PERF] Processing OpenAI message took {elapsed_loop:.4f} seconds")
-            except Exception as e:
-                print(f"Error in send_to_twilio: {e}")
-                connection_active = False
 
-        tasks = [receive_from_twilio(), send_to_twilio(), check_silence()]
-        await asyncio.gather(*tasks, return_exceptions=True)
+                        openai_received_at = time.perf_counter()
+                        await openai_events.dispatch(openai_message)
+
+                        elapsed_loop = time.perf_counter() - openai_received_at
+                        OPENAI_EVENT_PROCESSING.observe(elapsed_loop)
+                        if SHOW_TIMING_MATH:
+                            log("Processing OpenAI message", level="debug", seconds=elapsed_loop)
+                except Exception as e:
+                    log("Error in send_to_twilio", level="error", error=str(e))
+                # Twilio hâlâ bağlıysa arama kapatılmadan Realtime oturumu yeniden kurulur
+                if not connection_active or not await reconnect_realtime():
+                    break
+            connection_active = False
+
+        # Bacaklardan biri bittiğinde (Twilio kapandı, Realtime koptu ya da hata) diğeri ve
+        # zamanlayıcı görevleri beklenmeden iptal edilir, iki soket de kapatılır
+        teardown_started = None
+        try:
+            finished = await supervisor.run({"receive_from_twilio": receive_from_twilio(),
+                                             "send_to_twilio": send_to_twilio()})
+            teardown_started = time.perf_counter()
+            log("Call leg finished, tearing down", stream_sid=stream_sid, leg=finished)
+        finally:
+            connection_active = False
+            silence_timer.cancel()
+            disconnect_timer.cancel()
+            await supervisor.close()
+            forget_call()
+            try:
+                if pacer is not None:
+                    await pacer.stop()
+            finally:
+                if recording is not None:
+                    recording.close()
+            if teardown_started is not None:
+                CALL_TEARDOWN_SECONDS.observe(time.perf_counter() - teardown_started)
+    finally:
+        ACTIVE_SESSIONS.dec()
+        admission.session_ended()
+        if openai_ws is not None:
+            await openai_ws.close()
+        await close_twilio_websocket(websocket)
+
+async def close_twilio_websocket(websocket: WebSocket):
+    """Twilio websocket'ini henüz kapanmadıysa kapatır"""
+    if WebSocketState.DISCONNECTED in (websocket.application_state, websocket.client_state):
+        return
+    try:
+        await websocket.close()
+    except Exception as e:
+        log("Error closing websocket", level="error", error=str(e))
+
+def build_conversation_item(role: str, text: str, previous_item_id: str = None) -> str:
+    """Metni Realtime konuşmasına eklenecek conversation.item.create mesajına çevirir"""
+    event = {
+        "type": "conversation.item.create",
+        "item": {
+            "type": "message",
+            "role": role,
+            "content": [{"type": "text" if role == 'assistant' else "input_text", "text": text}]
+        }
+    }
+    if previous_item_id:
+        event["previous_item_id"] = previous_item_id  # "root": konuşmanın başına ekler
+    return json_dumps(event)
+
+def get_language_specific_greeting_message(language: str) -> str:
+    """Önceden üretilen karşılama klibinin dile özgü metnini döndürür"""
+    messages = {
+        'tr': "Merhaba, size nasıl yardımcı olabilirim?",
+        'en': "Hello, how can I help you today?",
+        'it': "Buongiorno, come posso aiutarla?",
+        'ru': "Здравствуйте, чем я могу вам помочь?"
+    }
+    return messages.get(language, messages['en'])
+
+def get_language_specific_busy_message(language: str) -> str:
+    """Kapasite dolduğunda okunacak dile özgü mesajı döndürür"""
+    messages = {
+        'tr': "Şu anda tüm hatlarımız dolu. Lütfen birkaç dakika sonra tekrar arayın.",
+        'en': "All of our lines are busy right now. Please call again in a few minutes.",
+        'it': "Al momento tutte le nostre linee sono occupate. La preghiamo di richiamare tra qualche minuto.",
+        'ru': "Сейчас все наши линии заняты. Пожалуйста, перезвоните через несколько минут."
+    }
+    return messages.get(language, messages['en'])
 
 def get_language_specific_goodbye_message(language: str) -> str:
     """Dile özgü veda mesajı döndürür"""
@@ -605,29 +3325,14 @@ def get_language_specific_goodbye_message(language: str) -> str:
     }
     return messages.get(language, messages['en'])
 
-async def initialize_session(openai_ws, language: str, voice: str):  # Add voice parameter
-    messages = get_language_messages(language)
-    session_update = {
-        "type": "session.update",
-        "session": {
-            "turn_detection": {
-                "type": "server_vad",
-                "threshold": 0.1,
-                "silence_duration_ms": 10,
-                "prefix_padding_ms": 11,
-                "create_response": True,
-                "interrupt_response": True
-            },
-            "input_audio_format": "g711_ulaw",
-            "output_audio_format": "g711_ulaw",
-            "voice": voice,  # Use the passed voice parameter
-            "instructions": messages['system_message'],
-            "modalities": ["text", "audio"],
-            "temperature": 0.8,
-        }
-    }
-    print(f'Sending session update with voice {voice}:', json.dumps(session_update))
-    await openai_ws.send(json.dumps(session_update))
+async def initialize_session(openai_ws, language: str, voice: str, profile: str = None):
+    """Önbellekteki hazır session.update mesajını gönderir"""
+    profile = profile or TURN_DETECTION_PROFILE
+    payload = session_payloads.get(language, voice, profile)
+    log("Sending session update", language=language, voice=voice, profile=profile)
+    await openai_ws.send(payload)
+STARTUP_IMPORT_SECONDS.set(time.perf_counter() - IMPORT_STARTED)
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=PORT)
\ No newline at end of file
+    uvicorn.run(create_app(), host="0.0.0.0", port=PORT)
\ No newline at end of file
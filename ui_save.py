@@ -1,10 +1,19 @@
+import csv
+import io
+import time
+
 import streamlit as st
 import requests
+from requests.adapters import HTTPAdapter
 
 # FastAPI sunucunuzun URL'sini buraya girin
 BASE_URL = "http://localhost:8080"
+REQUEST_TIMEOUT = (3.05, 30)  # (bağlantı, okuma) saniye; /make_call Twilio aramasını bekler
+CURRENT_VOICE_TTL = 10  # /current_voice yanıtının önbellekte tutulma süresi (saniye)
+CAMPAIGN_POLL_INTERVAL = 1.0  # Toplu arama ilerlemesinin sorgulanma aralığı (saniye)
+CAMPAIGN_PENDING = ("queued", "waiting_for_capacity", "dialing")
 
-# Ses isimlerini yerelleştirme ve cinsiyet özelliklerine göre atama
+# Ses isimlerini yerelleştirme ve cinsiyet özelliklerine göre atama; yalnızca save.SUPPORTED_VOICES içindeki sesler
 voice_mapping = {
     "Turkish": {
         "alloy": "Mehmet",
@@ -12,9 +21,6 @@ voice_mapping = {
         "ballad": "Ayşe",
         "coral": "Elif",
         "echo": "Ece",
-        "fable": "Fatma",
-        "onyx": "Ahmet",
-        "nova": "Nazan",
         "sage": "Ali",
         "shimmer": "Şirin"
     },
@@ -24,9 +30,6 @@ voice_mapping = {
         "ballad": "Emily",
         "coral": "Sophia",
         "echo": "Alex",
-        "fable": "Fiona",
-        "onyx": "James",
-        "nova": "Nina",
         "sage": "Sam",
         "shimmer": "Samantha"
     },
@@ -36,9 +39,6 @@ voice_mapping = {
         "ballad": "Giulia",
         "coral": "Sofia",
         "echo": "Alex",
-        "fable": "Francesca",
-        "onyx": "Marco",
-        "nova": "Nina",
         "sage": "Sam",
         "shimmer": "Chiara"
     },
@@ -48,62 +48,135 @@ voice_mapping = {
         "ballad": "Anna",
         "coral": "Elena",
         "echo": "Alex",
-        "fable": "Olga",
-        "onyx": "Ivan",
-        "nova": "Natalya",
         "sage": "Sergey",
         "shimmer": "Mariya"
     }
 }
 
+language_codes = {
+    "Turkish": "tr",
+    "English": "en",
+    "Italian": "it",
+    "Russian": "ru"
+}
+
+# Tüm yeniden çalıştırmalarda paylaşılan, bağlantı havuzlu HTTP oturumu
+@st.cache_resource
+def get_http_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+def api_request(method: str, path: str, **kwargs) -> requests.Response:
+    return get_http_session().request(method, f"{BASE_URL}{path}", timeout=REQUEST_TIMEOUT, **kwargs)
+
+@st.cache_data(ttl=CURRENT_VOICE_TTL, show_spinner=False)
+def fetch_current_voice():
+    try:
+        response = api_request("GET", "/current_voice")
+    except requests.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
+    return response.json().get("voice", "alloy")
+
+def parse_numbers_csv(data: bytes, language_code: str, voice: str) -> list:
+    """to_number[,language,voice] sütunlu CSV'yi /campaigns çağrı listesine çevirir; eksik alanlar seçili değerleri alır"""
+    calls = []
+    for row in csv.reader(io.StringIO(data.decode("utf-8-sig"))):
+        if not row or not row[0].strip() or row[0].strip().lower() == "to_number":
+            continue
+        calls.append({
+            "to_number": row[0].strip(),
+            "language": row[1].strip() if len(row) > 1 and row[1].strip() else language_code,
+            "voice": row[2].strip() if len(row) > 2 and row[2].strip() else voice,
+        })
+    return calls
+
+def show_campaign_progress(campaign_id: str):
+    """Kampanya bitene kadar ilerlemeyi sorgular; sayfa etkileşimi yeniden çalıştırmada kaldığı yerden sürer"""
+    progress = st.progress(0.0)
+    summary = st.empty()
+    while True:
+        try:
+            response = api_request("GET", f"/campaigns/{campaign_id}")
+        except requests.RequestException as e:
+            summary.error(f"Failed to fetch campaign progress: {e}")
+            return
+        if response.status_code != 200:
+            summary.error("Campaign not found")
+            st.session_state.pop("campaign_id", None)
+            return
+        counts = response.json()["counts"]
+        total = sum(counts.values())
+        pending = sum(counts.get(status, 0) for status in CAMPAIGN_PENDING)
+        progress.progress((total - pending) / total if total else 1.0)
+        summary.write(", ".join(f"{status}: {count}" for status, count in sorted(counts.items())))
+        if not pending:
+            st.session_state.pop("campaign_id", None)
+            return
+        time.sleep(CAMPAIGN_POLL_INTERVAL)
+
 # Streamlit başlığı
 st.title("Language and Voice Selection")
 
 # Kullanıcıdan telefon numarasını, dili ve sesi isteyin
 to_number = st.text_input("Enter phone number:")
-language = st.selectbox("Select language:", ["Turkish", "English", "Italian", "Russian"])
+language = st.selectbox("Select language:", list(language_codes))
+language_code = language_codes[language]
 
-# Seçilen dil için yerel ses isimlerini al
+# Seçilen dil için yerel ses isimleri; seçim gerçek ses ismini döner
 local_voices = voice_mapping.get(language, {})
-display_voice_names = [local_voices[voice] for voice in local_voices]
-
-# Kullanıcıdan sesi seçmesini isteyin
-selected_display_voice = st.selectbox("Select voice:", display_voice_names)
+voice = st.selectbox("Select voice:", list(local_voices), format_func=local_voices.get)
 
-# Seçilen yerel ses ismini gerçek ses ismine çevir
-voice = list(local_voices.keys())[list(local_voices.values()).index(selected_display_voice)]
-
-# Çağrı başlatma butonu
+# Çağrı başlatma butonu: varsayılan sesi güncelleme ve aramayı başlatma tek istekte yapılır
 if st.button("Start Call"):
-    # Önce sesi güncelle
-    update_response = requests.get(f"{BASE_URL}/voice_select", params={"voice": voice})
-    if update_response.status_code == 200:
-        st.success("Voice updated successfully")
+    try:
+        call_response = api_request("GET", "/make_call", params={
+            "to_number": to_number,
+            "language": language_code,
+            "voice": voice,
+            "set_default_voice": "true"
+        })
+    except requests.RequestException as e:
+        st.error(f"Failed to start call: {e}")
     else:
-        st.error("Failed to update voice")
-
-    # Ardından çağrıyı başlat
-    language_code = {
-        "Turkish": "tr",
-        "English": "en",
-        "Italian": "it",
-        "Russian": "ru"
-    }.get(language, "tr")
-
-    call_response = requests.get(f"{BASE_URL}/make_call", params={
-        "to_number": to_number,
-        "language": language_code,
-        "voice": voice
-    })
-
-    if call_response.status_code == 200:
-        st.success("Call started successfully")
+        fetch_current_voice.clear()
+        if call_response.status_code == 200:
+            st.success("Call started successfully")
+        else:
+            try:
+                detail = call_response.json().get('detail', call_response.status_code)
+            except ValueError:  # Proxy veya sunucu hatası JSON olmayan bir gövde döndürebilir
+                detail = call_response.text or call_response.status_code
+            st.error(f"Failed to start call: {detail}")
+
+# Toplu arama: CSV'deki numaralar kampanya olarak kuyruğa eklenir, ilerleme canlı gösterilir
+st.subheader("Batch Calls")
+numbers_file = st.file_uploader("Upload CSV of numbers (to_number[,language,voice]):", type="csv")
+if numbers_file is not None and st.button("Start Batch"):
+    calls = parse_numbers_csv(numbers_file.getvalue(), language_code, voice)
+    if not calls:
+        st.error("No phone numbers found in the CSV")
     else:
-        st.error("Failed to start call")
+        try:
+            campaign_response = api_request("POST", "/campaigns", json={"calls": calls})
+        except requests.RequestException as e:
+            st.error(f"Failed to start batch: {e}")
+        else:
+            if campaign_response.status_code == 200:
+                st.session_state["campaign_id"] = campaign_response.json()["campaign_id"]
+                st.success(f"Queued {len(calls)} calls")
+            else:
+                st.error("Failed to start batch")
 
 # Mevcut sesi görüntüleme
-current_voice_response = requests.get(f"{BASE_URL}/current_voice")
-if current_voice_response.status_code == 200:
-    current_voice = current_voice_response.json().get("voice", "alloy")
+current_voice = fetch_current_voice()
+if current_voice is not None:
     current_display_voice = local_voices.get(current_voice, current_voice)
-    st.write(f"Current voice: {current_display_voice}")
\ No newline at end of file
+    st.write(f"Current voice: {current_display_voice}")
+
+if "campaign_id" in st.session_state:
+    show_campaign_progress(st.session_state["campaign_id"])